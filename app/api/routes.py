@@ -1,29 +1,51 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from app.openstack import nova, neutron, cinder
+from typing import List, Optional
+import asyncio
+import datetime
+import hmac
+import os
+from app.openstack import nova, cinder, aio, usage, jobs, bulk, networks
 import json
-from app.nlp.intent_parser import OpenHermesIntentParser
-# lightweight alternative
-from app.nlp.rule_based_parser import RuleBasedIntentParser
+import time
+from app.nlp import backends, planner
+from app import metrics, profiler, tracing
+from app.models.audit import audit_log
 from app.models.database import SessionLocal
-from app.models.models import UserInteraction
+from app.models import history as history_store
+from app.models.schemas import UserInteractionRead
 
 router = APIRouter(prefix="/api", tags=["openstack"])
 
-# Initialize the OpenHermes intent parser
-# intent_parser = OpenHermesIntentParser()
-
-# lightweight alternative
-intent_parser = RuleBasedIntentParser()
+# Token for /api/admin endpoints, sent as X-Admin-Token; they are disabled when unset
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
 
 class VMCreateRequest(BaseModel):
     name: str
     flavor: str
+    # Image id, name, OS or tag; the catalog's default image when omitted
+    image: Optional[str] = None
 
 class VolumeCreateRequest(BaseModel):
     name: str
     size: int
 
+class VMBulkCreateRequest(BaseModel):
+    flavor: str
+    # {n} is replaced by 1..count; pass names instead to retry a previous response's failed list
+    name: str = "vm-{n}"
+    count: Optional[int] = None
+    names: Optional[List[str]] = None
+    image: Optional[str] = None
+
+class VolumeBulkCreateRequest(BaseModel):
+    size: int
+    name: str = "volume-{n}"
+    count: Optional[int] = None
+    names: Optional[List[str]] = None
+
 class UserRequest(BaseModel):
     message: str
 
@@ -31,11 +53,14 @@ class ConfirmationRequest(BaseModel):
     operation: str
     confirmed: bool
     parameters: dict
+    # Repeats with the same key return the first request's job; the
+    # Idempotency-Key header works too
+    idempotency_key: Optional[str] = None
 
 @router.post("/vm/create")
-async def create_vm(request: VMCreateRequest):
+async def create_vm(request: VMCreateRequest, http_request: Request = None):
     try:
-        instance = nova.create_vm(request.name, request.flavor)
+        instance = await aio.call("nova", nova.create_vm, request.name, request.flavor, request.image, request=http_request)
         return {
             "status": "creating", 
             "id": instance.id, 
@@ -44,10 +69,18 @@ async def create_vm(request: VMCreateRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/vm/bulk")
+async def bulk_create_vms(request: VMBulkCreateRequest, http_request: Request = None):
+    try:
+        names = bulk.resolve_names(request.name, request.count, request.names)
+        return await aio.call("nova", nova.create_vms, names, request.flavor, request.image, request=http_request)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/vm/resize")
-async def resize_vm(name: str, flavor: str):
+async def resize_vm(name: str, flavor: str, http_request: Request = None):
     try:
-        server = nova.resize_vm(name, flavor)
+        server = await aio.call("nova", nova.resize_vm, name, flavor, request=http_request)
         return {
             "status": "resizing",
             "id": server.id,
@@ -57,25 +90,32 @@ async def resize_vm(name: str, flavor: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.delete("/vm/delete")
-async def delete_vm(name: str):
+async def delete_vm(name: str, http_request: Request = None):
     try:
-        result = nova.delete_vm(name)
+        result = await aio.call("nova", nova.delete_vm, name, request=http_request)
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/network/create")
-async def create_network(name: str):
+async def create_network(name: str, http_request: Request = None):
     try:
-        network = neutron.create_network(name)
+        network = await networks.create_network(name, request=http_request)
         return network
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.delete("/network/delete")
+async def delete_network(name: str, http_request: Request = None):
+    try:
+        return await networks.delete_network(name, request=http_request)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/volume/create")
-async def create_volume(request: VolumeCreateRequest):
+async def create_volume(request: VolumeCreateRequest, http_request: Request = None):
     try:
-        volume = cinder.create_volume(request.name, request.size)
+        volume = await aio.call("cinder", cinder.create_volume, request.name, request.size, request=http_request)
         return {
             "status": "creating",
             "id": volume.id,
@@ -85,103 +125,196 @@ async def create_volume(request: VolumeCreateRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/volume/bulk")
+async def bulk_create_volumes(request: VolumeBulkCreateRequest, http_request: Request = None):
+    try:
+        names = bulk.resolve_names(request.name, request.count, request.names)
+        return await aio.call("cinder", cinder.create_volumes, names, request.size, request=http_request)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.delete("/volume/delete")
-async def delete_volume(name: str):
+async def delete_volume(name: str, http_request: Request = None):
     try:
-        result = cinder.delete_volume(name)
+        result = await aio.call("cinder", cinder.delete_volume, name, request=http_request)
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/usage")
-async def get_usage():
+async def get_usage(http_request: Request = None):
     try:
-        nova_client = nova.get_nova_client()
-        cinder_client = cinder.get_cinder_client()
-        
-        servers = nova_client.servers.list()
-        volumes = cinder_client.volumes.list()
-        
-        total_vcpus = sum(nova_client.flavors.get(s.flavor['id']).vcpus for s in servers)
-        total_ram = sum(nova_client.flavors.get(s.flavor['id']).ram for s in servers)
-        total_volume_gb = sum(v.size for v in volumes)
-        
+        return await usage.get_usage(request=http_request)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the intent parser backend has loaded"""
+    status = backends.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@router.get("/intent/stats")
+async def intent_stats():
+    """Intent cache counters, plus per-tier hit rates and latencies when the parser keeps them"""
+    intent_parser = await backends.get_parser()
+    stats = getattr(intent_parser, "stats", None)
+    return {
+        "parser": backends.INTENT_PARSER,
+        "cache": backends.intent_cache.stats(),
+        **(stats() if stats else {}),
+    }
+
+def _read_page(limit, cursor, filters):
+    db = SessionLocal()
+    try:
+        rows, next_cursor = history_store.history_page(db, limit, cursor, **filters)
         return {
-            "vcpus_used": total_vcpus,
-            "ram_mb_used": total_ram,
-            "volumes_gb": total_volume_gb,
-            "vm_count": len(servers),
-            "volume_count": len(volumes)
+            "items": [UserInteractionRead.from_orm(row).dict() for row in rows],
+            "next_cursor": next_cursor
         }
-    except Exception as e:
+    finally:
+        db.close()
+
+def _stream_ndjson(cursor, filters):
+    # Iterated on Starlette's threadpool, one chunk of rows at a time
+    db = SessionLocal()
+    try:
+        for row in history_store.iter_history(db, cursor, **filters):
+            yield UserInteractionRead.from_orm(row).json() + "\n"
+    finally:
+        db.close()
+
+@router.get("/history")
+async def history(
+    intent: Optional[str] = None,
+    operation: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    format: str = Query("json", regex="^(json|ndjson)$")
+):
+    """Interaction history, newest first. json pages with next_cursor; ndjson streams every match"""
+    filters = {"intent": intent, "operation": operation, "since": since, "until": until}
+    try:
+        if cursor is not None:
+            history_store.decode_cursor(cursor)
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if format == "ndjson":
+        return StreamingResponse(_stream_ndjson(cursor, filters), media_type="application/x-ndjson")
+    return await run_in_threadpool(_read_page, limit, cursor, filters)
+
+def _read_stats(filters):
+    db = SessionLocal()
+    try:
+        return {
+            "intents": history_store.intent_stats(db, **filters),
+            "operations": history_store.operation_counts(db, **filters)
+        }
+    finally:
+        db.close()
+
+@router.get("/stats")
+async def stats(since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None):
+    """Intent counts with latency percentiles, and executed operation counts"""
+    return await run_in_threadpool(_read_stats, {"since": since, "until": until})
+
+def _of_quota(used, quotas, name):
+    """"12 of 20" when the resource has a quota limit, else just the amount used"""
+    limit = quotas.get(name)
+    return used if limit is None or limit < 0 else f"{used} of {limit}"
 
 @router.post("/chat")
 async def chat(request: UserRequest):
     """Main conversation endpoint"""
+    started = time.perf_counter()
     try:
-        # Extract intent and entities using OpenHermes
-        intent_data = intent_parser.extract_intent(request.message)
-        
-        # Parse the JSON response
-        try:
-            intent_dict = json.loads(intent_data)
-        except json.JSONDecodeError:
-            # If the model didn't return valid JSON, try to extract it
-            # This handles cases where the model might add explanatory text
-            import re
-            json_match = re.search(r'\{.*\}', intent_data, re.DOTALL)
-            if json_match:
-                try:
-                    intent_dict = json.loads(json_match.group(0))
-                except:
-                    intent_dict = {"intent": "unknown", "entities": {}}
-            else:
-                intent_dict = {"intent": "unknown", "entities": {}}
-        
-        intent = intent_dict.get("intent")
-        entities = intent_dict.get("entities", {})
+        # Compound requests become one plan, confirmed once and run as a dependency graph
+        with tracing.span("chat.plan"):
+            steps = planner.plan(request.message)
+        if steps:
+            tracing.annotate(intent=jobs.PLAN, **{"plan.steps": len(steps)})
+            metrics.intents.labels(jobs.PLAN).inc()
+            confirmation = (f"I'll run these {len(steps)} steps; independent ones run in parallel:\n"
+                            f"{planner.summarize(steps)}\nWould you like to proceed?")
+            await audit_log.write({
+                "user_message": request.message,
+                "detected_intent": jobs.PLAN,
+                "entities": {"steps": steps},
+                "system_response": confirmation
+            }, started=started)
+            return {
+                "message": confirmation,
+                "requires_confirmation": True,
+                "operation": jobs.PLAN,
+                "parameters": {"steps": steps}
+            }
+
+        # Extract intent and entities with the configured parser backend
+        result = await backends.extract_intent(request.message)
+        intent = result.intent
+        metrics.intents.labels(intent).inc()
+        tracing.annotate(intent=intent, **{"intent.confidence": result.confidence})
         
-        # Log the incoming request
-        db = SessionLocal()
-        interaction = UserInteraction(
-            user_message=request.message,
-            detected_intent=intent,
-            entities=entities,
-            system_response=None
-        )
-        db.add(interaction)
-        db.commit()
+        # Log the request together with the response once it is known
+        interaction = {
+            "user_message": request.message,
+            "detected_intent": intent,
+            "entities": result.entities(),
+            "system_response": None
+        }
         
         # Handle different intents
         if intent == "create_vm":
-            vm_name = entities.get("name")
-            flavor = entities.get("flavor")
+            vm_name = result.name
+            flavor = result.flavor
+            image = result.image
+            from_image = f" from image '{image}'" if image else ""
             
             # Generate confirmation message
-            confirmation = f"I'll create a VM named '{vm_name}' with flavor '{flavor}'. Would you like to proceed?"
+            confirmation = f"I'll create a VM named '{vm_name}' with flavor '{flavor}'{from_image}. Would you like to proceed?"
             
             # Update the response
-            interaction.system_response = confirmation
-            db.commit()
-            db.close()
+            interaction["system_response"] = confirmation
+            await audit_log.write(interaction, started=started)
             
             return {
                 "message": confirmation,
                 "requires_confirmation": True,
                 "operation": "create_vm",
-                "parameters": {"name": vm_name, "flavor": flavor}
+                "parameters": {"name": vm_name, "flavor": flavor, "image": image}
+            }
+        
+        elif intent == "bulk_create_vm":
+            pattern = result.name
+            flavor = result.flavor
+            count = result.count
+            image = result.image
+            names = bulk.resolve_names(pattern, count)
+            from_image = f" from image '{image}'" if image else ""
+            
+            confirmation = f"I'll create {count} VMs named '{names[0]}' to '{names[-1]}' with flavor '{flavor}'{from_image}. Would you like to proceed?"
+            
+            interaction["system_response"] = confirmation
+            await audit_log.write(interaction, started=started)
+            
+            return {
+                "message": confirmation,
+                "requires_confirmation": True,
+                "operation": "bulk_create_vm",
+                "parameters": {"name": pattern, "flavor": flavor, "count": count, "image": image}
             }
         
         elif intent == "resize_vm":
-            vm_name = entities.get("name")
-            flavor = entities.get("flavor")
+            vm_name = result.name
+            flavor = result.flavor
             
             confirmation = f"I'll resize VM '{vm_name}' to flavor '{flavor}'. Would you like to proceed?"
             
-            interaction.system_response = confirmation
-            db.commit()
-            db.close()
+            interaction["system_response"] = confirmation
+            await audit_log.write(interaction, started=started)
             
             return {
                 "message": confirmation,
@@ -191,13 +324,12 @@ async def chat(request: UserRequest):
             }
         
         elif intent == "delete_vm":
-            vm_name = entities.get("name")
+            vm_name = result.name
             
             confirmation = f"I'll delete VM '{vm_name}'. This action cannot be undone. Would you like to proceed?"
             
-            interaction.system_response = confirmation
-            db.commit()
-            db.close()
+            interaction["system_response"] = confirmation
+            await audit_log.write(interaction, started=started)
             
             return {
                 "message": confirmation,
@@ -207,13 +339,12 @@ async def chat(request: UserRequest):
             }
         
         elif intent == "create_network":
-            network_name = entities.get("name")
+            network_name = result.name
             
             confirmation = f"I'll create a private network named '{network_name}'. Would you like to proceed?"
             
-            interaction.system_response = confirmation
-            db.commit()
-            db.close()
+            interaction["system_response"] = confirmation
+            await audit_log.write(interaction, started=started)
             
             return {
                 "message": confirmation,
@@ -223,14 +354,13 @@ async def chat(request: UserRequest):
             }
         
         elif intent == "create_volume":
-            volume_name = entities.get("name")
-            size = entities.get("size")
+            volume_name = result.name
+            size = result.size
             
             confirmation = f"I'll create a {size} GB volume named '{volume_name}'. Would you like to proceed?"
             
-            interaction.system_response = confirmation
-            db.commit()
-            db.close()
+            interaction["system_response"] = confirmation
+            await audit_log.write(interaction, started=started)
             
             return {
                 "message": confirmation,
@@ -239,14 +369,31 @@ async def chat(request: UserRequest):
                 "parameters": {"name": volume_name, "size": size}
             }
         
+        elif intent == "bulk_create_volume":
+            pattern = result.name
+            size = result.size
+            count = result.count
+            names = bulk.resolve_names(pattern, count)
+            
+            confirmation = f"I'll create {count} {size} GB volumes named '{names[0]}' to '{names[-1]}'. Would you like to proceed?"
+            
+            interaction["system_response"] = confirmation
+            await audit_log.write(interaction, started=started)
+            
+            return {
+                "message": confirmation,
+                "requires_confirmation": True,
+                "operation": "bulk_create_volume",
+                "parameters": {"name": pattern, "size": size, "count": count}
+            }
+        
         elif intent == "delete_volume":
-            volume_name = entities.get("name")
+            volume_name = result.name
             
             confirmation = f"I'll delete volume '{volume_name}'. This action cannot be undone. Would you like to proceed?"
             
-            interaction.system_response = confirmation
-            db.commit()
-            db.close()
+            interaction["system_response"] = confirmation
+            await audit_log.write(interaction, started=started)
             
             return {
                 "message": confirmation,
@@ -257,15 +404,24 @@ async def chat(request: UserRequest):
         
         elif intent == "get_usage":
             # No confirmation needed for read-only operations
-            usage = await get_usage()
+            usage_summary = await get_usage()
             
-            response = f"Current project usage:\n- vCPUs: {usage['vcpus_used']}\n- RAM: {usage['ram_mb_used']} MB\n- Storage: {usage['volumes_gb']} GB\n- VMs: {usage['vm_count']}\n- Volumes: {usage['volume_count']}"
+            quotas = usage_summary["quotas"]
+            response = (
+                f"Current project usage:\n- vCPUs: {_of_quota(usage_summary['vcpus_used'], quotas, 'vcpus')}"
+                f"\n- RAM: {_of_quota(usage_summary['ram_mb_used'], quotas, 'ram_mb')} MB"
+                f"\n- Storage: {_of_quota(usage_summary['volumes_gb'], quotas, 'volumes_gb')} GB"
+                f"\n- VMs: {_of_quota(usage_summary['vm_count'], quotas, 'vms')}"
+                f"\n- Volumes: {_of_quota(usage_summary['volume_count'], quotas, 'volumes')}"
+                f"\n- Networks: {_of_quota(usage_summary['network_count'], quotas, 'networks')}"
+                f"\n- Ports: {_of_quota(usage_summary['port_count'], quotas, 'ports')}"
+                f"\n- Floating IPs: {_of_quota(usage_summary['floating_ip_count'], quotas, 'floating_ips')}"
+            )
             
-            interaction.system_response = response
-            interaction.operation_executed = "get_usage"
-            interaction.operation_result = usage
-            db.commit()
-            db.close()
+            interaction["system_response"] = response
+            interaction["operation_executed"] = "get_usage"
+            interaction["operation_result"] = usage_summary
+            await audit_log.write(interaction, started=started)
             
             return {
                 "message": response,
@@ -275,9 +431,8 @@ async def chat(request: UserRequest):
         else:
             response = "I'm sorry, I couldn't understand that request. Please try again with a different phrasing."
             
-            interaction.system_response = response
-            db.commit()
-            db.close()
+            interaction["system_response"] = response
+            await audit_log.write(interaction, started=started)
             
             return {
                 "message": response,
@@ -288,71 +443,112 @@ async def chat(request: UserRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/confirm")
-async def confirm_operation(request: ConfirmationRequest):
+async def confirm_operation(request: ConfirmationRequest, http_request: Request = None):
     """Handle user confirmation for operations"""
+    started = time.perf_counter()
     try:
-        db = SessionLocal()
-        
         if not request.confirmed:
             response = {"status": "cancelled", "message": "Operation cancelled by user"}
             
             # Log the cancellation
-            interaction = UserInteraction(
-                user_message="User cancelled operation",
-                detected_intent=request.operation,
-                entities=request.parameters,
-                system_response="Operation cancelled",
-                operation_executed=None,
-                operation_result=None
-            )
-            db.add(interaction)
-            db.commit()
-            db.close()
+            await audit_log.write({
+                "user_message": "User cancelled operation",
+                "detected_intent": request.operation,
+                "entities": request.parameters,
+                "system_response": "Operation cancelled",
+                "operation_executed": None,
+                "operation_result": None
+            }, started=started)
             
             return response
         
-        # Execute the confirmed operation based on the operation type
-        if request.operation == "create_vm":
-            result = await create_vm(VMCreateRequest(name=request.parameters.get("name"), flavor=request.parameters.get("flavor")))
-            response = {"status": "success", "message": f"VM {request.parameters.get('name')} is being created", "details": result}
-        
-        elif request.operation == "resize_vm":
-            result = await resize_vm(request.parameters.get("name"), request.parameters.get("flavor"))
-            response = {"status": "success", "message": f"VM {request.parameters.get('name')} is being resized to {request.parameters.get('flavor')}", "details": result}
-        
-        elif request.operation == "delete_vm":
-            result = await delete_vm(request.parameters.get("name"))
-            response = {"status": "success", "message": f"VM {request.parameters.get('name')} has been deleted", "details": result}
-        
-        elif request.operation == "create_network":
-            result = await create_network(request.parameters.get("name"))
-            response = {"status": "success", "message": f"Network {request.parameters.get('name')} has been created", "details": result}
-        
-        elif request.operation == "create_volume":
-            result = await create_volume(VolumeCreateRequest(name=request.parameters.get("name"), size=request.parameters.get("size")))
-            response = {"status": "success", "message": f"Volume {request.parameters.get('name')} is being created", "details": result}
-        
-        elif request.operation == "delete_volume":
-            result = await delete_volume(request.parameters.get("name"))
-            response = {"status": "success", "message": f"Volume {request.parameters.get('name')} has been deleted", "details": result}
-        
+        # Start the confirmed operation as a background job; clients follow it
+        # through /api/jobs/{id} or its event stream
+        if request.operation in jobs.OPERATIONS or request.operation == jobs.PLAN:
+            key = request.idempotency_key or (http_request.headers.get("Idempotency-Key") if http_request else None)
+            job = await run_in_threadpool(jobs.runner.submit, request.operation, request.parameters, key)
+            response = {"status": "accepted", "job_id": job["id"], "message": job["message"], "details": job}
+            tracing.annotate(operation=request.operation,
+                             **{"job.id": job["id"], "job.duplicate": bool(job.get("duplicate"))})
+            if job.get("duplicate"):
+                response["duplicate"] = True
         else:
             response = {"status": "error", "message": f"Unknown operation: {request.operation}"}
         
-        # Log the execution
-        interaction = UserInteraction(
-            user_message="User confirmed operation",
-            detected_intent=request.operation,
-            entities=request.parameters,
-            system_response=response["message"],
-            operation_executed=request.operation,
-            operation_result=response
-        )
-        db.add(interaction)
-        db.commit()
-        db.close()
+        # Log the execution; repeats are logged but not counted as executed
+        await audit_log.write({
+            "user_message": "User confirmed operation",
+            "detected_intent": request.operation,
+            "entities": request.parameters,
+            "system_response": response["message"],
+            "operation_executed": None if response.get("duplicate") else request.operation,
+            "operation_result": response
+        }, started=started)
         
         return response
         
+    except jobs.IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Current state of a background job started by /api/confirm"""
+    job = await run_in_threadpool(jobs.runner.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, interval: float = Query(1.0, gt=0, le=30)):
+    """Server-sent events with the job's state each time it changes, ending once it finishes"""
+    job = await run_in_threadpool(jobs.runner.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+
+    async def events(job):
+        last = None
+        while True:
+            if job["updated_at"] != last:
+                last = job["updated_at"]
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+            if job["status"] in jobs.TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(interval)
+            job = await run_in_threadpool(jobs.runner.get, job_id)
+
+    return StreamingResponse(events(job), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def _check_admin(http_request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not hmac.compare_digest(http_request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@router.post("/admin/profile", status_code=202)
+async def start_profile(
+    http_request: Request,
+    requests: int = Query(100, ge=1, le=100000),
+    interval: float = Query(profiler.PROFILE_INTERVAL, ge=0.001, le=1),
+    max_seconds: float = Query(profiler.PROFILE_MAX_SECONDS, gt=0, le=3600),
+    idle: bool = False
+):
+    """Sample this worker's stacks until the next `requests` requests have finished"""
+    _check_admin(http_request)
+    try:
+        profiler.sampler.start(requests, interval, max_seconds, idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiler.sampler.status()
+
+@router.get("/admin/profile")
+async def get_profile(http_request: Request):
+    """The last profile in collapsed stack format once it has finished; its progress until then"""
+    _check_admin(http_request)
+    status = profiler.sampler.status()
+    if status["started"] is None:
+        raise HTTPException(status_code=404, detail="No profile has been started")
+    if status["running"]:
+        return JSONResponse(status, status_code=202)
+    return PlainTextResponse(profiler.sampler.collapsed(), headers={"X-Profile-Samples": str(status["samples"])})
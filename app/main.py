@@ -1,8 +1,19 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
+import logging
 import os
+import init_db
 from app.api.routes import router
+from app import metrics, tracing
+from app.openstack import aio, jobs, glance
+from app.nlp import backends
+from app.models.audit import audit_log
+from app.models.retention import retention
+
+# uvicorn configures only its own loggers; this shows the app's module loggers too
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 app = FastAPI(
     title="Cloud Operations Agent",
@@ -15,9 +26,46 @@ app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__
 
 app.include_router(router)
 
+# Per-route latency and in-flight requests, scraped from /metrics
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# Request ids, sampled traces and request counting for the on-demand profiler
+app.add_middleware(tracing.TracingMiddleware)
+
+@app.on_event("startup")
+async def startup():
+    # Databases from an older version get the tables, columns and indexes
+    # added since (provisioning_jobs, latency_ms) before anything writes to them
+    init_db.upgrade()
+    # Fail jobs orphaned by a crashed worker, and keep this worker's jobs from looking orphaned
+    jobs.runner.start()
+    # Warm up the intent parser in the background; /api/ready reports progress
+    backends.load()
+    # Archive and prune old interaction log days in the background
+    retention.start()
+    # Load the image catalog before the first VM is created
+    glance.image_catalog.refresh_in_background()
+
+@app.on_event("shutdown")
+async def shutdown():
+    aio.shutdown(wait=False)
+    # Stop polling; unfinished and never-started jobs are marked failed
+    jobs.runner.shutdown()
+    retention.stop()
+    # Write out queued interaction records before the process exits
+    audit_log.close()
+    if tracing.exporter is not None:
+        tracing.exporter.close(timeout=10)
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Cloud Operations Agent"}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Metrics in Prometheus text format; each uvicorn worker reports its own"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
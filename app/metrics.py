@@ -0,0 +1,290 @@
+"""Counters, gauges and latency histograms exposed at /metrics in Prometheus text format.
+
+Each series keeps one cell per thread that updates it, so recording a
+value never takes a lock: the thread adds to its own cell, and a scrape
+sums the cells. Only the first update of a series from a new thread, and
+the first use of a label combination, lock to register the cell. When a
+thread exits its cells are folded into the series' base totals, so
+short-lived pools do not grow the registry.
+"""
+import bisect
+import contextlib
+import functools
+import inspect
+import os
+import threading
+import time
+import weakref
+from app import tracing
+
+# Off turns instrument() and the middleware into no-ops
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+
+# Latency buckets in seconds, from cache hits to slow provisioning calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REGISTRY = []
+
+
+class _Owner:
+    """Held only by a thread's local storage, so it is freed when the thread exits"""
+
+
+class _Cells:
+    """Per-thread lists of size floats that, with the totals of exited threads, sum to the series' values"""
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cells = {}
+        self._base = [0.0] * size
+
+    def mine(self):
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            cell = self._local.cell = [0.0] * self._size
+            owner = self._local.owner = _Owner()
+            with self._lock:
+                self._cells[id(cell)] = cell
+            weakref.finalize(owner, self._retire, cell).atexit = False
+        return cell
+
+    def _retire(self, cell):
+        with self._lock:
+            del self._cells[id(cell)]
+            for i, value in enumerate(cell):
+                self._base[i] += value
+
+    def totals(self):
+        with self._lock:
+            cells = list(self._cells.values())
+            totals = list(self._base)
+        for cell in cells:
+            for i, value in enumerate(cell):
+                totals[i] += value
+        return totals
+
+
+class _CounterChild:
+    def __init__(self):
+        self._cells = _Cells(1)
+
+    def inc(self, amount=1):
+        self._cells.mine()[0] += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self._cells.totals()[0])]
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount=1):
+        self._cells.mine()[0] -= amount
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # One count per bucket, one for +Inf, then the sum
+        self._cells = _Cells(len(buckets) + 2)
+
+    def observe(self, value):
+        cell = self._cells.mine()
+        cell[bisect.bisect_left(self._buckets, value)] += 1
+        cell[-1] += value
+
+    @contextlib.contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name, labels):
+        totals = self._cells.totals()
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self._buckets + (float("inf"),), totals):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            samples.append((f"{name}_bucket", labels + (("le", le),), cumulative))
+        samples.append((f"{name}_sum", labels, totals[-1]))
+        samples.append((f"{name}_count", labels, cumulative))
+        return samples
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Return the series for these label values, creating it on first use"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            for name, labels, value in child.samples(self.name, tuple(zip(self.labelnames, values))):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _GaugeChild()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(registry=REGISTRY):
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status"))
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests being handled")
+openstack_call_seconds = Histogram(
+    "openstack_call_duration_seconds", "Latency of app.openstack functions", ("service", "call", "outcome"))
+openstack_in_flight = Gauge("openstack_calls_in_flight", "app.openstack functions running", ("service",))
+intents = Counter("intents_total", "Chat messages by detected intent", ("intent",))
+intent_parse_seconds = Histogram(
+    "intent_parse_duration_seconds", "Time to extract an intent, by backend and cache result", ("parser", "cache"))
+intent_tier_seconds = Histogram(
+    "intent_tier_duration_seconds", "Cascade parser time by the tier that resolved the message", ("tier",))
+db_write_seconds = Histogram("db_write_duration_seconds", "Time to write and commit a transaction", ("writer",))
+db_records = Counter("db_records_total", "Records written, by writer and outcome", ("writer", "outcome"))
+
+
+def _timed_call(fn, service, name):
+    """Wrap fn so each call records its latency, counts as in flight while it runs and is traced as a span"""
+    in_flight = openstack_in_flight.labels(service)
+    succeeded = openstack_call_seconds.labels(service, name, "ok")
+    failed = openstack_call_seconds.labels(service, name, "error")
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = failed
+            in_flight.inc()
+            try:
+                with tracing.span(f"{service}.{name}"):
+                    result = await fn(*args, **kwargs)
+                outcome = succeeded
+                return result
+            finally:
+                in_flight.dec()
+                outcome.observe(time.perf_counter() - start)
+        return timed
+
+    @functools.wraps(fn)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = failed
+        in_flight.inc()
+        try:
+            with tracing.span(f"{service}.{name}"):
+                result = fn(*args, **kwargs)
+            outcome = succeeded
+            return result
+        finally:
+            in_flight.dec()
+            outcome.observe(time.perf_counter() - start)
+    return timed
+
+
+def instrument(namespace, service):
+    """Time every public function defined in a module; call as instrument(globals(), service) at its end"""
+    if not METRICS_ENABLED:
+        return
+    module = namespace["__name__"]
+    for name, fn in list(namespace.items()):
+        # Generators return before doing any work, so timing them would mislead
+        if (not name.startswith("_") and inspect.isfunction(fn) and fn.__module__ == module
+                and not inspect.isgeneratorfunction(fn)):
+            namespace[name] = _timed_call(fn, service, name)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and in-flight count per route template.
+
+    Routes are labelled by their template (/api/jobs/{job_id}), so label
+    cardinality stays bounded however many ids are requested.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_and_record_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.labels().inc()
+        try:
+            await self.app(scope, receive, send_and_record_status)
+        finally:
+            http_in_flight.labels().dec()
+            route = tracing.route_template(scope, self._route_paths)
+            http_request_seconds.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
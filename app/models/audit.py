@@ -0,0 +1,131 @@
+import asyncio
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+from .database import SessionLocal
+from .models import UserInteraction
+from app import metrics
+
+# Records waiting to be written; writers wait for space once this many are queued
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', '10000'))
+
+# Most records written per transaction
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '500'))
+
+# A batch that fails to commit is tried once more after this many seconds, then dropped
+AUDIT_RETRY_SECONDS = float(os.getenv('AUDIT_RETRY_SECONDS', '1'))
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLog:
+    """Write UserInteraction records from a background thread in batched transactions.
+
+    write() only queues the record, so request latency no longer includes a
+    SQLite commit. The writer thread starts on first use, takes everything
+    queued (up to batch_size) per transaction, and drains the queue on close().
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_queue=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 retry_seconds=AUDIT_RETRY_SECONDS):
+        self._session_factory = session_factory
+        self._batch_size = batch_size
+        self._retry_seconds = retry_seconds
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._worker = None
+        self.written = 0
+        self.failed = 0
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="audit-log", daemon=True)
+                self._worker.start()
+
+    async def write(self, record, started=None):
+        """Queue record (UserInteraction column values); waits off the event loop while the queue is full.
+
+        started is the time.perf_counter() at which the request began; the
+        elapsed time is stored as the record's latency_ms.
+        """
+        record.setdefault("timestamp", datetime.datetime.utcnow())
+        if started is not None:
+            record["latency_ms"] = (time.perf_counter() - started) * 1000
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            await asyncio.get_running_loop().run_in_executor(None, self._queue.put, record)
+
+    def _take_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, records):
+        start = time.perf_counter()
+        db = self._session_factory()
+        try:
+            db.bulk_insert_mappings(UserInteraction, records)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+            metrics.db_write_seconds.labels("audit").observe(time.perf_counter() - start)
+
+    def _flush(self, records):
+        """Write records, trying once more after a failure (a locked database, a restarting server)"""
+        try:
+            self._commit(records)
+        except Exception as e:
+            logger.warning("Audit log: writing %d records failed, retrying in %ss: %s",
+                           len(records), self._retry_seconds, e)
+            time.sleep(self._retry_seconds)
+            try:
+                self._commit(records)
+            except Exception as e:
+                self.failed += len(records)
+                metrics.db_records.labels("audit", "dropped").inc(len(records))
+                logger.error("Audit log: dropped %d records: %s", len(records), e)
+                return
+        self.written += len(records)
+        metrics.db_records.labels("audit", "written").inc(len(records))
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            records = [r for r in batch if r is not _STOP]
+            if records:
+                self._flush(records)
+            for _ in batch:
+                self._queue.task_done()
+            if len(records) < len(batch):
+                return
+
+    def flush(self):
+        """Block until every queued record has been written"""
+        self._queue.join()
+
+    def close(self, timeout=None):
+        """Write everything still queued and stop the writer thread"""
+        with self._lock:
+            worker = self._worker
+        if worker is None or not worker.is_alive():
+            return
+        self._queue.put(_STOP)
+        worker.join(timeout)
+
+
+audit_log = AuditLog()
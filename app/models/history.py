@@ -0,0 +1,116 @@
+import base64
+import datetime
+from sqlalchemy import and_, case, func, or_, select
+from .models import UserInteraction
+
+# Percentiles reported by intent_stats()
+PERCENTILES = (50, 95, 99)
+
+# Rows fetched from the database cursor at a time while streaming
+STREAM_CHUNK_SIZE = 1000
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past row in (timestamp, id) descending order"""
+    raw = f"{row.timestamp.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+
+def _filters(intent=None, operation=None, since=None, until=None):
+    conditions = []
+    if intent is not None:
+        conditions.append(UserInteraction.detected_intent == intent)
+    if operation is not None:
+        conditions.append(UserInteraction.operation_executed == operation)
+    if since is not None:
+        conditions.append(UserInteraction.timestamp >= since)
+    if until is not None:
+        conditions.append(UserInteraction.timestamp < until)
+    return conditions
+
+
+def history_query(db, cursor=None, **filters):
+    """Interactions matching filters, newest first, starting after cursor.
+
+    Keyset pagination on (timestamp, id) keeps every page an index range
+    scan, however deep into the history it is.
+    """
+    conditions = _filters(**filters)
+    if cursor is not None:
+        timestamp, row_id = decode_cursor(cursor)
+        conditions.append(or_(
+            UserInteraction.timestamp < timestamp,
+            and_(UserInteraction.timestamp == timestamp, UserInteraction.id < row_id),
+        ))
+    return db.query(UserInteraction).filter(*conditions).order_by(
+        UserInteraction.timestamp.desc(), UserInteraction.id.desc()
+    )
+
+
+def history_page(db, limit, cursor=None, **filters):
+    """Return (rows, next_cursor); next_cursor is None on the last page"""
+    rows = history_query(db, cursor, **filters).limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
+
+
+def iter_history(db, cursor=None, **filters):
+    """Yield matching interactions while holding only one chunk of rows in memory"""
+    query = history_query(db, cursor, **filters).execution_options(stream_results=True)
+    yield from query.yield_per(STREAM_CHUNK_SIZE)
+
+
+def intent_stats(db, **filters):
+    """Per-intent counts and nearest-rank latency percentiles, aggregated in SQL"""
+    conditions = _filters(**filters)
+    counts = db.execute(
+        select(UserInteraction.detected_intent, func.count(UserInteraction.id))
+        .where(*conditions)
+        .group_by(UserInteraction.detected_intent)
+    ).all()
+
+    # Rank each interaction's latency within its intent; the p-th percentile is
+    # the smallest latency whose rank reaches p% of the intent's count
+    ranked = select(
+        UserInteraction.detected_intent.label("intent"),
+        UserInteraction.latency_ms.label("latency_ms"),
+        func.row_number().over(
+            partition_by=UserInteraction.detected_intent, order_by=UserInteraction.latency_ms
+        ).label("rank"),
+        func.count().over(partition_by=UserInteraction.detected_intent).label("n"),
+    ).where(UserInteraction.latency_ms.isnot(None), *conditions).subquery()
+    percentiles = db.execute(
+        select(ranked.c.intent, *(
+            func.min(case((ranked.c.rank * 100 >= p * ranked.c.n, ranked.c.latency_ms))).label(f"p{p}_ms")
+            for p in PERCENTILES
+        )).group_by(ranked.c.intent)
+    ).all()
+    latency = {row[0]: row[1:] for row in percentiles}
+
+    return [
+        {
+            "intent": intent,
+            "count": count,
+            **{f"p{p}_ms": value for p, value in zip(PERCENTILES, latency.get(intent, (None,) * len(PERCENTILES)))},
+        }
+        for intent, count in sorted(counts, key=lambda row: -row[1])
+    ]
+
+
+def operation_counts(db, **filters):
+    """Number of executed operations by type"""
+    rows = db.execute(
+        select(UserInteraction.operation_executed, func.count(UserInteraction.id))
+        .where(UserInteraction.operation_executed.isnot(None), *_filters(**filters))
+        .group_by(UserInteraction.operation_executed)
+    ).all()
+    return {operation: count for operation, count in rows}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime
+from sqlalchemy import Column, Integer, Float, String, JSON, DateTime, Index
 from .database import Base
 import datetime
 
@@ -13,3 +13,34 @@ class UserInteraction(Base):
     system_response = Column(String)
     operation_executed = Column(String, nullable=True)
     operation_result = Column(JSON, nullable=True)
+    latency_ms = Column(Float, nullable=True)
+
+    # History and analytics filter by time, usually together with intent or operation
+    __table_args__ = (
+        Index("ix_user_interactions_timestamp", "timestamp"),
+        Index("ix_user_interactions_intent_timestamp", "detected_intent", "timestamp"),
+        Index("ix_user_interactions_operation_timestamp", "operation_executed", "timestamp"),
+    )
+
+
+class ProvisioningJob(Base):
+    """A confirmed operation run in the background, polled until its resource settles"""
+    __tablename__ = "provisioning_jobs"
+
+    id = Column(String, primary_key=True)
+    operation = Column(String)
+    parameters = Column(JSON)
+    status = Column(String, default="queued")
+    resource_id = Column(String, nullable=True)
+    resource_status = Column(String, nullable=True)
+    message = Column(String, nullable=True)
+    result = Column(JSON, nullable=True)
+    idempotency_key = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # One job per key: concurrent confirmations with the same key, from any
+    # worker, collide here and share the job that won
+    __table_args__ = (
+        Index("ix_provisioning_jobs_idempotency_key", "idempotency_key", unique=True),
+    )
@@ -0,0 +1,166 @@
+import datetime
+import gzip
+import logging
+import os
+import threading
+from .database import SessionLocal
+from .models import UserInteraction
+from .schemas import UserInteractionRead
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows: passes run without the lock, which is only safe with a single worker
+    fcntl = None
+
+# Days of interactions kept in the database; older days are archived
+RETENTION_HOT_DAYS = int(os.getenv('RETENTION_HOT_DAYS', '30'))
+
+# Where archived days are written as gzipped NDJSON, one file per day
+RETENTION_ARCHIVE_DIR = os.getenv('RETENTION_ARCHIVE_DIR', './archive')
+
+# Archives are pruned once older than this many days or beyond this total size
+RETENTION_ARCHIVE_DAYS = int(os.getenv('RETENTION_ARCHIVE_DAYS', '365'))
+RETENTION_ARCHIVE_MAX_BYTES = int(os.getenv('RETENTION_ARCHIVE_MAX_BYTES', str(10 * 1024 ** 3)))
+
+# Seconds between retention passes
+RETENTION_INTERVAL = float(os.getenv('RETENTION_INTERVAL', '3600'))
+
+# Rows deleted per transaction, so writers never wait long for the lock
+DELETE_CHUNK_SIZE = 1000
+STREAM_CHUNK_SIZE = 1000
+
+ARCHIVE_PREFIX = "user_interactions-"
+
+logger = logging.getLogger(__name__)
+
+
+class Retention:
+    """Move whole days of old interactions out of the database into compressed archives.
+
+    Each pass archives every day older than hot_days to
+    user_interactions-YYYY-MM-DD-<first id>-<last id>.jsonl.gz, deletes those
+    rows in short transactions and prunes archives by age and total size. An
+    flock on the archive directory makes only one worker run a pass at a time;
+    where fcntl is unavailable (Windows) there is no lock, so run one worker.
+    """
+
+    def __init__(self, session_factory=SessionLocal, archive_dir=RETENTION_ARCHIVE_DIR,
+                 hot_days=RETENTION_HOT_DAYS, archive_days=RETENTION_ARCHIVE_DAYS,
+                 archive_max_bytes=RETENTION_ARCHIVE_MAX_BYTES, interval=RETENTION_INTERVAL):
+        self._session_factory = session_factory
+        self.archive_dir = archive_dir
+        self.hot_days = hot_days
+        self.archive_days = archive_days
+        self.archive_max_bytes = archive_max_bytes
+        self.interval = interval
+        self._stop = threading.Event()
+        self._worker = None
+
+    def start(self):
+        """Run a pass every interval seconds on a background thread"""
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="retention", daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("Retention pass failed: %s", e)
+
+    def run_once(self, now=None):
+        """Archive old days and prune archives; returns rows archived, or None if another worker holds the lock"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        with open(os.path.join(self.archive_dir, ".lock"), "w") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+            now = now or datetime.datetime.utcnow()
+            cutoff = datetime.datetime.combine(now.date(), datetime.time()) - datetime.timedelta(days=self.hot_days)
+            archived = self._archive_before(cutoff)
+            self._prune_archives(now)
+            return archived
+
+    def _archive_before(self, cutoff):
+        db = self._session_factory()
+        try:
+            # NULL timestamps sort first but belong to no day
+            oldest = (db.query(UserInteraction.timestamp).filter(UserInteraction.timestamp.isnot(None))
+                      .order_by(UserInteraction.timestamp).first())
+            if oldest is None:
+                return 0
+            archived = 0
+            day = oldest[0].date()
+            while datetime.datetime.combine(day, datetime.time()) < cutoff:
+                archived += self._archive_day(db, day)
+                day += datetime.timedelta(days=1)
+            return archived
+        finally:
+            db.close()
+
+    def _archive_day(self, db, day):
+        start = datetime.datetime.combine(day, datetime.time())
+        end = start + datetime.timedelta(days=1)
+        query = db.query(UserInteraction).filter(
+            UserInteraction.timestamp >= start, UserInteraction.timestamp < end
+        ).order_by(UserInteraction.id).execution_options(stream_results=True)
+
+        ids = []
+        tmp_path = os.path.join(self.archive_dir, f".{day.isoformat()}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as out:
+            for row in query.yield_per(STREAM_CHUNK_SIZE):
+                out.write(UserInteractionRead.from_orm(row).json() + "\n")
+                ids.append(row.id)
+        db.rollback()
+        if not ids:
+            os.remove(tmp_path)
+            return 0
+
+        # Publish the archive before deleting; a crash in between re-archives
+        # the remaining rows on the next pass rather than losing them
+        path = os.path.join(self.archive_dir, f"{ARCHIVE_PREFIX}{day.isoformat()}-{ids[0]}-{ids[-1]}.jsonl.gz")
+        os.replace(tmp_path, path)
+        for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+            db.query(UserInteraction).filter(
+                UserInteraction.id.in_(ids[i:i + DELETE_CHUNK_SIZE])
+            ).delete(synchronize_session=False)
+            db.commit()
+        return len(ids)
+
+    def _prune_archives(self, now):
+        """Delete archives older than archive_days, then the oldest ones beyond archive_max_bytes"""
+        archives = sorted(
+            name for name in os.listdir(self.archive_dir)
+            if name.startswith(ARCHIVE_PREFIX) and name.endswith(".jsonl.gz")
+        )
+        oldest_kept = (now - datetime.timedelta(days=self.archive_days)).date().isoformat()
+        sizes = {}
+        for name in archives:
+            path = os.path.join(self.archive_dir, name)
+            if name[len(ARCHIVE_PREFIX):len(ARCHIVE_PREFIX) + 10] < oldest_kept:
+                os.remove(path)
+            else:
+                sizes[name] = os.path.getsize(path)
+        total = sum(sizes.values())
+        for name in sorted(sizes):
+            if total <= self.archive_max_bytes:
+                break
+            os.remove(os.path.join(self.archive_dir, name))
+            total -= sizes[name]
+
+
+def read_archive(path):
+    """Yield the interactions stored in an archive file as dicts"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield UserInteractionRead.parse_raw(line).dict()
+
+
+retention = Retention()
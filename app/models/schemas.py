@@ -13,3 +13,10 @@ class UserInteractionBase(BaseModel):
 
     class Config:
         orm_mode = True
+
+class UserInteractionRead(UserInteractionBase):
+    id: int
+    detected_intent: Optional[str] = None
+    entities: Optional[Dict[str, Any]] = None
+    system_response: Optional[str] = None
+    latency_ms: Optional[float] = None
@@ -0,0 +1,129 @@
+import asyncio
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from .intent_cache import IntentCache
+from app import metrics, tracing
+
+# Intent parser backends as "module:class", imported only when first used so
+# the rule-based parser never pays for transformers and torch
+BACKENDS = {
+    "rules": "app.nlp.rule_based_parser:RuleBasedIntentParser",
+    "openhermes": "app.nlp.intent_parser:OpenHermesIntentParser",
+    "cascade": "app.nlp.cascade:CascadingIntentParser",
+    "distilled": "app.nlp.distilled_parser:DistilledIntentParser",
+}
+
+# Backend used by /api/chat
+INTENT_PARSER = os.getenv('INTENT_PARSER', 'rules')
+
+# Seconds before a failed load is retried, doubling with each failure in a row up to the max
+LOAD_RETRY_SECONDS = float(os.getenv('INTENT_PARSER_LOAD_RETRY_SECONDS', '5'))
+LOAD_RETRY_MAX_SECONDS = float(os.getenv('INTENT_PARSER_LOAD_RETRY_MAX_SECONDS', '300'))
+
+# Parsed intents by normalized message, shared by all backends
+intent_cache = IntentCache()
+
+_lock = threading.Lock()
+_loads = {}
+_load_seconds = {}
+# Backend name: (failures in a row, monotonic time its next load may start)
+_failures = {}
+
+
+def _build(name):
+    """Import and instantiate backend name"""
+    start = time.perf_counter()
+    module_name, class_name = BACKENDS[name].split(":")
+    parser = getattr(importlib.import_module(module_name), class_name)()
+    _load_seconds[name] = time.perf_counter() - start
+    return parser
+
+
+def _run(name, future):
+    try:
+        parser = _build(name)
+    except BaseException as e:
+        with _lock:
+            failures = _failures.get(name, (0, 0))[0] + 1
+            delay = min(LOAD_RETRY_SECONDS * 2 ** (failures - 1), LOAD_RETRY_MAX_SECONDS)
+            _failures[name] = (failures, time.monotonic() + delay)
+        future.set_exception(e)
+    else:
+        with _lock:
+            _failures.pop(name, None)
+        future.set_result(parser)
+
+
+def load(name=INTENT_PARSER):
+    """Start loading backend name on a background thread, once, and return its Future.
+
+    A failed load keeps its Future, so callers see the error, until the
+    retry backoff has passed; the next call then starts a new load.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown intent parser {name!r}, expected one of {sorted(BACKENDS)}")
+    with _lock:
+        future = _loads.get(name)
+        if future is not None and name in _failures and future.done() and time.monotonic() >= _failures[name][1]:
+            future = None
+        if future is None:
+            future = _loads[name] = Future()
+            threading.Thread(target=_run, args=(name, future), name=f"load-{name}", daemon=True).start()
+    return future
+
+
+async def get_parser(name=INTENT_PARSER):
+    """Return the loaded backend, waiting for it without blocking the event loop"""
+    return await asyncio.wrap_future(load(name))
+
+
+def status(name=INTENT_PARSER):
+    """Readiness of backend name: whether it has loaded, is loading or failed"""
+    future = _loads.get(name)
+    error = future.exception() if future is not None and future.done() else None
+    return {
+        "parser": name,
+        "ready": future is not None and future.done() and error is None,
+        "loading": future is not None and not future.done(),
+        "error": str(error) if error else None,
+        "load_seconds": _load_seconds.get(name),
+    }
+
+
+async def _off_loop(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def extract_intent(message, name=INTENT_PARSER):
+    """Run message through backend name; batched backends are awaited off the event loop.
+
+    Only results that resolved every required entity without falling back
+    to the rules are cached, so a degraded answer is not served again once
+    the backend recovers. The shared cache file is only touched on a thread.
+    """
+    with tracing.span("intent.parse", parser=name):
+        start = time.perf_counter()
+        cached = intent_cache.get(name, message, local_only=intent_cache.shared)
+        if cached is None and intent_cache.shared:
+            cached = await _off_loop(intent_cache.get, name, message)
+        if cached is not None:
+            metrics.intent_parse_seconds.labels(name, "hit").observe(time.perf_counter() - start)
+            tracing.annotate(cache="hit")
+            return cached
+        parser = await get_parser(name)
+        submit = getattr(parser, "submit", None)
+        if submit is None:
+            result = parser.extract_intent(message)
+        else:
+            result = await asyncio.wrap_future(submit(message))
+        if not result.missing and not result.fallback:
+            if intent_cache.shared:
+                await _off_loop(intent_cache.put, name, message, result)
+            else:
+                intent_cache.put(name, message, result)
+        metrics.intent_parse_seconds.labels(name, "miss").observe(time.perf_counter() - start)
+        tracing.annotate(cache="miss")
+        return result
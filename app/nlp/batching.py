@@ -0,0 +1,59 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Collect concurrently submitted items into batches for a single worker thread.
+
+    The worker waits for a first item, then keeps collecting until window
+    seconds have passed or max_batch_size items are queued, and hands the
+    batch to process_batch, which returns one result per item; items it
+    returns no result for fail with RuntimeError.
+    """
+
+    def __init__(self, process_batch, window=0.02, max_batch_size=8, name="batcher"):
+        self._process_batch = process_batch
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        """Queue item and return a Future for its result"""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._window
+        while len(batch) < self._max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self._process_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            results = list(results)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            # A short result list would leave the rest waiting forever
+            for _, future in batch[len(results):]:
+                future.set_exception(RuntimeError(f"process_batch returned {len(results)} results for {len(batch)} items"))
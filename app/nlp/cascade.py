@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from . import backends
+from .grammar import match
+from .intent import IntentResult
+from app import metrics
+
+# Backend the cascade escalates to when the rules are not confident
+INTENT_LLM_BACKEND = os.getenv('INTENT_LLM_BACKEND', 'openhermes')
+
+
+class TierStats:
+    """Thread-safe hit count and latency totals for one resolution tier"""
+
+    def __init__(self, name):
+        self._lock = threading.Lock()
+        self._seconds = metrics.intent_tier_seconds.labels(name)
+        self.hits = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds):
+        self._seconds.observe(seconds)
+        with self._lock:
+            self.hits += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def snapshot(self, requests):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "avg_ms": self.total_seconds / self.hits * 1000 if self.hits else 0.0,
+                "max_ms": self.max_seconds * 1000,
+            }
+
+
+class CascadingIntentParser:
+    """Resolve intents with the rule grammar first and escalate to the LLM only when needed.
+
+    A message is escalated when the rules return "unknown" or leave a required
+    entity such as flavor or size to its default. While the LLM backend is
+    still loading, or if it failed to load, the rule result is returned marked
+    as a fallback.
+    """
+
+    def __init__(self, llm_backend=INTENT_LLM_BACKEND):
+        self.llm_backend = llm_backend
+        self.tiers = {name: TierStats(name) for name in ("rules", "llm", "degraded")}
+        # Start loading the LLM in the background so the first escalation finds it ready
+        backends.load(llm_backend)
+
+    def submit(self, user_message):
+        """Resolve user_message; returns a Future of its IntentResult"""
+        start = time.perf_counter()
+        rules = match(user_message, IntentResult.from_rule)
+        future = Future()
+
+        if rules.intent != "unknown" and not rules.missing:
+            self.tiers["rules"].record(time.perf_counter() - start)
+            future.set_result(rules)
+            return future
+
+        llm = backends.load(self.llm_backend)
+        if not llm.done() or llm.exception() is not None:
+            self.tiers["degraded"].record(time.perf_counter() - start)
+            future.set_result(rules._replace(fallback=True))
+            return future
+
+        def done(f):
+            self.tiers["llm"].record(time.perf_counter() - start)
+            if f.exception() is not None:
+                future.set_result(rules._replace(fallback=True))
+            else:
+                future.set_result(f.result())
+        llm.result().submit(user_message).add_done_callback(done)
+        return future
+
+    def extract_intent(self, user_message):
+        """Extract intent and entities, escalating to the LLM when the rules are not confident"""
+        return self.submit(user_message).result()
+
+    def stats(self):
+        """Per-tier hit counts, hit rates and latencies"""
+        requests = sum(tier.hits for tier in self.tiers.values())
+        return {
+            "requests": requests,
+            "tiers": {name: tier.snapshot(requests) for name, tier in self.tiers.items()},
+        }
@@ -0,0 +1,355 @@
+"""Train the distilled intent classifier and entity tagger from the interaction log.
+
+Every chat turn in user_interactions is a labelled example: the message and
+the intent and entities the configured parser (OpenHermes, the cascade or
+the rules) found for it. Templated synthetic messages cover intents the log
+has seen little of, and logged messages are augmented by swapping in other
+entity values, so the tagger learns where names and sizes sit rather than
+which ones were used.
+
+By default training is incremental: it starts from the latest version's
+weights and learns the rows logged since that version was trained, mixed
+with fresh synthetic examples so earlier intents are not forgotten. Each
+run is written as a new version; rows whose id ends in 0 are held out and
+scored against the logged labels.
+
+    python -m app.nlp.distill                     # learn rows logged since the last version
+    python -m app.nlp.distill --full --epochs 10  # retrain from scratch on every row
+    python -m app.nlp.distill --synthetic 50000 --model-dir ./models/intent
+"""
+import argparse
+import os
+import random
+import shutil
+import time
+import numpy as np
+from .distilled_parser import (DISTILLED_MODEL_DIR, INTENTS, TAGS, DistilledModel, latest_version,
+                               message_features, softmax, token_features, tokenize, versions)
+from .intent import ENTITY_TYPES, SCHEMA, from_dict
+
+# Hashed feature space of a new model; weights take 2**bits * (intents + tags) floats
+DISTILLED_FEATURE_BITS = int(os.getenv('DISTILLED_FEATURE_BITS', '16'))
+
+# Older versions beyond this many are deleted after a successful run
+DISTILLED_KEEP_VERSIONS = int(os.getenv('DISTILLED_KEEP_VERSIONS', '5'))
+
+# Rows logged by /api/confirm rather than typed by a user
+_CONFIRMATIONS = {"User confirmed operation", "User cancelled operation"}
+
+# Synthetic messages per intent; {slot}s are filled from VALUES
+TEMPLATES = {
+    "create_vm": (
+        "Create an {flavor} VM named {name}",
+        "please create a vm named {name} with flavor {flavor}",
+        "spin up a {flavor} vm called {name} using {image}",
+        "create vm {name} flavor {flavor} image {image}",
+        "I need a new {flavor} VM named {name} running {image}",
+        "create a vm named {name}",
+    ),
+    "bulk_create_vm": (
+        "create {count} {flavor} VMs named {pattern}",
+        "Create {count} VMs with flavor {flavor}",
+        "launch {count} {flavor} vms named {pattern} using {image}",
+    ),
+    "resize_vm": (
+        "Resize the VM {name} to {flavor}",
+        "resize {name} to flavor {flavor}",
+        "please resize vm {name} to {flavor}",
+        "change {name} to a {flavor} flavor and resize it",
+    ),
+    "delete_vm": (
+        "Delete the VM {name}",
+        "delete vm {name}",
+        "remove the virtual machine {name} delete it",
+        "please delete VM named {name}",
+    ),
+    "create_network": (
+        "Create a private network called {name}",
+        "create network {name}",
+        "make a new network named {name}",
+    ),
+    "create_volume": (
+        "Create a {size}GB volume named {name}",
+        "create volume named {name} of {size} gb",
+        "I need a {size} GB volume called {name}",
+        "add a volume {name} with {size}GB",
+    ),
+    "bulk_create_volume": (
+        "create {count} volumes of {size}GB",
+        "Create {count} {size} GB volumes named {pattern}",
+    ),
+    "delete_volume": (
+        "Delete volume {name}",
+        "please delete the volume named {name}",
+        "remove volume {name} delete it",
+    ),
+    "get_usage": (
+        "What's my project usage?",
+        "show me the quota for this project",
+        "how much of my quota am I using",
+        "project usage please",
+    ),
+    "unknown": (
+        "Do something completely unrelated",
+        "how is the weather in {name} today",
+        "tell me a joke",
+        "what time is it",
+        "hello there",
+    ),
+}
+
+VALUES = {
+    "name": ("web", "db", "dev", "data", "api", "cache", "ci", "build", "prod-db", "staging", "backend", "frontend"),
+    "flavor": ("S.4", "M.8", "L.16", "XL.32", "s.4", "m.8", "l.16"),
+    "image": ("ubuntu-22.04", "fedora-39", "debian-12", "centos-9", "rocky-9", "ubuntu"),
+    "size": (10, 20, 50, 100, 250, 500, 1000),
+    "count": (2, 3, 5, 10, 20, 40, 100),
+}
+
+
+def _random_value(field, rng):
+    if field == "name":
+        return f"{rng.choice(VALUES['name'])}-{rng.randint(1, 99)}" if rng.random() < 0.7 else rng.choice(VALUES["name"])
+    return rng.choice(VALUES[field])
+
+
+def synthetic_examples(count, rng):
+    """count (message, intent, entities) examples filled in from TEMPLATES"""
+    examples = []
+    intents = list(TEMPLATES)
+    for _ in range(count):
+        intent = rng.choice(intents)
+        template = rng.choice(TEMPLATES[intent])
+        entities = {field: _random_value(field, rng) for field in ENTITY_TYPES}
+        entities["pattern"] = f"{rng.choice(VALUES['name'])}-{{n}}"
+        message = template.format(**entities)
+        used = {field: value for field, value in entities.items() if "{" + field + "}" in template}
+        if "pattern" in used:
+            used["name"] = used.pop("pattern")
+        if intent == "unknown":
+            used = {}
+        examples.append((message, intent, used))
+    return examples
+
+
+def _matches(field, word, value):
+    word = word.lower()
+    if ENTITY_TYPES[field] is int:
+        digits = str(value)
+        return word.startswith(digits) and not word[len(digits):len(digits) + 1].isdigit()
+    return word == str(value).lower()
+
+
+def tag_ids(words, entities):
+    """The tag index of each word: the first word matching an entity's value is tagged with its field"""
+    tags = [0] * len(words)
+    for field, value in entities.items():
+        for i, word in enumerate(words):
+            if tags[i] == 0 and _matches(field, word, value):
+                tags[i] = TAGS.index(field)
+                break
+    return tags
+
+
+def augment(example, rng):
+    """example with each entity the message contains replaced by another value of the same kind"""
+    message, intent, entities = example
+    words = tokenize(message)
+    swapped = dict(entities)
+    for field, value in entities.items():
+        index = next((i for i, word in enumerate(words) if _matches(field, word, value)), None)
+        if index is None:
+            continue
+        new = _random_value(field, rng)
+        if field == "name" and "{n}" in str(value):
+            new = f"{rng.choice(VALUES['name'])}-{{n}}"
+        old = words[index]
+        # Keep a unit glued to a number ("50GB")
+        words[index] = str(new) + (old[len(str(value)):] if ENTITY_TYPES[field] is int else "")
+        swapped[field] = new
+    return " ".join(words), intent, swapped
+
+
+def clean(intent, entities):
+    """The logged intent and the entities it was given, coerced to their typed fields"""
+    if intent not in SCHEMA:
+        return "unknown", {}
+    raw = {field: value for field, value in (entities or {}).items() if field in ENTITY_TYPES}
+    typed = from_dict({"intent": intent, "entities": raw}).entities()
+    return intent, {field: typed[field] for field in raw if field in typed}
+
+
+def read_examples(db, after_id=0, batch_size=1000):
+    """(id, message, intent, entities) of chat turns logged after after_id, oldest first"""
+    from app.models.models import UserInteraction
+    query = (db.query(UserInteraction.id, UserInteraction.user_message, UserInteraction.detected_intent,
+                      UserInteraction.entities)
+             .filter(UserInteraction.id > after_id)
+             .order_by(UserInteraction.id)
+             .yield_per(batch_size))
+    for row_id, message, intent, entities in query:
+        if not message or message in _CONFIRMATIONS or intent is None:
+            continue
+        intent, entities = clean(intent, entities)
+        yield row_id, message, intent, entities
+
+
+class Trainer:
+    """Stochastic gradient descent on the softmax classifier and the per-token tagger"""
+
+    def __init__(self, model, learning_rate=0.2):
+        self.model = model
+        self.learning_rate = learning_rate
+
+    def _prepare(self, examples):
+        bits = self.model.bits
+        prepared = []
+        for message, intent, entities in examples:
+            words = tokenize(message)
+            prepared.append((message_features(words, bits), INTENTS.index(intent),
+                             token_features(words, bits) if words else None, np.array(tag_ids(words, entities))))
+        return prepared
+
+    def _step(self, example, rate):
+        model = self.model
+        ids, target, token_ids, tags = example
+        gradient = softmax(model.intent_weights[ids].sum(axis=0) + model.intent_bias)
+        gradient[target] -= 1
+        np.subtract.at(model.intent_weights, ids, rate * gradient)
+        model.intent_bias -= rate * gradient
+        if token_ids is None:
+            return
+        gradient = softmax(model.tag_weights[token_ids].sum(axis=1) + model.tag_bias)
+        gradient[np.arange(len(tags)), tags] -= 1
+        np.subtract.at(model.tag_weights, token_ids, rate * gradient[:, None, :])
+        model.tag_bias -= rate * gradient.sum(axis=0)
+
+    def fit(self, examples, epochs, rng):
+        prepared = self._prepare(examples)
+        for epoch in range(epochs):
+            rng.shuffle(prepared)
+            rate = self.learning_rate / (1 + epoch)
+            for example in prepared:
+                self._step(example, rate)
+
+
+def new_model(bits=DISTILLED_FEATURE_BITS):
+    size = 1 << bits
+    arrays = {
+        "intent_weights": np.zeros((size, len(INTENTS)), dtype=np.float32),
+        "intent_bias": np.zeros(len(INTENTS), dtype=np.float32),
+        "tag_weights": np.zeros((size, len(TAGS)), dtype=np.float32),
+        "tag_bias": np.zeros(len(TAGS), dtype=np.float32),
+    }
+    return DistilledModel(arrays, {"bits": bits, "intents": INTENTS, "tags": TAGS,
+                                   "last_interaction_id": 0, "examples_seen": 0})
+
+
+def warm_start(model_dir):
+    """A writable copy of the latest version, or None if there is none"""
+    if latest_version(model_dir) is None:
+        return None
+    latest = DistilledModel.load(model_dir)
+    if latest.intents != INTENTS or latest.tags != TAGS:
+        # The intent schema changed since; its weights no longer line up
+        return None
+    arrays = {name: np.array(getattr(latest, name)) for name in
+              ("intent_weights", "intent_bias", "tag_weights", "tag_bias")}
+    return DistilledModel(arrays, dict(latest.meta, previous_version=latest.meta["version"]))
+
+
+def resume_after(model_dir):
+    """Id of the last logged row the next run can continue from; 0 when it has to read every row"""
+    model = warm_start(model_dir)
+    return model.meta["last_interaction_id"] if model is not None else 0
+
+
+def evaluate(model, examples):
+    """Intent accuracy and exact entity match rate of model against labelled examples"""
+    if not examples:
+        return {"examples": 0}
+    intents = entities = 0
+    for message, intent, expected in examples:
+        result = model.predict(message)
+        if result.intent == intent:
+            intents += 1
+            found = result.entities()
+            if all(str(found.get(field, "")).lower() == str(value).lower() for field, value in expected.items()):
+                entities += 1
+    return {"examples": len(examples), "intent_accuracy": intents / len(examples),
+            "entity_accuracy": entities / len(examples)}
+
+
+def train(logged, model_dir=DISTILLED_MODEL_DIR, full=False, synthetic=20000, augmentations=2, epochs=6,
+          bits=DISTILLED_FEATURE_BITS, seed=0, keep=DISTILLED_KEEP_VERSIONS):
+    """Train on logged (id, message, intent, entities) rows and save a new version; returns its metadata.
+
+    Unless full is set, training continues from the latest version and
+    logged should hold only rows after its last_interaction_id.
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    model = None if full else warm_start(model_dir)
+    incremental = model is not None
+    model = model or new_model(bits)
+
+    train_rows, held_out = [], []
+    last_id = model.meta["last_interaction_id"]
+    for row_id, message, intent, entities in logged:
+        last_id = max(last_id, row_id)
+        (held_out if row_id % 10 == 0 else train_rows).append((message, intent, entities))
+    examples = list(train_rows)
+    for example in train_rows:
+        examples.extend(augment(example, rng) for _ in range(augmentations))
+    examples.extend(synthetic_examples(synthetic, rng))
+    synthetic_held_out = synthetic_examples(max(synthetic // 20, 100), random.Random(seed + 1))
+
+    Trainer(model).fit(examples, epochs, rng)
+
+    model.meta.update({
+        "last_interaction_id": last_id,
+        "examples_seen": model.meta["examples_seen"] + len(examples),
+        "logged_examples": len(train_rows),
+        "incremental": incremental,
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "train_seconds": round(time.perf_counter() - started, 2),
+        "evaluation": {"logged": evaluate(model, held_out), "synthetic": evaluate(model, synthetic_held_out)},
+    })
+    model.save(model_dir)
+    for old in versions(model_dir)[:-keep] if keep > 0 else ():
+        shutil.rmtree(os.path.join(model_dir, old))
+    return model.meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=DISTILLED_MODEL_DIR)
+    parser.add_argument("--full", action="store_true", help="retrain from scratch on every logged row")
+    parser.add_argument("--synthetic", type=int, default=20000, help="templated examples mixed in")
+    parser.add_argument("--augmentations", type=int, default=2, help="value-swapped copies of each logged row")
+    parser.add_argument("--epochs", type=int, default=6)
+    parser.add_argument("--bits", type=int, default=DISTILLED_FEATURE_BITS, help="hashed feature space of a new model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from app.models.database import SessionLocal
+    after_id = 0 if args.full else resume_after(args.model_dir)
+    db = SessionLocal()
+    try:
+        meta = train(read_examples(db, after_id), args.model_dir, args.full, args.synthetic, args.augmentations,
+                     args.epochs, args.bits, args.seed)
+    finally:
+        db.close()
+
+    logged, synthetic = meta["evaluation"]["logged"], meta["evaluation"]["synthetic"]
+    print(f"{meta['version']} ({'incremental' if meta['incremental'] else 'full'}): "
+          f"{meta['logged_examples']} logged rows up to id {meta['last_interaction_id']}, "
+          f"{meta['train_seconds']}s")
+    if logged["examples"]:
+        print(f"held-out logged rows: intent {logged['intent_accuracy']:.2%}, "
+              f"entities {logged['entity_accuracy']:.2%} ({logged['examples']} rows)")
+    print(f"held-out synthetic: intent {synthetic['intent_accuracy']:.2%}, entities {synthetic['entity_accuracy']:.2%}")
+
+
+if __name__ == "__main__":
+    main()
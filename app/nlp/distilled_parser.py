@@ -0,0 +1,202 @@
+"""CPU-only intent classifier and entity tagger distilled from the interaction log.
+
+Both are linear models over hashed features: the classifier scores word
+unigrams, bigrams and digit shapes of the whole message; the tagger scores
+each token, with its neighbours as context, as O or one of the entity
+fields. Weights are float32 arrays in a versioned directory written by
+app.nlp.distill and memory-mapped when loaded, so workers share one copy
+through the page cache and a prediction is a few hundred array lookups.
+"""
+import json
+import logging
+import os
+import re
+import zlib
+from concurrent.futures import Future
+import numpy as np
+from .intent import ENTITY_TYPES, SCHEMA, UNKNOWN, from_dict
+
+# Versions live in v0001, v0002, ... under this directory; LATEST names the one to load
+DISTILLED_MODEL_DIR = os.getenv('DISTILLED_MODEL_DIR', './models/intent')
+
+# Below this class probability the classifier answers "unknown"
+DISTILLED_MIN_PROBABILITY = float(os.getenv('DISTILLED_MIN_PROBABILITY', '0.5'))
+
+INTENTS = sorted(SCHEMA) + ["unknown"]
+TAGS = ["O"] + list(ENTITY_TYPES)
+
+ARRAYS = ("intent_weights", "intent_bias", "tag_weights", "tag_bias")
+
+_TOKEN_PATTERN = re.compile(r"[\w.{}-]+")
+_ZERO_DIGITS = str.maketrans("0123456789", "0000000000")
+
+# Feature kinds; each is mixed into a word hash to give the feature's id
+_WORD, _SHAPE, _BIGRAM, _TOKEN = 0, 1, 2, 10
+_MASK = (1 << 64) - 1
+_MIX = 0x9E3779B97F4A7C15
+_KIND = 0xC2B2AE3D27D4EB4F
+_PAIR = 0x165667B19E3779F9
+_START = zlib.crc32(b"^")
+_END = zlib.crc32(b"$")
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(message):
+    """Words of message as typed; dots and dashes inside words are kept ("S.4", "ci-{n}")"""
+    return [word for word in (w.strip(".-") for w in _TOKEN_PATTERN.findall(message)) if word]
+
+
+def _hashes(words):
+    """CRC32 of each lowercased word and of its shape (digits as 0)"""
+    lower = [w.lower() for w in words]
+    return [zlib.crc32(w.encode()) for w in lower], [zlib.crc32(w.translate(_ZERO_DIGITS).encode()) for w in lower]
+
+
+def _pair(a, b):
+    return (a * _PAIR + b) & _MASK
+
+
+# Multiplicative hashing on 64-bit ints: the top bits of (hash + kind offset) * _MIX
+# index the weights. Plain ints beat numpy for the few dozen ids of a message
+def _ids(kind, hashes, shift):
+    offset = (kind + 1) * _KIND
+    return [((h + offset) * _MIX & _MASK) >> shift for h in hashes]
+
+
+def message_features(words, bits):
+    """Feature ids of a whole message (repeats count twice): words, shapes and bigrams"""
+    word, shape = _hashes(words)
+    padded = [_START] + word + [_END]
+    shift = 64 - bits
+    return np.array(_ids(_WORD, word, shift) + _ids(_SHAPE, shape, shift)
+                    + _ids(_BIGRAM, [_pair(a, b) for a, b in zip(padded, padded[1:])], shift), dtype=np.intp)
+
+
+def token_features(words, bits):
+    """Feature ids of each token, shape (tokens, 9): the token, its shape and its neighbours"""
+    word, shape = _hashes(words)
+    w = [_START, _START] + word + [_END, _END]
+    s = [_START, _START] + shape + [_END, _END]
+    shift = 64 - bits
+    columns = [
+        _ids(_TOKEN + kind, column, shift) for kind, column in enumerate((
+            w[2:-2], s[2:-2], w[1:-3], w[3:-1], w[:-4], w[4:],
+            [_pair(a, b) for a, b in zip(w[1:-3], w[3:-1])], s[1:-3], s[3:-1],
+        ))
+    ]
+    return np.array(columns, dtype=np.intp).T
+
+
+def softmax(scores):
+    scores = scores - scores.max(axis=-1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def versions(model_dir):
+    """Version directory names under model_dir, oldest first"""
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(name for name in os.listdir(model_dir) if re.fullmatch(r"v\d+", name))
+
+
+def latest_version(model_dir):
+    try:
+        with open(os.path.join(model_dir, "LATEST")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class DistilledModel:
+    """Weights and metadata of one model version"""
+
+    def __init__(self, arrays, meta):
+        self.intent_weights = arrays["intent_weights"]
+        self.intent_bias = arrays["intent_bias"]
+        self.tag_weights = arrays["tag_weights"]
+        self.tag_bias = arrays["tag_bias"]
+        self.meta = meta
+        self.bits = meta["bits"]
+        self.intents = meta["intents"]
+        self.tags = meta["tags"]
+
+    @classmethod
+    def load(cls, model_dir=DISTILLED_MODEL_DIR, version=None):
+        """Memory-map a version (LATEST when not given); raises FileNotFoundError if there is none"""
+        version = version or latest_version(model_dir)
+        if version is None:
+            raise FileNotFoundError(f"No distilled intent model in {model_dir}; train one with python -m app.nlp.distill")
+        path = os.path.join(model_dir, version)
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        # Plain ndarray views of the maps; np.memmap results pay for a wrapper on every operation
+        arrays = {name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")) for name in ARRAYS}
+        return cls(arrays, meta)
+
+    def save(self, model_dir):
+        """Write the model as the next version and point LATEST at it; returns the version name"""
+        existing = versions(model_dir)
+        version = f"v{int(existing[-1][1:]) + 1 if existing else 1:04d}"
+        path = os.path.join(model_dir, version)
+        os.makedirs(path)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(getattr(self, name), dtype=np.float32))
+        self.meta["version"] = version
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(self.meta, f, indent=2)
+        # Readers see either the old version or the complete new one
+        pointer = os.path.join(model_dir, "LATEST.tmp")
+        with open(pointer, "w") as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(model_dir, "LATEST"))
+        return version
+
+    def classify(self, words):
+        """(intent index, probability) for the tokenized message"""
+        probabilities = softmax(self.intent_weights[message_features(words, self.bits)].sum(axis=0) + self.intent_bias)
+        best = int(probabilities.argmax())
+        return best, float(probabilities[best])
+
+    def tag(self, words):
+        """Per-token tag probabilities, shape (tokens, tags)"""
+        return softmax(self.tag_weights[token_features(words, self.bits)].sum(axis=1) + self.tag_bias)
+
+    def predict(self, message, min_probability=DISTILLED_MIN_PROBABILITY):
+        """The IntentResult for message; confidence is the schema's entity share times the class probability"""
+        words = tokenize(message)
+        best, probability = self.classify(words)
+        intent = self.intents[best]
+        if intent == "unknown" or probability < min_probability:
+            return UNKNOWN
+        entities = {}
+        fields = list(SCHEMA[intent])
+        if fields and words:
+            # The most likely token for each of the intent's fields, if it is likely enough
+            tags = self.tag(words)[:, [self.tags.index(field) for field in fields]]
+            tokens = tags.argmax(axis=0)
+            for field, token, likelihood in zip(fields, tokens.tolist(), tags[tokens, range(len(fields))].tolist()):
+                if likelihood >= 0.5:
+                    entities[field] = words[token]
+        result = from_dict({"intent": intent, "entities": entities})
+        return result._replace(confidence=result.confidence * probability)
+
+
+class DistilledIntentParser:
+    """Intent parser backed by the latest distilled model in DISTILLED_MODEL_DIR"""
+
+    def __init__(self, model_dir=DISTILLED_MODEL_DIR, min_probability=DISTILLED_MIN_PROBABILITY):
+        self.model = DistilledModel.load(model_dir)
+        self.min_probability = min_probability
+        logger.info("Loaded distilled intent model %s from %s", self.model.meta['version'], model_dir)
+
+    def extract_intent(self, user_message):
+        """Classify user_message and tag its entities with the distilled linear models"""
+        return self.model.predict(user_message, self.min_probability)
+
+    def submit(self, user_message):
+        """Predict inline; returns a completed Future so the cascade can escalate here"""
+        future = Future()
+        future.set_result(self.extract_intent(user_message))
+        return future
@@ -0,0 +1,335 @@
+"""Declarative intent grammar shared by the rule-based and OpenHermes parsers and the planner.
+
+A message is split into words once and the rule is picked from the
+keywords among them with set operations, before any word is looked at on
+its own. Only the slots the rule's entities take are then read, each by a
+reader that goes straight to the words that trigger it. Checks run on str
+methods rather than regexes.
+"""
+import re
+from collections import namedtuple
+
+# Words that select an intent; synonyms and inflections map onto the same keyword
+KEYWORDS = {
+    "create": "create",
+    "creates": "create",
+    "created": "create",
+    "creating": "create",
+    "resize": "resize",
+    "delete": "delete",
+    "vm": "vm",
+    "vms": "vm",
+    "network": "network",
+    "networks": "network",
+    "volume": "volume",
+    "volumes": "volume",
+    "usage": "usage",
+    "quota": "usage",
+    "quotas": "usage",
+}
+
+# {n} in a name stands for the index of each resource in a bulk request
+NAME = r"[\w.{}-]+"
+FLAVOR = r"[a-z]\.\d+"
+
+_WORD = re.compile(NAME)
+
+# Words that may follow a verb or resource noun but are never a resource name
+_NOT_A_NAME = frozenset((
+    "the", "named", "called", "to", "vm", "vms", "volume", "volumes", "network", "networks", "with", "from",
+    "using", "running", "of", "for", "on", "in", "and", "attached", "image", "flavor",
+))
+
+_PLURAL_NOUNS = ("vms", "volumes")
+
+
+def _is_flavor(word):
+    """Whether word matches FLAVOR"""
+    return word[1:2] == "." and word[2:].isdigit() and "a" <= word[0] <= "z"
+
+
+def _is_size(words, i):
+    """Whether words[i] is a size: "50gb", or "50" and then "gb"."""
+    word = words[i]
+    if word.isdigit():
+        return i + 1 < len(words) and words[i + 1] == "gb"
+    return word.endswith("gb") and word[:-2].isdigit()
+
+
+def _is_name(words, i):
+    if i >= len(words):
+        return False
+    word = words[i]
+    if word.isalpha():
+        return word not in _NOT_A_NAME
+    # Sizes start with a digit and flavors with a letter
+    if word[0].isdigit():
+        return not _is_size(words, i)
+    return not _is_flavor(word)
+
+
+def _is_count(words, i):
+    """Whether the number words[i] comes before a plural resource noun, possibly after one word ("40 S.4 VMs")"""
+    for j in (i + 1, i + 2):
+        if j >= len(words):
+            return False
+        word = words[j]
+        if word in _PLURAL_NOUNS:
+            return True
+        if word in _WORDS or word in _NOT_A_NAME or word[0].isdigit():
+            return False
+    return False
+
+
+# Slot readers: given the words and the index of the trigger, the slot's value or None
+
+def _next(words, i):
+    return words[i + 1] if i + 1 < len(words) else None
+
+
+def _object(words, i):
+    """The name after a verb, skipping "the" and a resource noun ("delete the vm web")"""
+    i += 1
+    if i < len(words) and words[i] == "the":
+        i += 1
+    if i < len(words) and words[i] in ("vm", "vms", "volume", "volumes"):
+        i += 1
+    return words[i] if _is_name(words, i) else None
+
+
+def _noun(words, i):
+    """The name after a resource noun ("network foo")"""
+    return words[i + 1] if _is_name(words, i + 1) else None
+
+
+def _target(words, i):
+    """The flavor after "to", which may say "flavor" first; a flavor-shaped word is left to the flavor slot"""
+    if i + 2 < len(words) and words[i + 1] == "flavor" and not _is_flavor(words[i + 2]):
+        return words[i + 2]
+    value = _next(words, i)
+    return value if value is not None and not _is_flavor(value) else None
+
+
+def _image(words, i):
+    if i + 2 < len(words) and words[i + 1] == "image":
+        return words[i + 2]
+    return _next(words, i)
+
+
+# Words that fill a slot, as word: (slot, reader). The reader takes the
+# slot's value from the words after the trigger, or gives None
+TRIGGERS = {
+    "resize": ("object", _object),
+    "delete": ("object", _object),
+    "named": ("named", _next),
+    "called": ("called", _next),
+    "to": ("to", _target),
+    "image": ("image", _image),
+    "using": ("image", _image),
+    "running": ("image", _image),
+    **{word: ("noun", _noun) for word, keyword in KEYWORDS.items() if keyword in ("vm", "network", "volume")},
+}
+
+# How each slot value is normalised before it becomes an entity
+CONVERTERS = {
+    "flavor": str.upper,
+    "size": lambda word: int(word[:-2] if word.endswith("gb") else word),
+    "count": int,
+}
+
+# An entity is taken from the first of its slots that matched, else the
+# default; a required entity missing from the message lowers confidence, and
+# an optional one only counts towards confidence when it is present
+Entity = namedtuple("Entity", ["slots", "default", "required", "optional"], defaults=[False, False])
+Rule = namedtuple("Rule", ["intent", "requires", "entities"])
+Match = namedtuple("Match", ["intent", "entities", "confidence", "missing"])
+
+# Intents in priority order; the first rule whose keywords all occur wins
+RULES = (
+    Rule("bulk_create_vm", {"create", "vm", "many"}, {
+        "name": Entity(("named",), "vm-{n}"),
+        "flavor": Entity(("flavor",), "default-flavor", required=True),
+        "count": Entity(("count",), None, required=True),
+        "image": Entity(("image",), None, optional=True),
+    }),
+    Rule("bulk_create_volume", {"create", "volume", "many"}, {
+        "name": Entity(("named", "called"), "volume-{n}"),
+        "size": Entity(("size",), 100, required=True),
+        "count": Entity(("count",), None, required=True),
+    }),
+    Rule("create_vm", {"create", "vm"}, {
+        "name": Entity(("named", "noun"), "default-vm"),
+        "flavor": Entity(("flavor",), "default-flavor", required=True),
+        "image": Entity(("image",), None, optional=True),
+    }),
+    # Only VMs can be resized, so "resize" alone is enough
+    Rule("resize_vm", {"resize"}, {
+        "name": Entity(("named", "object"), None, required=True),
+        "flavor": Entity(("flavor", "to"), "default-flavor", required=True),
+    }),
+    Rule("delete_vm", {"delete", "vm"}, {
+        "name": Entity(("named", "object"), None, required=True),
+    }),
+    Rule("create_network", {"create", "network"}, {
+        "name": Entity(("called", "named", "noun"), "default-network"),
+    }),
+    Rule("create_volume", {"create", "volume"}, {
+        "name": Entity(("named", "called", "noun"), "default-volume"),
+        "size": Entity(("size",), 100, required=True),
+    }),
+    Rule("delete_volume", {"delete", "volume"}, {
+        "name": Entity(("named", "object"), None, required=True),
+    }),
+    Rule("get_usage", {"usage"}, {}),
+)
+
+# Words that select a rule, and all the words worth looking for
+_KEYWORD_WORDS = frozenset(KEYWORDS)
+_WORDS = _KEYWORD_WORDS | frozenset(TRIGGERS)
+_PLURALS = frozenset(_PLURAL_NOUNS)
+_MANY = frozenset(("many",))
+
+# Characters outside NAME that are worth checking for
+_PUNCTUATION = frozenset("!\"#$%&'()*+,/:;<=>?@[\\]^`|~")
+
+# The first rule each set of keyword words selects, filled in as sets are seen
+_RULE_FOR = {}
+
+
+def split(message):
+    """The lowercased words of message: its runs of NAME characters"""
+    lower = message.lower()
+    # Splitting on whitespace gives the same words unless characters outside
+    # NAME are left, which a set lookup rules out faster than the regex
+    if lower.isascii() and _PUNCTUATION.isdisjoint(lower):
+        return lower.split()
+    return _WORD.findall(lower)
+
+
+def _count(words, present):
+    """The first number that counts resources, or None"""
+    if present.isdisjoint(_PLURALS):
+        return None
+    for i, word in enumerate(words):
+        if word[0].isdigit() and word.isdigit() and not _is_size(words, i) and _is_count(words, i):
+            return int(word)
+    return None
+
+
+def _size(words, present):
+    for i, word in enumerate(words):
+        if word[0].isdigit() and _is_size(words, i):
+            return CONVERTERS["size"](word)
+    return None
+
+
+def _flavor(words, present):
+    for word in words:
+        if "." in word and _is_flavor(word):
+            return CONVERTERS["flavor"](word)
+    return None
+
+
+def _triggered(slot):
+    """Reader for a slot filled by trigger words: the first of them the slot's reader finds a value after"""
+    readers = {word: reader for word, (trigger_slot, reader) in TRIGGERS.items() if trigger_slot == slot}
+    triggers = frozenset(readers)
+
+    def read(words, present):
+        hits = triggers & present
+        if not hits:
+            return None
+        if len(hits) == 1:
+            # One trigger word, usually said once: go straight to it
+            [word] = hits
+            value = readers[word](words, words.index(word))
+            if value is not None or words.count(word) == 1:
+                return value
+        for i, word in enumerate(words):
+            if word in hits:
+                value = readers[word](words, i)
+                if value is not None:
+                    return value
+        return None
+    return read
+
+
+# How each slot is read, given the words and the trigger words among them
+SLOTS = {
+    "size": _size,
+    "flavor": _flavor,
+    "count": _count,
+    **{slot: _triggered(slot) for slot, _ in TRIGGERS.values()},
+}
+
+# Each rule's entities as (name, readers, default, required, optional) tuples
+_RULE_ENTITIES = {
+    rule.intent: tuple(
+        (name, tuple(SLOTS[slot] for slot in entity.slots), entity.default, entity.required, entity.optional)
+        for name, entity in rule.entities.items()
+    )
+    for rule in RULES
+}
+
+
+def _select(keyword_words):
+    """The first rule whose keywords the words give, or False"""
+    rule = _RULE_FOR.get(keyword_words)
+    if rule is None:
+        keywords = {KEYWORDS.get(word, word) for word in keyword_words}
+        rule = _RULE_FOR[keyword_words] = next((rule for rule in RULES if rule.requires <= keywords), False)
+    return rule
+
+
+def match(message, result=Match):
+    """Match message against RULES.
+
+    The rule is chosen from the keywords among the words first, and only
+    the slots its entities take are read. confidence is the share of the
+    rule's entities found in the message (1.0 for rules without entities,
+    0.0 when no rule matches) and missing lists the required entities that
+    had to be defaulted or left out.
+
+    result is called with the intent, entities, confidence and missing;
+    parsers pass IntentResult.from_rule so no Match is built in between.
+    """
+    words = split(message)
+    present = _WORDS.intersection(words)
+    keyword_words = _KEYWORD_WORDS.intersection(present)
+    if not present.isdisjoint(_PLURALS) and _count(words, present) is not None:
+        # A number before a plural resource noun ("40 S.4 VMs") asks for many
+        keyword_words |= _MANY
+    rule = _RULE_FOR.get(keyword_words)
+    if rule is None:
+        rule = _select(keyword_words)
+    if not rule and keyword_words and "-" in message:
+        # Failing that, keywords inside hyphenated names count ("delete my-vm")
+        rule = _select(keyword_words | _KEYWORD_WORDS.intersection("-".join(words).split("-")))
+    if not rule:
+        return result("unknown", {}, 0.0, [])
+    entities = {}
+    found = 0
+    counted = 0
+    missing = []
+    for name, readers, default, required, optional in _RULE_ENTITIES[rule.intent]:
+        for read in readers:
+            value = read(words, present)
+            if value is not None:
+                entities[name] = value
+                found += 1
+                counted += 1
+                break
+        else:
+            counted += not optional
+            if required:
+                missing.append(name)
+            if default is not None:
+                entities[name] = default
+    confidence = found / counted if counted else 1.0
+    return result(rule.intent, entities, confidence, missing)
+
+
+def parse(message):
+    """Return (intent, entities) for message, or ("unknown", {}) if no rule matches"""
+    result = match(message)
+    return result.intent, result.entities
@@ -0,0 +1,140 @@
+"""The typed result every intent parser returns, and the schema LLM output is read against.
+
+IntentResult is a named tuple, so routes read result.flavor directly and
+a cache hit is returned as is: nothing is serialised or parsed per
+message. JSON only appears where text crosses a process boundary: LLM
+output, and the intent cache shared between workers.
+"""
+import json
+from concurrent.futures import Future
+from typing import NamedTuple, Optional, Protocol, Tuple
+from . import grammar
+
+# Intents a parser may return, with the entities each takes, from the grammar rules
+SCHEMA = {rule.intent: rule.entities for rule in grammar.RULES}
+
+# Entity fields of IntentResult and the type each is coerced to
+ENTITY_TYPES = {"name": str, "flavor": str, "image": str, "size": int, "count": int}
+
+_DECODER = json.JSONDecoder()
+
+
+class IntentResult(NamedTuple):
+    """An intent and its entities; confidence and missing are as in grammar.match()"""
+    intent: str
+    name: Optional[str] = None
+    flavor: Optional[str] = None
+    image: Optional[str] = None
+    size: Optional[int] = None
+    count: Optional[int] = None
+    confidence: float = 0.0
+    missing: Tuple[str, ...] = ()
+    # Set when a backend could not resolve the message and answered with the rules instead
+    fallback: bool = False
+
+    def entities(self):
+        """The entities that are set, as a dict (for the interaction log)"""
+        return {field: getattr(self, field) for field in ENTITY_TYPES if getattr(self, field) is not None}
+
+    def to_json(self):
+        return json.dumps({"intent": self.intent, "entities": self.entities(),
+                           "confidence": self.confidence, "missing": list(self.missing)})
+
+    @classmethod
+    def from_rule(cls, intent, entities, confidence, missing):
+        """Build from what grammar.match() found; pass as its result to skip the Match"""
+        return cls(intent, entities.get("name"), entities.get("flavor"), entities.get("image"),
+                   entities.get("size"), entities.get("count"), confidence, tuple(missing))
+
+
+UNKNOWN = IntentResult("unknown")
+
+
+class IntentParser(Protocol):
+    """What a backend in app.nlp.backends provides; batched backends also have submit()"""
+
+    def extract_intent(self, user_message: str) -> IntentResult:
+        ...
+
+
+class BatchedIntentParser(IntentParser, Protocol):
+    def submit(self, user_message: str) -> "Future[IntentResult]":
+        ...
+
+
+def _coerce(field, value):
+    if value is None or isinstance(value, (dict, list, bool)):
+        return None
+    if ENTITY_TYPES[field] is int:
+        if isinstance(value, (int, float)):
+            return int(value)
+        # "50", "50GB" or "50 GB"
+        digits = str(value).strip()
+        end = 0
+        while end < len(digits) and digits[end].isdigit():
+            end += 1
+        return int(digits[:end]) if end else None
+    text = str(value).strip()
+    if not text:
+        return None
+    return text.upper() if field == "flavor" else text
+
+
+def from_dict(data):
+    """Validate {"intent": ..., "entities": {...}} against SCHEMA.
+
+    Unknown intents become "unknown", entities the intent does not take are
+    dropped, values are coerced to their field's type, and confidence and
+    missing are worked out the way grammar.match() does for the rules.
+    """
+    intent = data.get("intent")
+    entities = data.get("entities")
+    if intent not in SCHEMA:
+        return UNKNOWN
+    if not isinstance(entities, dict):
+        entities = {}
+    values = {}
+    found = counted = 0
+    missing = []
+    for field, entity in SCHEMA[intent].items():
+        value = _coerce(field, entities.get(field))
+        if value is not None:
+            values[field] = value
+            found += 1
+            counted += 1
+        else:
+            counted += not entity.optional
+            if entity.required:
+                missing.append(field)
+            if entity.default is not None:
+                values[field] = entity.default
+    return IntentResult(intent, **values, confidence=found / counted if counted else 1.0, missing=tuple(missing))
+
+
+def from_json(text):
+    """The IntentResult of a to_json() string"""
+    data = json.loads(text)
+    if "confidence" not in data:
+        # Cached as raw parser JSON before results were typed
+        return from_dict(data)
+    return IntentResult(data["intent"], **data["entities"], confidence=data["confidence"],
+                        missing=tuple(data["missing"]))
+
+
+def from_llm_output(text):
+    """Read the first intent object out of generated text, or None if there is none.
+
+    The decoder stops at the brace closing the object, so text generated
+    after it (rows of a batch keep going until the last one finishes) is
+    never looked at. Output cut off mid-object finds nothing.
+    """
+    start = text.find("{")
+    while start >= 0:
+        try:
+            data, _ = _DECODER.raw_decode(text, start)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and "intent" in data:
+            return from_dict(data)
+        start = text.find("{", start + 1)
+    return None
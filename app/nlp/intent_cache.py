@@ -0,0 +1,169 @@
+import collections
+import os
+import sqlite3
+import sys
+import threading
+import time
+from . import grammar
+from .intent import from_json
+
+# How long a parsed intent is reused
+INTENT_CACHE_TTL = float(os.getenv('INTENT_CACHE_TTL', '300'))
+
+# Memory budget of the in-process LRU (keys plus values, in bytes)
+INTENT_CACHE_MAX_BYTES = int(os.getenv('INTENT_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+
+# Optional SQLite file shared by all workers on the host; empty disables it
+INTENT_CACHE_PATH = os.getenv('INTENT_CACHE_PATH', '')
+INTENT_CACHE_MAX_ENTRIES = int(os.getenv('INTENT_CACHE_MAX_ENTRIES', '100000'))
+
+# Prune the shared store after this many inserts
+_PRUNE_EVERY = 1000
+
+
+def normalize(message):
+    """Fold case, punctuation and whitespace so equivalent phrasings share a key.
+
+    The key is the grammar's own words, so only what the parser also throws
+    away is folded: "dev-box", "S.4", "ci-{n}" and a trailing "web." survive.
+    """
+    return " ".join(grammar.split(message))
+
+
+class _SharedStore:
+    """SQLite table of cached intents visible to every worker using the same file"""
+
+    def __init__(self, path, max_entries):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS intent_cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_intent_cache_expires ON intent_cache (expires)")
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM intent_cache WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+        return row
+
+    def put(self, key, value, expires):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO intent_cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, expires),
+            )
+            self._inserts += 1
+            if self._inserts % _PRUNE_EVERY == 0:
+                self._prune(time.time())
+
+    def _prune(self, now):
+        """Drop expired entries, then the soonest-expiring ones beyond max_entries"""
+        self._conn.execute("DELETE FROM intent_cache WHERE expires <= ?", (now,))
+        self._conn.execute(
+            "DELETE FROM intent_cache WHERE key IN ("
+            "SELECT key FROM intent_cache ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+            (self._max_entries,),
+        )
+
+
+def _sizeof(key, value):
+    """Approximate bytes held by an entry: the key, the result tuple and its strings"""
+    return len(key) + sys.getsizeof(value) + sum(len(v) for v in value if isinstance(v, str))
+
+
+class IntentCache:
+    """LRU/TTL cache of IntentResults keyed on normalized messages.
+
+    Entries live in a per-process LRU bounded by max_bytes, which hands back
+    the cached object itself, and, when path is set, in a SQLite file (as
+    JSON) that other workers read from on a local miss.
+    """
+
+    def __init__(self, ttl=INTENT_CACHE_TTL, max_bytes=INTENT_CACHE_MAX_BYTES,
+                 path=INTENT_CACHE_PATH, max_entries=INTENT_CACHE_MAX_ENTRIES):
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._shared = _SharedStore(path, max_entries) if path else None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        """Whether entries are also kept in a SQLite file shared between workers"""
+        return self._shared is not None
+
+    @staticmethod
+    def key(namespace, message):
+        return f"{namespace}:{normalize(message)}"
+
+    def _store_local(self, key, value, expires):
+        size = _sizeof(key, value)
+        if size > self._max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        self._entries[key] = (value, expires, size)
+        self._bytes += size
+        while self._bytes > self._max_bytes:
+            _, (_, _, old_size) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+
+    def get(self, namespace, message, local_only=False):
+        """Return the cached IntentResult for message, or None.
+
+        With local_only, only this worker's LRU is looked in and a miss is
+        not counted, so the event loop can try it before the shared file is
+        read on a thread.
+        """
+        key = self.key(namespace, message)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        if local_only:
+            return None
+        row = self._shared.get(key, now) if self._shared else None
+        value = from_json(row[0]) if row is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            self._store_local(key, value, row[1])
+            return value
+
+    def put(self, namespace, message, value):
+        """Cache value, the IntentResult for message"""
+        key = self.key(namespace, message)
+        expires = time.time() + self._ttl
+        with self._lock:
+            self._store_local(key, value, expires)
+        if self._shared:
+            self._shared.put(key, value.to_json(), expires)
+
+    def stats(self):
+        """Hit and miss counters and current LRU size"""
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -1,164 +1,159 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import json
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
+import logging
+import os
 import torch
-import re
+from concurrent.futures import Future
+from .batching import MicroBatcher
+from .grammar import match
+from .intent import IntentResult, from_llm_output
+
+# Model to load; point this at a small local checkpoint to run on CPU
+INTENT_MODEL = os.getenv('INTENT_MODEL', 'teknium/OpenHermes-2.5-Mistral-7B')
+
+# "auto" spreads the model over available GPUs in fp16, "cpu" runs it in fp32
+INTENT_DEVICE = os.getenv('INTENT_DEVICE', 'auto')
+
+# The longest intent JSON is well under this many tokens
+INTENT_MAX_NEW_TOKENS = int(os.getenv('INTENT_MAX_NEW_TOKENS', '64'))
+
+# Concurrent messages arriving within this window are generated as one batch
+INTENT_BATCH_WINDOW = float(os.getenv('INTENT_BATCH_WINDOW', '0.02'))
+INTENT_MAX_BATCH_SIZE = int(os.getenv('INTENT_MAX_BATCH_SIZE', '8'))
+
+SYSTEM_PROMPT = "You extract intents and entities from cloud operations requests."
+
+USER_PROMPT = """
+            Extract the intent and entities from this cloud operations request: "{message}"
+            Possible intents: create_vm, bulk_create_vm, resize_vm, delete_vm, create_network, create_volume, bulk_create_volume, delete_volume, get_usage
+            Format: {{"intent": "intent_name", "entities": {{"entity1": "value1", "entity2": "value2"}}}}
+            """
+
+# Stands in for the user message while the prompt is split into prefix and suffix
+_PLACEHOLDER = "\x00MESSAGE\x00"
+
+logger = logging.getLogger(__name__)
+
+
+class BalancedBraces(StoppingCriteria):
+    """Stop once every sequence in the batch has closed its outermost JSON brace"""
+
+    def __init__(self, brace_delta, batch_size):
+        # brace_delta[token id] is the token's count of "{" minus "}"
+        self.brace_delta = brace_delta
+        self.depth = torch.zeros(batch_size, dtype=torch.long)
+        self.opened = torch.zeros(batch_size, dtype=torch.bool)
+        self.done = torch.zeros(batch_size, dtype=torch.bool)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        delta = self.brace_delta[input_ids[:, -1].cpu()]
+        self.depth += delta
+        self.opened |= delta > 0
+        self.done |= self.opened & (self.depth <= 0)
+        return bool(self.done.all())
+
 
 class OpenHermesIntentParser:
-    def __init__(self):
+    def __init__(self, model_name=INTENT_MODEL, device=INTENT_DEVICE,
+                 max_new_tokens=INTENT_MAX_NEW_TOKENS, batch_window=INTENT_BATCH_WINDOW,
+                 max_batch_size=INTENT_MAX_BATCH_SIZE):
         # Load the model and tokenizer
-        self.model_name = "teknium/OpenHermes-2.5-Mistral-7B"
-        print(f"Loading model: {self.model_name}")
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens
+        logger.info("Loading model: %s", self.model_name)
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            self.model_name, 
-            torch_dtype=torch.float16,
-            device_map="auto"
-        )
-        print("Model loaded successfully")
-        
-    def extract_intent(self, user_message):
-        """Extract intent and entities from user message using OpenHermes"""
+        # Left padding keeps every message's last token adjacent to the generated ones
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        if device == "cpu":
+            self.model = AutoModelForCausalLM.from_pretrained(self.model_name, torch_dtype=torch.float32)
+        else:
+            self.model = AutoModelForCausalLM.from_pretrained(
+                self.model_name,
+                torch_dtype=torch.float16,
+                device_map="auto"
+            )
+        self.model.eval()
+        self._prepare_prompt()
+        self._prepare_brace_delta()
+        self.batcher = MicroBatcher(self._generate_batch, window=batch_window,
+                                    max_batch_size=max_batch_size, name="intent-llm")
+        logger.info("Model loaded successfully")
+
+    def _prepare_prompt(self):
+        """Tokenize the static prompt prefix once and keep its KV cache for reuse"""
         messages = [
-            {"role": "system", "content": "You extract intents and entities from cloud operations requests."},
-            {"role": "user", "content": f"""
-            Extract the intent and entities from this cloud operations request: "{user_message}"
-            Possible intents: create_vm, resize_vm, delete_vm, create_network, create_volume, delete_volume, get_usage
-            Format: {{"intent": "intent_name", "entities": {{"entity1": "value1", "entity2": "value2"}}}}
-            """}
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": USER_PROMPT.format(message=_PLACEHOLDER)},
         ]
-        
-        # Format messages using ChatML format
-        input_text = self.tokenizer.apply_chat_template(
-            messages, 
-            add_generation_prompt=True,
+        prompt = self.tokenizer.apply_chat_template(messages, add_generation_prompt=True, tokenize=False)
+        prefix, self.prompt_suffix = prompt.split(_PLACEHOLDER)
+        self.prefix_ids = self.tokenizer(prefix, add_special_tokens=False, return_tensors="pt").input_ids.to(self.model.device)
+        with torch.inference_mode():
+            self.prefix_cache = self.model(self.prefix_ids, use_cache=True).past_key_values
+
+    def _prepare_brace_delta(self):
+        size = max(len(self.tokenizer), self.model.config.vocab_size)
+        self.brace_delta = torch.zeros(size, dtype=torch.long)
+        for token, token_id in self.tokenizer.get_vocab().items():
+            delta = token.count("{") - token.count("}")
+            if delta:
+                self.brace_delta[token_id] = delta
+
+    def _generate_batch(self, user_messages):
+        """Generate intent JSON for a batch of messages with one padded generate() call"""
+        batch_size = len(user_messages)
+        rest = self.tokenizer(
+            [m + self.prompt_suffix for m in user_messages],
+            add_special_tokens=False,
+            padding=True,
             return_tensors="pt"
         ).to(self.model.device)
-        
-        # Generate response
-        outputs = self.model.generate(
-            input_text,
-            max_new_tokens=256,
-            temperature=0.1,
-            do_sample=True,
-            pad_token_id=self.tokenizer.eos_token_id
+
+        # Prefix, then left-padded message and suffix; the mask hides the padding
+        prefix_length = self.prefix_ids.shape[1]
+        input_ids = torch.cat([self.prefix_ids.expand(batch_size, -1), rest.input_ids], dim=1)
+        attention_mask = torch.cat([
+            torch.ones(batch_size, prefix_length, dtype=rest.attention_mask.dtype, device=self.model.device),
+            rest.attention_mask,
+        ], dim=1)
+        past_key_values = tuple(
+            tuple(tensor.expand(batch_size, *tensor.shape[1:]) for tensor in layer)
+            for layer in self.prefix_cache
         )
-        
-        # Decode the response
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Extract the assistant's response
-        assistant_response = response.split("<|im_start|>assistant\n")[-1].split("<|im_end|>")[0].strip()
-        
-        try:
-            # Try to extract JSON from the response
-            json_match = re.search(r'\{.*\}', assistant_response, re.DOTALL)
-            if json_match:
-                return json_match.group(0)
-            else:
-                return self._fallback_intent_parsing(user_message)
-        except:
-            # Fallback to simple rule-based parsing if JSON parsing fails
-            return self._fallback_intent_parsing(user_message)
-    
+
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
+                max_new_tokens=self.max_new_tokens,
+                do_sample=False,
+                stopping_criteria=StoppingCriteriaList([BalancedBraces(self.brace_delta, batch_size)]),
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+
+        generated = outputs[:, input_ids.shape[1]:]
+        return [self.tokenizer.decode(row, skip_special_tokens=True) for row in generated]
+
+    def submit(self, user_message):
+        """Queue user_message for the next batch; returns a Future of its IntentResult"""
+        future = self.batcher.submit(user_message)
+        result = Future()
+
+        def done(f):
+            try:
+                parsed = from_llm_output(f.result())
+            except Exception:
+                parsed = None
+            result.set_result(parsed if parsed is not None else self._fallback_intent_parsing(user_message))
+        future.add_done_callback(done)
+        return result
+
+    def extract_intent(self, user_message):
+        """Extract intent and entities from user message using OpenHermes"""
+        return self.submit(user_message).result()
+
     def _fallback_intent_parsing(self, user_message):
         """Simple rule-based fallback for intent parsing"""
-        intent = "unknown"
-        entities = {}
-        
-        message = user_message.lower()
-        
-        if "create" in message and "vm" in message:
-            intent = "create_vm"
-            # Extract name and flavor using simple rules
-            if "named" in message:
-                name_parts = message.split("named")
-                if len(name_parts) > 1:
-                    entities["name"] = name_parts[1].strip().split()[0]
-            else:
-                entities["name"] = "default-vm"
-                
-            if "s.4" in message:
-                entities["flavor"] = "S.4"
-            elif "m.8" in message:
-                entities["flavor"] = "M.8"
-            else:
-                entities["flavor"] = "default-flavor"
-            
-        elif "resize" in message and "vm" in message:
-            intent = "resize_vm"
-            # Extract VM name
-            if "resize" in message:
-                parts = message.split("resize")
-                if len(parts) > 1:
-                    name_parts = parts[1].strip().split()
-                    if len(name_parts) > 0:
-                        entities["name"] = name_parts[0]
-            
-            # Extract flavor
-            if "to" in message:
-                flavor_parts = message.split("to")
-                if len(flavor_parts) > 1:
-                    flavor = flavor_parts[1].strip().split()[0]
-                    entities["flavor"] = flavor
-            
-            if "flavor" not in entities:
-                if "s.4" in message:
-                    entities["flavor"] = "S.4"
-                elif "m.8" in message:
-                    entities["flavor"] = "M.8"
-                else:
-                    entities["flavor"] = "default-flavor"
-            
-        elif "delete" in message and "vm" in message:
-            intent = "delete_vm"
-            if "delete" in message:
-                parts = message.split("delete")
-                if len(parts) > 1:
-                    vm_parts = parts[1].strip().split()
-                    if len(vm_parts) > 1 and vm_parts[0].lower() == "the" and vm_parts[1].lower() == "vm":
-                        if len(vm_parts) > 2:
-                            entities["name"] = vm_parts[2]
-                    elif len(vm_parts) > 0:
-                        entities["name"] = vm_parts[0]
-            
-        elif "create" in message and "network" in message:
-            intent = "create_network"
-            if "called" in message:
-                parts = message.split("called")
-                if len(parts) > 1:
-                    entities["name"] = parts[1].strip().split()[0]
-            else:
-                entities["name"] = "default-network"
-            
-        elif "create" in message and "volume" in message:
-            intent = "create_volume"
-            if "named" in message:
-                parts = message.split("named")
-                if len(parts) > 1:
-                    entities["name"] = parts[1].strip().split()[0]
-            else:
-                entities["name"] = "default-volume"
-            
-            # Try to extract size
-            size_match = re.search(r'(\d+)\s*gb', message, re.IGNORECASE)
-            if size_match:
-                entities["size"] = int(size_match.group(1))
-            else:
-                entities["size"] = 100  # Default size
-            
-        elif "delete" in message and "volume" in message:
-            intent = "delete_volume"
-            if "delete" in message:
-                parts = message.split("delete")
-                if len(parts) > 1:
-                    volume_parts = parts[1].strip().split()
-                    if len(volume_parts) > 1 and volume_parts[0].lower() == "volume":
-                        if len(volume_parts) > 1:
-                            entities["name"] = volume_parts[1]
-                    elif len(volume_parts) > 0:
-                        entities["name"] = volume_parts[0]
-            
-        elif "usage" in message or "quota" in message or "project usage" in message:
-            intent = "get_usage"
-        
-        return json.dumps({"intent": intent, "entities": entities})
+        return match(user_message, IntentResult.from_rule)._replace(fallback=True)
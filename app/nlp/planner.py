@@ -0,0 +1,142 @@
+"""Split compound requests into a dependency graph of single-operation steps.
+
+"create network foo, a 50GB volume bar and a VM baz attached to both"
+becomes four steps: the network and volume (independent), the VM on network
+foo (after the network) and attaching volume bar to the VM (after both).
+"""
+import re
+from . import grammar
+
+# Clauses are separated by commas, semicolons, "and" and "then"
+_SPLIT = re.compile(r"\s*(?:[,;]|\band\b|\bthen\b)\s*", re.IGNORECASE)
+_VERB = re.compile(r"\b(create|delete|resize)\b", re.IGNORECASE)
+# Only a clause opening with an article or resource noun continues the previous verb
+_CONTINUES = re.compile(r"^\s*(?:a|an|the|vms?|volumes?|networks?)(?:\s|$)", re.IGNORECASE)
+_ATTACH = re.compile(r"\b(?:attached|connected)\s+to\s+(?P<targets>.*)$", re.IGNORECASE)
+_TARGET = re.compile(rf"^(?:the\s+)?(?:(?P<kind>network|volume)\s+)?(?P<name>{grammar.NAME})$", re.IGNORECASE)
+_ALL = {"both", "all", "them", "everything"}
+
+# Operations that create something a later step can attach to
+_CREATES = {"create_network": "network", "create_volume": "volume"}
+
+# How each step is described when the plan is confirmed
+SUMMARIES = {
+    "create_vm": "create VM '{name}' with flavor '{flavor}'",
+    "delete_vm": "delete VM '{name}'",
+    "resize_vm": "resize VM '{name}' to '{flavor}'",
+    "create_network": "create network '{name}'",
+    "create_volume": "create a {size} GB volume '{name}'",
+    "delete_volume": "delete volume '{name}'",
+    "attach_volume": "attach volume '{volume}' to VM '{server}'",
+}
+
+
+def _targets(text, steps):
+    """Resolve "both", "it" or a list of names to (kind, name, step id or None) tuples"""
+    text = text.strip().lower()
+    creates = [s for s in steps if s["operation"] in _CREATES]
+    if text in _ALL:
+        return [(_CREATES[s["operation"]], s["parameters"]["name"], s["id"]) for s in creates]
+    if text == "it":
+        return [(_CREATES[s["operation"]], s["parameters"]["name"], s["id"]) for s in creates[-1:]]
+    targets = []
+    for part in _SPLIT.split(text):
+        match = _TARGET.match(part)
+        if not match:
+            continue
+        name = match.group("name")
+        step = next((s for s in reversed(creates) if s["parameters"]["name"] == name), None)
+        if step is not None:
+            targets.append((_CREATES[step["operation"]], name, step["id"]))
+        else:
+            # A resource that already exists; untyped names are taken as networks
+            targets.append((match.group("kind") or "network", name, None))
+    return targets
+
+
+def _attach(vm_step, targets, steps):
+    """Put the VM on the target networks and add a step attaching each target volume"""
+    name = vm_step["parameters"]["name"]
+    for kind, target, step_id in targets:
+        if kind == "network":
+            vm_step["parameters"].setdefault("networks", []).append(target)
+            if step_id is not None:
+                vm_step["depends_on"].append(step_id)
+        else:
+            steps.append({
+                "id": f"s{len(steps) + 1}",
+                "operation": "attach_volume",
+                "parameters": {"server": name, "volume": target},
+                "depends_on": [vm_step["id"]] + ([step_id] if step_id else []),
+            })
+
+
+def plan(message):
+    """Return the steps of a compound request, or None if it is not one.
+
+    Each step is {"id", "operation", "parameters", "depends_on"}. Clauses
+    such as "a volume bar" inherit the previous clause's verb, and a step
+    waits for earlier steps that touch the same resource name. A clause with
+    any other verb ("attach", "show") leaves the request to the intent parser.
+    """
+    clauses = [c for c in _SPLIT.split(message) if c]
+    if len(clauses) < 2:
+        return None
+
+    steps = []
+    verb = None
+    attaching = None
+    for clause in clauses:
+        if attaching is not None and _TARGET.match(clause.strip()) and not _VERB.search(clause):
+            # A bare name continues the previous clause's "attached to" list
+            _attach(attaching, _targets(clause, steps), steps)
+            continue
+
+        attach = _ATTACH.search(clause)
+        if attach:
+            clause = clause[:attach.start()]
+        found = _VERB.search(clause)
+        if found:
+            verb = found.group(1).lower()
+        elif verb is not None and _CONTINUES.match(clause):
+            clause = f"{verb} {clause}"
+        else:
+            return None
+        result = grammar.match(clause)
+        if result.intent in ("unknown", "get_usage") or result.intent.startswith("bulk_"):
+            return None
+
+        name = result.entities.get("name")
+        step = {
+            "id": f"s{len(steps) + 1}",
+            "operation": result.intent,
+            "parameters": dict(result.entities),
+            "depends_on": [s["id"] for s in steps if name is not None and s["parameters"].get("name") == name],
+        }
+        steps.append(step)
+
+        attaching = step if attach and result.intent == "create_vm" else None
+        if attaching is not None:
+            _attach(attaching, _targets(attach.group("targets"), steps), steps)
+
+    return steps if len(steps) > 1 else None
+
+
+def summarize(steps):
+    """One line per step for the confirmation message"""
+    lines = []
+    for i, step in enumerate(steps, 1):
+        text = SUMMARIES.get(step["operation"], step["operation"]).format_map(_Blank(step["parameters"]))
+        networks = step["parameters"].get("networks")
+        if networks:
+            text += " on " + ", ".join(f"'{n}'" for n in networks)
+        after = [str(n) for n in sorted(int(s[1:]) for s in step["depends_on"])]
+        if after:
+            text += f" (after step {', '.join(after)})"
+        lines.append(f"{i}. {text}")
+    return "\n".join(lines)
+
+
+class _Blank(dict):
+    def __missing__(self, key):
+        return ""
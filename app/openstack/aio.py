@@ -0,0 +1,69 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum number of concurrent blocking calls per OpenStack service. Each
+# service gets its own bounded executor so a backlog of slow Nova calls can
+# never starve Cinder or Neutron requests.
+SERVICE_CONCURRENCY = {
+    "nova": int(os.getenv('OS_NOVA_CONCURRENCY', '16')),
+    "cinder": int(os.getenv('OS_CINDER_CONCURRENCY', '8')),
+    "neutron": int(os.getenv('OS_NEUTRON_CONCURRENCY', '8')),
+    "glance": int(os.getenv('OS_GLANCE_CONCURRENCY', '4')),
+}
+
+# How often a pending call checks whether the HTTP client went away
+DISCONNECT_POLL_INTERVAL = float(os.getenv('OS_DISCONNECT_POLL_INTERVAL', '0.25'))
+
+
+_executors = {
+    service: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"os-{service}")
+    for service, limit in SERVICE_CONCURRENCY.items()
+}
+
+
+class ClientDisconnected(Exception):
+    """Raised when the HTTP client disconnects while an OpenStack call is pending"""
+
+
+async def _watch_disconnect(request, future):
+    """Cancel future as soon as the client behind request disconnects"""
+    while not future.done():
+        if await request.is_disconnected():
+            future.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def call(service, fn, *args, request=None, **kwargs):
+    """Run a blocking OpenStack call on the service's executor without blocking the event loop.
+
+    When request is given, the call is cancelled if the client disconnects
+    before it starts; a call that already started runs to completion but its
+    result is discarded.
+    """
+    loop = asyncio.get_running_loop()
+    # Copy the caller's context so context variables survive the thread hop
+    ctx = contextvars.copy_context()
+    future = loop.run_in_executor(_executors[service], functools.partial(ctx.run, fn, *args, **kwargs))
+
+    if request is None:
+        return await future
+
+    watcher = asyncio.ensure_future(_watch_disconnect(request, future))
+    try:
+        return await future
+    except asyncio.CancelledError:
+        if watcher.done():
+            raise ClientDisconnected(f"Client disconnected during {service} call {fn.__name__}")
+        raise
+    finally:
+        watcher.cancel()
+
+
+def shutdown(wait=True):
+    """Stop all service executors"""
+    for executor in _executors.values():
+        executor.shutdown(wait=wait, cancel_futures=True)
@@ -1,29 +1,148 @@
 from keystoneauth1.identity import v3
 from keystoneauth1 import session
-from keystoneauth1.token_endpoint import Token
+import requests
+from requests.adapters import HTTPAdapter
+import threading
+import datetime
+import logging
 import os
 from dotenv import load_dotenv
+from app import tracing
 
 # Load environment variables from .env file
 load_dotenv()
 
-def get_session():
-    """Create and return an authenticated session for OpenStack API calls"""
+# Connection pool and timeout settings for the shared session
+POOL_CONNECTIONS = int(os.getenv('OS_POOL_CONNECTIONS', '10'))
+POOL_MAXSIZE = int(os.getenv('OS_POOL_MAXSIZE', '32'))
+HTTP_TIMEOUT = float(os.getenv('OS_HTTP_TIMEOUT', '30'))
+CONNECT_RETRIES = int(os.getenv('OS_CONNECT_RETRIES', '2'))
+
+# Refresh the token this many seconds before Keystone expires it
+TOKEN_REFRESH_MARGIN = int(os.getenv('OS_TOKEN_REFRESH_MARGIN', '300'))
+
+_lock = threading.RLock()
+_session = None
+_clients = {}
+_refresher = None
+
+logger = logging.getLogger(__name__)
+
+
+def _build_auth():
+    """Build the Keystone auth plugin from the environment"""
     # If token is available, use token authentication
     if os.getenv('OS_AUTH_TOKEN'):
-        auth = Token(
+        return v3.Token(
             auth_url=os.getenv('OS_AUTH_URL'),
             token=os.getenv('OS_AUTH_TOKEN'),
             project_id=os.getenv('OS_PROJECT_ID')
         )
-    else:
-        # Fall back to password authentication
-        auth = v3.Password(
-            auth_url=os.getenv('OS_AUTH_URL'),
-            username=os.getenv('OS_USERNAME'),
-            password=os.getenv('OS_PASSWORD'),
-            project_id=os.getenv('OS_PROJECT_ID'),
-            user_domain_name=os.getenv('OS_USER_DOMAIN_NAME', 'Default')
+
+    # Fall back to password authentication
+    return v3.Password(
+        auth_url=os.getenv('OS_AUTH_URL'),
+        username=os.getenv('OS_USERNAME'),
+        password=os.getenv('OS_PASSWORD'),
+        project_id=os.getenv('OS_PROJECT_ID'),
+        user_domain_name=os.getenv('OS_USER_DOMAIN_NAME', 'Default')
+    )
+
+
+def _build_session():
+    """Create a keystoneauth session backed by a pooled keep-alive HTTP session"""
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+    # Every Nova, Cinder, Neutron and Glance call made for a traced request becomes a span
+    http.hooks['response'].append(tracing.record_http_response)
+
+    return session.Session(
+        auth=_build_auth(),
+        session=http,
+        timeout=HTTP_TIMEOUT,
+        connect_retries=CONNECT_RETRIES,
+        verify=False  # Set verify=True in production
+    )
+
+
+def _refresh_token(sess):
+    """Fetch a new token ahead of expiry without invalidating the current one"""
+    auth_ref = sess.auth.auth_ref
+    if auth_ref is not None and not auth_ref.will_expire_soon(TOKEN_REFRESH_MARGIN):
+        return False
+
+    # Requests in flight keep the token they were sent with; new ones wait on
+    # the plugin while get_token() fetches the replacement
+    sess.invalidate()
+    sess.get_token()
+    return True
+
+
+def _seconds_until_refresh(sess):
+    """Return how long the refresher can sleep before the token needs renewing"""
+    auth_ref = sess.auth.auth_ref
+    if auth_ref is None or auth_ref.expires is None:
+        return TOKEN_REFRESH_MARGIN
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    remaining = (auth_ref.expires - now).total_seconds() - TOKEN_REFRESH_MARGIN
+    return max(remaining, 5)
+
+
+def _refresh_loop(sess, stop):
+    """Background loop that keeps the shared session's token fresh"""
+    while not stop.wait(_seconds_until_refresh(sess)):
+        try:
+            _refresh_token(sess)
+        except Exception as e:
+            logger.error("Token refresh failed: %s", e)
+
+
+class _Refresher:
+    def __init__(self, sess):
+        self.stop = threading.Event()
+        self.thread = threading.Thread(
+            target=_refresh_loop, args=(sess, self.stop), name="os-token-refresh", daemon=True
         )
-    
-    return session.Session(auth=auth, verify=False)  # Set verify=True in production
+        self.thread.start()
+
+
+def get_session():
+    """Return the process-wide authenticated session for OpenStack API calls"""
+    global _session, _refresher
+    if _session is not None:
+        return _session
+
+    with _lock:
+        if _session is None:
+            sess = _build_session()
+            _refresher = _Refresher(sess)
+            _session = sess
+    return _session
+
+
+def get_client(name, factory):
+    """Return the cached client registered under name, building it on first use"""
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            client = factory(get_session())
+            _clients[name] = client
+    return client
+
+
+def reset():
+    """Drop the shared session and all cached clients (e.g. after credentials change)"""
+    global _session, _refresher
+    with _lock:
+        if _refresher is not None:
+            _refresher.stop.set()
+        _session = None
+        _refresher = None
+        _clients.clear()
@@ -0,0 +1,89 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Most creates in flight at once for one bulk request
+BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', '8'))
+
+# Extra attempts for an item whose create failed, with exponential backoff
+BULK_RETRIES = int(os.getenv('BULK_RETRIES', '2'))
+BULK_RETRY_BACKOFF = float(os.getenv('BULK_RETRY_BACKOFF', '0.5'))
+
+# Largest number of resources a single bulk request may create
+BULK_MAX_COUNT = int(os.getenv('BULK_MAX_COUNT', '500'))
+
+
+def expand_names(pattern, count, start=1):
+    """Names for count resources; {n} in pattern is the index, appended as -{n} if absent"""
+    if count < 1 or count > BULK_MAX_COUNT:
+        raise ValueError(f"count must be between 1 and {BULK_MAX_COUNT}")
+    if "{n}" not in pattern:
+        pattern += "-{n}"
+    return [pattern.replace("{n}", str(n)) for n in range(start, start + count)]
+
+
+def resolve_names(pattern=None, count=None, names=None):
+    """Explicit names (e.g. a previous response's failed list) or pattern expanded count times"""
+    if names:
+        if len(names) > BULK_MAX_COUNT:
+            raise ValueError(f"At most {BULK_MAX_COUNT} names per request")
+        return list(names)
+    if not pattern or not count:
+        raise ValueError("Give either names or a name pattern and count")
+    return expand_names(pattern, int(count))
+
+
+def run_batch(names, create_one, existing=None, concurrency=BULK_CONCURRENCY, retries=BULK_RETRIES,
+              backoff=BULK_RETRY_BACKOFF, find=None):
+    """Create every name not in existing with at most concurrency creates in flight.
+
+    create_one(name) returns the new resource's id. existing maps names that
+    already exist to their ids; they are reported rather than created again,
+    so resubmitting a batch only retries what failed. find(name), if given,
+    is checked before each retry in case a failed attempt did create the
+    resource. Returns one result dict per name, in order.
+    """
+    existing = existing or {}
+
+    def attempt(name):
+        if name in existing:
+            return {"name": name, "status": "exists", "id": existing[name]}
+        error = None
+        for i in range(retries + 1):
+            if i:
+                time.sleep(backoff * 2 ** (i - 1))
+                found = find(name) if find else None
+                if found is not None:
+                    return {"name": name, "status": "created", "id": found}
+            try:
+                return {"name": name, "status": "created", "id": create_one(name)}
+            except Exception as e:
+                error = str(e)
+        return {"name": name, "status": "failed", "error": error}
+
+    todo = [name for name in names if name not in existing]
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(todo)))) as pool:
+        return list(pool.map(attempt, names))
+
+
+def summarize(items):
+    """Counts by outcome plus the names to resubmit, alongside the per-item results"""
+    failed = [item["name"] for item in items if item["status"] == "failed"]
+    return {
+        "requested": len(items),
+        "created": sum(item["status"] == "created" for item in items),
+        "existing": sum(item["status"] == "exists" for item in items),
+        "failed_count": len(failed),
+        "failed": failed,
+        "items": items,
+    }
+
+
+def multi_create_prefix(names):
+    """The prefix p when names are exactly p-1 .. p-N, Nova's naming for a multi-create; else None"""
+    if len(names) < 2 or not names[0].endswith("-1"):
+        return None
+    prefix = names[0][:-2]
+    if names == [f"{prefix}-{n}" for n in range(1, len(names) + 1)]:
+        return prefix
+    return None
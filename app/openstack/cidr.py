@@ -0,0 +1,121 @@
+import ipaddress
+import threading
+
+
+class CidrAllocator:
+    """Hand out non-overlapping subnets of one size from an address pool.
+
+    The pool is split into blocks of the subnet size. A segment tree over
+    the blocks counts the free ones beneath each node, so finding the first
+    free block, and marking a block used or free, takes O(log n). Each used
+    block remembers the subnets in it, so releasing one of two smaller
+    subnets sharing a block leaves the block used.
+    """
+
+    def __init__(self, pool, prefixlen):
+        self.pool = ipaddress.ip_network(pool)
+        if prefixlen < self.pool.prefixlen:
+            raise ValueError(f"/{prefixlen} subnets do not fit in {self.pool}")
+        self.prefixlen = prefixlen
+        self._blocks = 1 << (prefixlen - self.pool.prefixlen)
+        self._block_size = 1 << (self.pool.max_prefixlen - prefixlen)
+        self._lock = threading.Lock()
+        # Allocated but not yet seen in a listing; kept across reset()
+        self._pending = set()
+        self._free = []
+        # Block -> the subnets overlapping it, for used blocks only
+        self._users = {}
+        self.reset(())
+
+    def _block_range(self, cidr):
+        """Indexes of the blocks cidr overlaps, empty if it lies outside the pool"""
+        network = ipaddress.ip_network(cidr, strict=False)
+        if network.version != self.pool.version or not network.overlaps(self.pool):
+            return range(0)
+        base = int(self.pool.network_address)
+        first = max(0, (int(network.network_address) - base) // self._block_size)
+        last = min(self._blocks - 1, (int(network.broadcast_address) - base) // self._block_size)
+        return range(first, last + 1)
+
+    @staticmethod
+    def _normalize(cidr):
+        return str(ipaddress.ip_network(cidr, strict=False))
+
+    def _use(self, cidr):
+        cidr = self._normalize(cidr)
+        for block in self._block_range(cidr):
+            self._users.setdefault(block, set()).add(cidr)
+            self._set(block, True)
+
+    def _cidr(self, block):
+        address = self.pool.network_address + block * self._block_size
+        return str(ipaddress.ip_network((address, self.prefixlen)))
+
+    def _set(self, block, used):
+        i = block + self._blocks
+        value = 0 if used else 1
+        if self._free[i] == value:
+            return
+        self._free[i] = value
+        i //= 2
+        while i:
+            self._free[i] = self._free[2 * i] + self._free[2 * i + 1]
+            i //= 2
+
+    def reset(self, used_cidrs):
+        """Rebuild from the subnets that exist (e.g. a list_subnets listing), keeping pending allocations"""
+        used_cidrs = list(used_cidrs)
+        with self._lock:
+            leaves = [1] * self._blocks
+            users = {}
+            for cidr in used_cidrs + list(self._pending):
+                cidr = self._normalize(cidr)
+                for block in self._block_range(cidr):
+                    leaves[block] = 0
+                    users.setdefault(block, set()).add(cidr)
+            free = [0] * self._blocks + leaves
+            for i in range(self._blocks - 1, 0, -1):
+                free[i] = free[2 * i] + free[2 * i + 1]
+            self._free = free
+            self._users = users
+
+    def allocate(self):
+        """Reserve and return the lowest free subnet in the pool"""
+        with self._lock:
+            if not self._free[1]:
+                raise Exception(f"No free /{self.prefixlen} left in {self.pool}")
+            i = 1
+            while i < self._blocks:
+                i = 2 * i if self._free[2 * i] else 2 * i + 1
+            cidr = self._cidr(i - self._blocks)
+            self._use(cidr)
+            self._pending.add(cidr)
+            return cidr
+
+    def mark_used(self, cidr):
+        """Record a subnet created outside this allocator"""
+        with self._lock:
+            self._use(cidr)
+
+    def confirm(self, cidr):
+        """The allocated subnet now exists, so listings will report it"""
+        with self._lock:
+            self._pending.discard(cidr)
+
+    def release(self, cidr):
+        """Return a subnet to the pool; blocks other subnets still use stay used"""
+        cidr = self._normalize(cidr)
+        with self._lock:
+            self._pending.discard(cidr)
+            for block in self._block_range(cidr):
+                users = self._users.get(block)
+                if users is not None:
+                    users.discard(cidr)
+                    if users:
+                        continue
+                    del self._users[block]
+                self._set(block, False)
+
+    @property
+    def free_count(self):
+        return self._free[1]
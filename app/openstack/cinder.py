@@ -1,25 +1,82 @@
 from cinderclient import client as cinder_client
-from .auth import get_session
+from cinderclient import exceptions as cinder_exceptions
+from .auth import get_client
+from .inventory import NameIndex
+from . import bulk
+from app.metrics import instrument
 
 def get_cinder_client():
-    """Return an authenticated Cinder client"""
-    return cinder_client.Client(3, session=get_session())
+    """Return the shared authenticated Cinder client"""
+    return get_client("cinder", lambda sess: cinder_client.Client(3, session=sess))
+
+def _all_volumes():
+    return ((v.id, v.name) for v in get_cinder_client().volumes.list(detailed=False))
+
+# Volume names resolved without listing every volume. Cinder only filters
+# by update time from microversion 3.60, so this index reloads in full
+# whenever it expires
+volumes_index = NameIndex("volume", _all_volumes)
 
 def create_volume(name, size):
     """Create a volume with the given name and size in GB"""
     client = get_cinder_client()
     volume = client.volumes.create(size=size, name=name)
+    volumes_index.add(volume.id, name)
     return volume
 
+def find_volumes(names):
+    """Map each of names that exists as a volume to its id, from a freshly updated index"""
+    volumes_index.refresh()
+    found = {}
+    for name in names:
+        ids = volumes_index.ids(name)
+        if ids:
+            found[name] = min(ids)
+    return found
+
+def create_volumes(names, size, concurrency=bulk.BULK_CONCURRENCY):
+    """Create a volume of size GB for each of names; returns bulk.summarize()
+
+    Volumes that already exist are skipped, so resubmitting the same names
+    retries only the failures.
+    """
+    client = get_cinder_client()
+
+    def create_one(name):
+        volume = client.volumes.create(size=size, name=name)
+        volumes_index.add(volume.id, name)
+        return volume.id
+
+    def find(name):
+        return find_volumes([name]).get(name)
+
+    items = bulk.run_batch(names, create_one, existing=find_volumes(names), concurrency=concurrency, find=find)
+    return bulk.summarize(items)
+
 def delete_volume(name):
     """Delete a volume by name"""
     client = get_cinder_client()
-    volume = client.volumes.find(name=name)
-    client.volumes.delete(volume)
-    return {"status": "deleted", "name": name}
+
+    def delete(volume_id):
+        client.volumes.delete(volume_id)
+        return volume_id
+
+    volume_id = volumes_index.call(name, delete, cinder_exceptions.NotFound)
+    volumes_index.remove(volume_id)
+    return {"status": "deleted", "name": name, "id": volume_id}
 
 def get_volume_details(name):
     """Get details of a volume by name"""
     client = get_cinder_client()
-    volume = client.volumes.find(name=name)
-    return volume
+    return volumes_index.call(name, client.volumes.get, cinder_exceptions.NotFound)
+
+def get_volume_status(volume_id):
+    """Return a volume's status, or deleted once it no longer exists"""
+    client = get_cinder_client()
+    try:
+        return client.volumes.get(volume_id).status
+    except cinder_exceptions.NotFound:
+        return "deleted"
+
+# Record the latency of every public function above
+instrument(globals(), "cinder")
@@ -0,0 +1,61 @@
+import threading
+import time
+import os
+
+# How long a loaded flavor catalog is trusted before it is reloaded
+FLAVOR_CACHE_TTL = float(os.getenv('OS_FLAVOR_CACHE_TTL', '300'))
+
+# Minimum gap between reloads triggered by lookups of unknown flavors
+MIN_RELOAD_INTERVAL = float(os.getenv('OS_FLAVOR_MIN_RELOAD_INTERVAL', '10'))
+
+
+class FlavorCatalog:
+    """In-memory TTL cache of all flavors, indexed by id and by name"""
+
+    def __init__(self, loader, ttl=FLAVOR_CACHE_TTL):
+        # loader returns every flavor in one call, e.g. flavors.list(detailed=True)
+        self._loader = loader
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_name = {}
+        self._loaded_at = None
+
+    def _expired(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self._ttl
+
+    def refresh(self, force=False):
+        """Reload the catalog if it expired (or unconditionally when forced)"""
+        with self._lock:
+            if not force and not self._expired():
+                return
+            if force and self._loaded_at is not None and time.monotonic() - self._loaded_at < MIN_RELOAD_INTERVAL:
+                return
+
+            flavors = list(self._loader())
+            # Swap in complete indexes so readers never see a partial catalog
+            self._by_id = {f.id: f for f in flavors}
+            self._by_name = {f.name: f for f in flavors}
+            self._loaded_at = time.monotonic()
+
+    def _lookup(self, key):
+        return self._by_id.get(key) or self._by_name.get(key)
+
+    def get(self, key):
+        """Return the flavor with the given id or name"""
+        if self._expired():
+            self.refresh()
+
+        flavor = self._lookup(key)
+        if flavor is None:
+            # The flavor may have been created since the last load
+            self.refresh(force=True)
+            flavor = self._lookup(key)
+        if flavor is None:
+            raise Exception(f"Flavor {key} not found")
+        return flavor
+
+    def invalidate(self):
+        """Force the next lookup to reload the catalog"""
+        with self._lock:
+            self._loaded_at = None
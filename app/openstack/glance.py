@@ -0,0 +1,31 @@
+import os
+from .auth import get_session
+from .images import ImageCatalog, from_glance
+from app.metrics import instrument
+
+# Images per Glance listing page
+IMAGE_PAGE_SIZE = int(os.getenv('OS_IMAGE_PAGE_SIZE', '500'))
+
+def fetch_images(etag=None):
+    """List active Glance images; returns (images, etag), with images None if unchanged since etag"""
+    sess = get_session()
+    url = f"/v2/images?status=active&limit={IMAGE_PAGE_SIZE}"
+    headers = {"If-None-Match": etag} if etag else {}
+    response = sess.get(url, endpoint_filter={"service_type": "image"}, headers=headers)
+    if response.status_code == 304:
+        return None, etag
+    new_etag = response.headers.get("ETag")
+
+    images = []
+    while True:
+        body = response.json()
+        images.extend(from_glance(image) for image in body["images"])
+        if not body.get("next"):
+            return images, new_etag
+        response = sess.get(body["next"], endpoint_filter={"service_type": "image"})
+
+# Record the latency of every public function above
+instrument(globals(), "glance")
+
+# Shared image catalog, revalidated in the background once loaded
+image_catalog = ImageCatalog(fetch_images)
@@ -0,0 +1,162 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+# How long the image catalog is served before it is revalidated
+IMAGE_CACHE_TTL = float(os.getenv('OS_IMAGE_CACHE_TTL', '300'))
+
+# Minimum gap between reloads triggered by lookups of unknown images
+MIN_RELOAD_INTERVAL = float(os.getenv('OS_IMAGE_MIN_RELOAD_INTERVAL', '10'))
+
+# Default image for new VMs: selectors (id:, name:, os:, tag:) tried in
+# order; the newest active image matching the first one that matches wins
+DEFAULT_IMAGE_POLICY = os.getenv('OS_DEFAULT_IMAGE', 'tag:default,os:ubuntu')
+
+Image = namedtuple("Image", ["id", "name", "os_distro", "os_version", "tags", "created_at"])
+
+logger = logging.getLogger(__name__)
+
+
+def from_glance(body):
+    """Build an Image from a Glance v2 image record"""
+    return Image(
+        id=body["id"],
+        name=body.get("name") or "",
+        os_distro=(body.get("os_distro") or "").lower(),
+        os_version=(body.get("os_version") or "").lower(),
+        tags=tuple(t.lower() for t in body.get("tags") or ()),
+        created_at=body.get("created_at") or "",
+    )
+
+
+def _newest(images):
+    return max(images, key=lambda image: image.created_at) if images else None
+
+
+class ImageCatalog:
+    """Cached catalog of active images, indexed by id, name, OS and tag.
+
+    Once loaded, lookups of known images never wait for Glance: an expired
+    catalog keeps serving while one background refresh revalidates it with
+    If-None-Match.
+    """
+
+    def __init__(self, fetch, ttl=IMAGE_CACHE_TTL, policy=DEFAULT_IMAGE_POLICY):
+        # fetch(etag) returns (images or None if unchanged, etag)
+        self._fetch = fetch
+        self._ttl = ttl
+        self._policy = policy
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._etag = None
+        self._by_id = {}
+        self._by_name = {}
+        self._by_os = {}
+        self._by_tag = {}
+        self._default = None
+        self._loaded_at = None
+
+    def _expired(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self._ttl
+
+    def refresh(self, force=False):
+        """Revalidate the catalog if it expired (or unconditionally when forced)"""
+        with self._lock:
+            if not force and not self._expired():
+                return
+            if force and self._loaded_at is not None and time.monotonic() - self._loaded_at < MIN_RELOAD_INTERVAL:
+                return
+
+            images, self._etag = self._fetch(self._etag)
+            if images is not None:
+                self._build(images)
+            self._loaded_at = time.monotonic()
+
+    def _build(self, images):
+        by_name, by_os, by_tag = {}, {}, {}
+        for image in images:
+            by_name.setdefault(image.name.lower(), []).append(image)
+            if image.os_distro:
+                by_os.setdefault(image.os_distro, []).append(image)
+                if image.os_version:
+                    by_os.setdefault(f"{image.os_distro}-{image.os_version}", []).append(image)
+            for tag in image.tags:
+                by_tag.setdefault(tag, []).append(image)
+        # Swap in complete indexes so readers never see a partial catalog
+        self._by_id = {image.id: image for image in images}
+        self._by_name = by_name
+        self._by_os = by_os
+        self._by_tag = by_tag
+        self._default = self.select(self._policy) or _newest(images)
+
+    def refresh_in_background(self):
+        """Start a refresh on a thread unless one is already running"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="image-catalog", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error("Image catalog refresh failed: %s", e)
+        finally:
+            self._refreshing = False
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            self.refresh()
+        elif self._expired():
+            self.refresh_in_background()
+
+    def _candidates(self, kind, value):
+        value = value.lower()
+        if kind == "id":
+            image = self._by_id.get(value)
+            return [image] if image else []
+        if kind == "name":
+            return self._by_name.get(value, [])
+        if kind == "os":
+            return self._by_os.get(value, [])
+        if kind == "tag":
+            return self._by_tag.get(value, [])
+        raise ValueError(f"Unknown image selector {kind}:")
+
+    def select(self, policy):
+        """Newest image matching the first selector in policy that matches any"""
+        for selector in policy.split(","):
+            kind, _, value = selector.strip().partition(":")
+            image = _newest(self._candidates(kind, value))
+            if image is not None:
+                return image
+        return None
+
+    def _lookup(self, key):
+        for kind in ("id", "name", "os", "tag"):
+            image = _newest(self._candidates(kind, key))
+            if image is not None:
+                return image
+        return None
+
+    def get(self, key):
+        """Return the image with the given id or name, or the newest for an OS or tag"""
+        self._ensure_loaded()
+        image = self._lookup(key)
+        if image is None:
+            # The image may have been uploaded since the last load
+            self.refresh(force=True)
+            image = self._lookup(key)
+        if image is None:
+            raise Exception(f"Image {key} not found")
+        return image
+
+    def default(self):
+        """Return the image the selection policy picks for new VMs"""
+        self._ensure_loaded()
+        if self._default is None:
+            raise Exception("No images available")
+        return self._default
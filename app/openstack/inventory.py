@@ -0,0 +1,147 @@
+import datetime
+import logging
+import os
+import threading
+import time
+
+# How long the index is trusted before a lookup brings it up to date
+INVENTORY_TTL = float(os.getenv('OS_INVENTORY_TTL', '10'))
+
+# Seconds between full reloads, which catch deletions that incremental
+# listings do not report
+INVENTORY_FULL_REFRESH = float(os.getenv('OS_INVENTORY_FULL_REFRESH', '600'))
+
+# Minimum gap between refreshes triggered by lookups of unknown names
+MIN_RELOAD_INTERVAL = float(os.getenv('OS_INVENTORY_MIN_RELOAD_INTERVAL', '2'))
+
+# Incremental listings reach back this far before the last one started, so
+# clock skew between us and the API never loses a change
+CHANGES_OVERLAP = datetime.timedelta(seconds=60)
+
+logger = logging.getLogger(__name__)
+
+
+class NameIndex:
+    """Name -> id index of one kind of project resource.
+
+    list_all() yields (id, name) for every resource. list_changed(since), if
+    given, yields (id, name, deleted) for resources changed since a UTC
+    datetime (a changes-since listing) and keeps the index current between
+    full reloads. Our own creates and deletes update the index directly.
+    """
+
+    def __init__(self, kind, list_all, list_changed=None, ttl=INVENTORY_TTL, full_interval=INVENTORY_FULL_REFRESH):
+        self.kind = kind
+        self._list_all = list_all
+        self._list_changed = list_changed
+        self._ttl = ttl
+        self._full_interval = full_interval
+        self._lock = threading.Lock()
+        # Values are frozensets (names are not unique) replaced rather than
+        # mutated, so lookups never need the lock
+        self._ids_by_name = {}
+        self._name_by_id = {}
+        self._synced_at = None
+        self._checked_at = None
+        self._full_at = None
+
+    def _stale(self):
+        return self._checked_at is None or time.monotonic() - self._checked_at > self._ttl
+
+    def _put(self, resource_id, name):
+        self._drop(resource_id)
+        self._name_by_id[resource_id] = name
+        self._ids_by_name[name] = self._ids_by_name.get(name, frozenset()) | {resource_id}
+
+    def _drop(self, resource_id):
+        name = self._name_by_id.pop(resource_id, None)
+        if name is None:
+            return
+        ids = self._ids_by_name.get(name, frozenset()) - {resource_id}
+        if ids:
+            self._ids_by_name[name] = ids
+        else:
+            self._ids_by_name.pop(name, None)
+
+    def refresh(self, full=False, min_interval=0, if_stale=False):
+        """Apply changes since the last refresh, or reload everything when due or asked.
+
+        With if_stale, callers that waited for the lock return at once when
+        the refresh they were waiting for already happened.
+        """
+        with self._lock:
+            if if_stale and not self._stale():
+                return
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < min_interval:
+                return
+            started = datetime.datetime.utcnow()
+            full = full or self._list_changed is None or self._full_at is None or now - self._full_at > self._full_interval
+            if not full:
+                try:
+                    changes = list(self._list_changed(self._synced_at - CHANGES_OVERLAP))
+                except Exception as e:
+                    # e.g. the API does not support the changes-since filter
+                    logger.warning("Incremental %s listing failed, reloading: %s", self.kind, e)
+                    full = True
+            if full:
+                ids_by_name = {}
+                name_by_id = {}
+                for resource_id, name in self._list_all():
+                    name_by_id[resource_id] = name
+                    ids_by_name[name] = ids_by_name.get(name, frozenset()) | {resource_id}
+                # Swap in complete indexes so readers never see a partial inventory
+                self._ids_by_name = ids_by_name
+                self._name_by_id = name_by_id
+                self._full_at = now
+            else:
+                for resource_id, name, deleted in changes:
+                    if deleted:
+                        self._drop(resource_id)
+                    else:
+                        self._put(resource_id, name)
+            self._synced_at = started
+            self._checked_at = time.monotonic()
+
+    def ids(self, name):
+        """Ids of every resource called name, possibly none"""
+        if self._stale():
+            self.refresh(if_stale=True)
+        return self._ids_by_name.get(name, frozenset())
+
+    def get_id(self, name):
+        """Return the id of the one resource called name"""
+        ids = self.ids(name)
+        if not ids:
+            # It may have been created elsewhere since the last refresh
+            self.refresh(min_interval=MIN_RELOAD_INTERVAL)
+            ids = self._ids_by_name.get(name, frozenset())
+        if not ids:
+            raise Exception(f"No {self.kind} named {name}")
+        if len(ids) > 1:
+            raise Exception(f"Multiple {self.kind}s named {name}")
+        return next(iter(ids))
+
+    def call(self, name, fn, not_found):
+        """Return fn(id) for the resource called name.
+
+        If fn raises not_found the index was stale: the id is dropped, the
+        index refreshed and the name resolved once more before giving up.
+        """
+        resource_id = self.get_id(name)
+        try:
+            return fn(resource_id)
+        except not_found:
+            self.remove(resource_id)
+        self.refresh()
+        return fn(self.get_id(name))
+
+    def add(self, resource_id, name):
+        """Record a resource we just created"""
+        with self._lock:
+            self._put(resource_id, name)
+
+    def remove(self, resource_id):
+        """Forget a resource we just deleted"""
+        with self._lock:
+            self._drop(resource_id)
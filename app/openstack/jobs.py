@@ -0,0 +1,406 @@
+import asyncio
+import collections
+import contextvars
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from app.models.database import SessionLocal
+from app.models.models import ProvisioningJob
+from app import metrics, tracing
+from . import nova, cinder, neutron, networks, bulk, plans
+
+# Jobs run (and poll) concurrently on this many threads
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '32'))
+
+# Resource status polling backs off exponentially between these bounds
+JOB_POLL_INITIAL = float(os.getenv('JOB_POLL_INITIAL', '1'))
+JOB_POLL_MAX = float(os.getenv('JOB_POLL_MAX', '30'))
+
+# A job whose resource has not settled after this many seconds fails
+JOB_TIMEOUT = float(os.getenv('JOB_TIMEOUT', '1800'))
+
+# Each worker refreshes updated_at of its queued and running jobs this often.
+# A queued or running job left unrefreshed for JOB_STALE_AFTER seconds was
+# orphaned by a crashed worker and is failed, which also frees its
+# idempotency key once the window has passed
+JOB_HEARTBEAT = float(os.getenv('JOB_HEARTBEAT', '30'))
+JOB_STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', '120'))
+
+# A repeated confirmation returns the job recorded under its idempotency key
+# while it runs and for this many seconds after it was created. Requests
+# without a key get one derived from the operation and parameters, which
+# only catches double clicks and retries, so it expires much sooner
+IDEMPOTENCY_WINDOW = float(os.getenv('IDEMPOTENCY_WINDOW', '86400'))
+IDEMPOTENCY_DERIVED_WINDOW = float(os.getenv('IDEMPOTENCY_DERIVED_WINDOW', '30'))
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+
+# Operation name of a job that runs several steps as a dependency graph
+PLAN = "plan"
+
+logger = logging.getLogger(__name__)
+
+
+class OperationFailed(Exception):
+    """The operation's resource failed, timed out or some of its items failed"""
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a different operation or parameters"""
+
+
+# start(parameters) performs the API call and returns (resource id, result);
+# poll(resource id) returns the resource status, which the job waits on
+# until it is in done or failed. Operations without poll finish with start,
+# failing if result lists failed items
+Operation = collections.namedtuple("Operation", ["start", "poll", "done", "failed", "accepted", "completed"])
+
+
+def _create_vm(p):
+    server = nova.create_vm(p.get("name"), p.get("flavor"), p.get("image"), p.get("networks"))
+    return server.id, {"id": server.id, "name": p.get("name")}
+
+
+def _resize_vm(p):
+    server = nova.resize_vm(p.get("name"), p.get("flavor"))
+    return server.id, {"id": server.id, "name": p.get("name")}
+
+
+def _delete_vm(p):
+    result = nova.delete_vm(p.get("name"))
+    return result["id"], result
+
+
+def _bulk_names(p):
+    return bulk.resolve_names(p.get("name"), p.get("count"), p.get("names"))
+
+
+def _bulk_create_vm(p):
+    return None, nova.create_vms(_bulk_names(p), p.get("flavor"), p.get("image"))
+
+
+def _bulk_create_volume(p):
+    return None, cinder.create_volumes(_bulk_names(p), p.get("size"))
+
+
+def _create_network(p):
+    result = asyncio.run(networks.create_network(p.get("name")))
+    return result["network"]["id"], result
+
+
+def _attach_volume(p):
+    volume_id = nova.attach_volume(p.get("server"), p.get("volume"))
+    return volume_id, {"server": p.get("server"), "volume": p.get("volume")}
+
+
+def _create_volume(p):
+    volume = cinder.create_volume(p.get("name"), p.get("size"))
+    return volume.id, {"id": volume.id, "name": p.get("name"), "size": p.get("size")}
+
+
+def _delete_volume(p):
+    result = cinder.delete_volume(p.get("name"))
+    return result["id"], result
+
+
+OPERATIONS = {
+    "create_vm": Operation(_create_vm, nova.get_server_status, {"ACTIVE"}, {"ERROR"},
+                           "VM {name} is being created", "VM {name} is active"),
+    "resize_vm": Operation(_resize_vm, nova.get_server_status, {"VERIFY_RESIZE"}, {"ERROR"},
+                           "VM {name} is being resized to {flavor}", "VM {name} has been resized to {flavor}"),
+    "delete_vm": Operation(_delete_vm, nova.get_server_status, {"DELETED"}, {"ERROR"},
+                           "VM {name} is being deleted", "VM {name} has been deleted"),
+    "bulk_create_vm": Operation(_bulk_create_vm, None, None, None,
+                                "{count} VMs named {name} are being created",
+                                "Created {created} of {requested} VMs ({existing} already existed, {failed_count} failed)"),
+    "create_network": Operation(_create_network, neutron.get_network_status, {"ACTIVE"}, {"ERROR"},
+                                "Network {name} is being created", "Network {name} has been created"),
+    "create_volume": Operation(_create_volume, cinder.get_volume_status, {"available"}, {"error"},
+                               "Volume {name} is being created", "Volume {name} is available"),
+    "bulk_create_volume": Operation(_bulk_create_volume, None, None, None,
+                                    "{count} volumes named {name} are being created",
+                                    "Created {created} of {requested} volumes ({existing} already existed, {failed_count} failed)"),
+    "attach_volume": Operation(_attach_volume, cinder.get_volume_status, {"in-use"}, {"error", "error_attaching"},
+                               "Volume {volume} is being attached to {server}", "Volume {volume} is attached to {server}"),
+    "delete_volume": Operation(_delete_volume, cinder.get_volume_status, {"deleted"}, {"error_deleting"},
+                               "Volume {name} is being deleted", "Volume {name} has been deleted"),
+}
+
+
+def describe(template, parameters):
+    """Fill a message template from the job parameters, leaving missing ones blank"""
+    return template.format_map(collections.defaultdict(str, parameters))
+
+
+def derive_key(operation, parameters):
+    """Idempotency key for a request that did not send one"""
+    body = json.dumps([operation, parameters], sort_keys=True, separators=(",", ":"))
+    return "derived:" + hashlib.sha256(body.encode()).hexdigest()
+
+
+def to_dict(job):
+    return {
+        "id": job.id,
+        "operation": job.operation,
+        "parameters": job.parameters,
+        "status": job.status,
+        "resource_id": job.resource_id,
+        "resource_status": job.resource_status,
+        "message": job.message,
+        "result": job.result,
+        "idempotency_key": job.idempotency_key,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+class JobRunner:
+    """Run confirmed operations in the background and track them in provisioning_jobs.
+
+    Job state lives in the database, so any uvicorn worker can report on a
+    job started by another. Once started, a runner heartbeats its own jobs
+    and fails other workers' jobs whose heartbeat stopped.
+    """
+
+    def __init__(self, session_factory=SessionLocal, workers=JOB_WORKERS, poll_initial=JOB_POLL_INITIAL,
+                 poll_max=JOB_POLL_MAX, timeout=JOB_TIMEOUT, idempotency_window=IDEMPOTENCY_WINDOW,
+                 derived_window=IDEMPOTENCY_DERIVED_WINDOW, heartbeat=JOB_HEARTBEAT, stale_after=JOB_STALE_AFTER):
+        self._session_factory = session_factory
+        self._idempotency_window = idempotency_window
+        self._derived_window = derived_window
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._poll_initial = poll_initial
+        self._poll_max = poll_max
+        self._timeout = timeout
+        self._heartbeat = heartbeat
+        self._stale_after = stale_after
+        self._stopping = threading.Event()
+        # Ids of this runner's jobs that have not finished
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._heartbeat_thread = None
+
+    def start(self):
+        """Fail jobs orphaned by a crashed worker, then heartbeat this runner's jobs on a background thread"""
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = threading.Thread(target=self._run_heartbeat, name="job-heartbeat", daemon=True)
+            self._heartbeat_thread.start()
+
+    def _run_heartbeat(self):
+        while True:
+            try:
+                self._touch()
+                recovered = self.recover()
+                if recovered:
+                    logger.warning("Failed %d jobs orphaned by a stopped worker", recovered)
+            except Exception as e:
+                logger.error("Job heartbeat failed: %s", e)
+            if self._stopping.wait(self._heartbeat):
+                return
+
+    def _touch(self):
+        """Refresh updated_at of this runner's unfinished jobs"""
+        with self._active_lock:
+            job_ids = list(self._active)
+        if not job_ids:
+            return
+        db = self._session_factory()
+        try:
+            db.query(ProvisioningJob).filter(
+                ProvisioningJob.id.in_(job_ids), ProvisioningJob.status.notin_(TERMINAL_STATUSES)
+            ).update({"updated_at": datetime.datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def recover(self):
+        """Fail queued or running jobs nobody has heartbeated for stale_after seconds; returns how many"""
+        now = datetime.datetime.utcnow()
+        db = self._session_factory()
+        try:
+            count = db.query(ProvisioningJob).filter(
+                ProvisioningJob.status.notin_(TERMINAL_STATUSES),
+                ProvisioningJob.updated_at < now - datetime.timedelta(seconds=self._stale_after),
+            ).update({
+                "status": "failed",
+                "message": "The server running this job stopped before it finished",
+                "updated_at": now,
+            }, synchronize_session=False)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def submit(self, operation, parameters, idempotency_key=None):
+        """Record a queued job and start it; returns the job as a dict.
+
+        If a job was already recorded under the idempotency key (derived
+        from the request when none is given) and is still running or inside
+        the window, that job is returned with "duplicate": True instead.
+        """
+        if operation == PLAN:
+            plans.validate(parameters["steps"])
+            unknown = {step["operation"] for step in parameters["steps"]} - OPERATIONS.keys()
+            if unknown:
+                raise ValueError(f"Unknown plan operations: {', '.join(sorted(unknown))}")
+            accepted = f"Running a {len(parameters['steps'])}-step plan"
+        else:
+            accepted = describe(OPERATIONS[operation].accepted, parameters)
+        key = idempotency_key or derive_key(operation, parameters)
+        window = self._idempotency_window if idempotency_key else self._derived_window
+
+        db = self._session_factory()
+        try:
+            # Each pass either reuses the key's job or inserts a new one; an
+            # insert only fails when a concurrent request took the key first,
+            # and the next pass finds its job
+            while True:
+                existing = db.query(ProvisioningJob).filter(ProvisioningJob.idempotency_key == key).one_or_none()
+                if existing is not None:
+                    expires = existing.created_at + datetime.timedelta(seconds=window)
+                    if existing.status not in TERMINAL_STATUSES or datetime.datetime.utcnow() < expires:
+                        if existing.operation != operation or existing.parameters != parameters:
+                            raise IdempotencyConflict(
+                                f"Idempotency key {key} was already used for a different {existing.operation} request")
+                        return {**to_dict(existing), "duplicate": True}
+                    # Expired: free the key for the new job
+                    existing.idempotency_key = None
+                    db.flush()
+                job = ProvisioningJob(
+                    id=uuid.uuid4().hex,
+                    operation=operation,
+                    parameters=parameters,
+                    status="queued",
+                    message=accepted,
+                    idempotency_key=key
+                )
+                db.add(job)
+                try:
+                    db.commit()
+                    break
+                except IntegrityError:
+                    db.rollback()
+            result = to_dict(job)
+        finally:
+            db.close()
+        if operation == PLAN:
+            run = functools.partial(self._run_plan, result["id"], parameters)
+        else:
+            run = functools.partial(self._run, result["id"], OPERATIONS[operation], parameters)
+        with self._active_lock:
+            self._active.add(result["id"])
+        # The job's spans continue the trace of the request that confirmed it
+        future = self._executor.submit(contextvars.copy_context().run, self._traced, operation, result["id"], run)
+        future.add_done_callback(functools.partial(self._finished, result["id"]))
+        return result
+
+    def _finished(self, job_id, future):
+        with self._active_lock:
+            self._active.discard(job_id)
+        if future.cancelled():
+            self._update(job_id, status="failed", message="Server shut down before the job started")
+
+    @staticmethod
+    def _traced(operation, job_id, run):
+        with tracing.span(f"job {operation}", **{"job.id": job_id}):
+            run()
+
+    def get(self, job_id):
+        """Return the job as a dict, or None if it does not exist"""
+        db = self._session_factory()
+        try:
+            job = db.get(ProvisioningJob, job_id)
+            return to_dict(job) if job else None
+        finally:
+            db.close()
+
+    def _update(self, job_id, **fields):
+        db = self._session_factory()
+        try:
+            with metrics.db_write_seconds.labels("jobs").time():
+                fields["updated_at"] = datetime.datetime.utcnow()
+                db.query(ProvisioningJob).filter(ProvisioningJob.id == job_id).update(fields)
+                db.commit()
+        finally:
+            db.close()
+
+    def _run(self, job_id, spec, parameters):
+        try:
+            self._update(job_id, status="running")
+            message = self._execute(spec, parameters, functools.partial(self._update, job_id))
+            self._update(job_id, status="succeeded", message=message)
+        except Exception as e:
+            self._update(job_id, status="failed", message=str(e))
+
+    def _execute(self, spec, parameters, record):
+        """Start the operation and wait for its resource to settle; returns the completion message.
+
+        record(**fields) receives resource_id, result and resource_status as
+        they become known. Raises OperationFailed if the operation fails.
+        """
+        resource_id, result = spec.start(parameters)
+        record(resource_id=resource_id, result=result)
+        if spec.poll is None:
+            message = describe(spec.completed, {**parameters, **result})
+            if result.get("failed"):
+                # Confirming the same request again retries only the failed items
+                raise OperationFailed(message)
+            return message
+        self._wait(spec, resource_id, record)
+        return describe(spec.completed, parameters)
+
+    def _wait(self, spec, resource_id, record):
+        """Poll the resource with exponential backoff until it is done, failed or timed out"""
+        deadline = time.monotonic() + self._timeout
+        delay = self._poll_initial
+        last_status = None
+        while time.monotonic() < deadline:
+            if self._stopping.wait(delay):
+                raise OperationFailed("Server shut down before the job finished")
+            status = spec.poll(resource_id)
+            if status != last_status:
+                record(resource_status=status)
+                last_status = status
+            if status in spec.done:
+                return
+            if status in spec.failed:
+                raise OperationFailed(f"Resource {resource_id} went to {status}")
+            delay = min(delay * 2, self._poll_max)
+        raise OperationFailed(f"Timed out after {self._timeout:.0f}s waiting for the resource")
+
+    def _run_plan(self, job_id, parameters):
+        """Run a plan's steps as a DAG, recording each step's progress in the job's result"""
+        def publish(states):
+            self._update(job_id, result={"steps": [dict(state) for state in states]})
+
+        def run_step(step):
+            return self._execute(OPERATIONS[step["operation"]], step["parameters"], lambda **fields: None)
+
+        try:
+            self._update(job_id, status="running")
+            states = plans.execute(parameters["steps"], run_step, on_change=publish)
+            failed = [state["id"] for state in states if state["status"] != "succeeded"]
+            if failed:
+                self._update(job_id, status="failed",
+                             message=f"{len(states) - len(failed)} of {len(states)} steps succeeded; "
+                                     f"steps {', '.join(failed)} did not")
+            else:
+                self._update(job_id, status="succeeded", message=f"All {len(states)} steps succeeded")
+        except Exception as e:
+            self._update(job_id, status="failed", message=str(e))
+
+    def shutdown(self):
+        """Stop polling and let running jobs record that they were interrupted; queued jobs fail without starting"""
+        self._stopping.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+runner = JobRunner()
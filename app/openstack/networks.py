@@ -0,0 +1,129 @@
+import asyncio
+import os
+import threading
+import time
+from . import neutron, aio
+from .cidr import CidrAllocator
+from app.metrics import instrument
+
+# New networks get a /OS_SUBNET_PREFIXLEN subnet from this pool
+SUBNET_POOL = os.getenv('OS_SUBNET_POOL', '10.0.0.0/8')
+SUBNET_PREFIXLEN = int(os.getenv('OS_SUBNET_PREFIXLEN', '24'))
+
+# Seconds before the allocator is re-seeded from list_subnets, picking up
+# subnets created or deleted by other workers and other clients
+CIDR_RESEED_INTERVAL = float(os.getenv('OS_CIDR_RESEED_INTERVAL', '300'))
+
+# Router each new subnet is attached to; none when unset
+ROUTER_ID = os.getenv('OS_ROUTER_ID')
+
+DNS_NAMESERVERS = [ns for ns in os.getenv('OS_DNS_NAMESERVERS', '').split(',') if ns]
+
+# Ports Neutron removes itself along with the subnet
+_AUTO_PORT_OWNERS = {"network:dhcp"}
+_ROUTER_PORT_OWNERS = {"network:router_interface", "network:router_interface_distributed", "network:ha_router_replicated_interface"}
+
+allocator = CidrAllocator(SUBNET_POOL, SUBNET_PREFIXLEN)
+_seed_lock = threading.Lock()
+_seeded_at = None
+
+
+def seed_allocator(force=False):
+    """Mark every existing subnet used, at most once per CIDR_RESEED_INTERVAL unless forced"""
+    global _seeded_at
+    with _seed_lock:
+        if not force and _seeded_at is not None and time.monotonic() - _seeded_at < CIDR_RESEED_INTERVAL:
+            return
+        subnets = neutron.get_neutron_client().list_subnets(fields=['cidr'])['subnets']
+        allocator.reset(s['cidr'] for s in subnets)
+        _seeded_at = time.monotonic()
+
+
+async def create_network(name, request=None):
+    """Create a network with a subnet from the pool, attached to ROUTER_ID when set.
+
+    The network is created while the allocator is (re)seeded; the subnet and
+    router interface follow as soon as their inputs exist. A failed seed,
+    allocation, subnet or router interface rolls the network back.
+    """
+    client = neutron.get_neutron_client()
+    body = {'network': {'name': name, 'admin_state_up': True}}
+    network, seeded = await asyncio.gather(
+        aio.call("neutron", client.create_network, body=body, request=request),
+        aio.call("neutron", seed_allocator, request=request),
+        return_exceptions=True,
+    )
+    if isinstance(network, BaseException):
+        raise network
+    network = network['network']
+    neutron.networks_index.add(network['id'], name)
+
+    cidr = None
+    try:
+        if isinstance(seeded, BaseException):
+            raise seeded
+        cidr = allocator.allocate()
+        subnet_body = {
+            'subnet': {
+                'name': f"{name}-subnet",
+                'network_id': network['id'],
+                'ip_version': 4,
+                'cidr': cidr,
+                'dns_nameservers': DNS_NAMESERVERS,
+            }
+        }
+        subnet = (await aio.call("neutron", client.create_subnet, subnet_body))['subnet']
+        result = {'network': network, 'subnet': subnet}
+        if ROUTER_ID:
+            result['router_interface'] = await aio.call(
+                "neutron", client.add_interface_router, ROUTER_ID, {'subnet_id': subnet['id']}
+            )
+    except Exception:
+        if cidr is not None:
+            allocator.release(cidr)
+        # Deleting the network deletes its subnet too
+        await aio.call("neutron", client.delete_network, network['id'])
+        neutron.networks_index.remove(network['id'])
+        raise
+    allocator.confirm(cidr)
+    return result
+
+
+async def _remove_port(client, port):
+    if port['device_owner'] in _ROUTER_PORT_OWNERS:
+        # Router interfaces can only be removed through their router
+        await aio.call("neutron", client.remove_interface_router, port['device_id'], {'port_id': port['id']})
+    else:
+        await aio.call("neutron", client.delete_port, port['id'])
+
+
+async def delete_network(name, request=None):
+    """Delete a network by name, detaching routers and deleting ports and subnets concurrently.
+
+    Ports bound to servers are left alone, so a network still in use by a
+    VM fails to delete as before.
+    """
+    client = neutron.get_neutron_client()
+    network = await aio.call(
+        "neutron", neutron.networks_index.call, name,
+        lambda network_id: client.show_network(network_id)['network'], neutron.neutron_exceptions.NotFound,
+        request=request,
+    )
+    ports, subnets = await asyncio.gather(
+        aio.call("neutron", client.list_ports, network_id=network['id'], fields=['id', 'device_owner', 'device_id']),
+        aio.call("neutron", client.list_subnets, network_id=network['id'], fields=['id', 'cidr']),
+    )
+    await asyncio.gather(*(
+        _remove_port(client, port) for port in ports['ports']
+        if port['device_owner'] not in _AUTO_PORT_OWNERS and not port['device_owner'].startswith("compute:")
+    ))
+    await asyncio.gather(*(aio.call("neutron", client.delete_subnet, s['id']) for s in subnets['subnets']))
+    await aio.call("neutron", client.delete_network, network['id'])
+
+    neutron.networks_index.remove(network['id'])
+    for subnet in subnets['subnets']:
+        allocator.release(subnet['cidr'])
+    return {"status": "deleted", "name": name}
+
+# Record the latency of every public function above
+instrument(globals(), "neutron")
@@ -1,49 +1,34 @@
 from neutronclient.v2_0 import client as neutron_client
-from .auth import get_session
+from neutronclient.common import exceptions as neutron_exceptions
+from .auth import get_client
+from .inventory import NameIndex
+from app.metrics import instrument
 
 def get_neutron_client():
-    """Return an authenticated Neutron client"""
-    return neutron_client.Client(session=get_session())
+    """Return the shared authenticated Neutron client"""
+    return get_client("neutron", lambda sess: neutron_client.Client(session=sess))
 
-def create_network(name):
-    """Create a private network with the given name"""
-    client = get_neutron_client()
-    body = {
-        'network': {
-            'name': name,
-            'admin_state_up': True
-        }
-    }
-    network = client.create_network(body=body)
-    
-    # Create a subnet for the network
-    subnet_body = {
-        'subnet': {
-            'name': f"{name}-subnet",
-            'network_id': network['network']['id'],
-            'ip_version': 4,
-            'cidr': '192.168.1.0/24'
-        }
-    }
-    subnet = client.create_subnet(subnet_body)
-    
-    return {
-        'network': network['network'],
-        'subnet': subnet['subnet']
-    }
+def _all_networks():
+    networks = get_neutron_client().list_networks(fields=['id', 'name'])['networks']
+    return ((n['id'], n['name']) for n in networks)
+
+def _changed_networks(since):
+    # changed_since does not report deletions; full reloads catch those
+    networks = get_neutron_client().list_networks(
+        changed_since=since.isoformat(timespec="seconds"), fields=['id', 'name']
+    )['networks']
+    return ((n['id'], n['name'], False) for n in networks)
 
-def delete_network(name):
-    """Delete a network by name"""
+# Network names resolved without a filtered listing per lookup
+networks_index = NameIndex("network", _all_networks, _changed_networks)
+
+def get_network_status(network_id):
+    """Return a network's status, or DELETED once it no longer exists"""
     client = get_neutron_client()
-    networks = client.list_networks(name=name)['networks']
-    if not networks:
-        raise Exception(f"Network {name} not found")
-    network = networks[0]
-    
-    # Delete all subnets first
-    for subnet_id in network['subnets']:
-        client.delete_subnet(subnet_id)
-    
-    # Delete the network
-    client.delete_network(network['id'])
-    return {"status": "deleted", "name": name}
+    try:
+        return client.show_network(network_id)['network']['status']
+    except neutron_exceptions.NotFound:
+        return "DELETED"
+
+# Record the latency of every public function above
+instrument(globals(), "neutron")
@@ -1,41 +1,141 @@
+import os
 from novaclient import client as nova_client
-from .auth import get_session
+from novaclient import exceptions as nova_exceptions
+from .auth import get_client
+from .flavors import FlavorCatalog
+from .inventory import NameIndex
+from .glance import image_catalog
+from . import bulk, cinder, neutron
+from app.metrics import instrument
+
+# Create p-1 .. p-N with one min_count/max_count request when the names allow it
+BULK_MULTI_CREATE = os.getenv('BULK_MULTI_CREATE', '1') == '1'
 
 def get_nova_client():
-    """Return an authenticated Nova client"""
-    return nova_client.Client(2, session=get_session())
+    """Return the shared authenticated Nova client"""
+    return get_client("nova", lambda sess: nova_client.Client(2, session=sess))
+
+# Shared flavor catalog, loaded with a single detailed listing
+flavor_catalog = FlavorCatalog(lambda: get_nova_client().flavors.list(detailed=True, is_public=None))
+
+def _all_servers():
+    return ((s.id, s.name) for s in get_nova_client().servers.list(detailed=False, limit=-1))
+
+def _changed_servers(since):
+    # changes-since also returns servers deleted in the window, as DELETED
+    servers = get_nova_client().servers.list(search_opts={"changes-since": since.isoformat(timespec="seconds")}, limit=-1)
+    return ((s.id, s.name, s.status == "DELETED") for s in servers)
+
+# Server names resolved without listing every server
+servers_index = NameIndex("server", _all_servers, _changed_servers)
+
+def get_flavor(id_or_name):
+    """Return a flavor by id or name from the cached catalog"""
+    return flavor_catalog.get(id_or_name)
 
-def create_vm(name, flavor_name):
-    """Create a VM with the specified name and flavor"""
+def get_image(id_or_name=None):
+    """Return an image by id, name, OS or tag, or the policy's default image, from the cached catalog"""
+    return image_catalog.get(id_or_name) if id_or_name else image_catalog.default()
+
+def create_vm(name, flavor_name, image_name=None, networks=None):
+    """Create a VM with the specified name and flavor, booting the named or default image on the named networks"""
     client = get_nova_client()
-    flavor = client.flavors.find(name=flavor_name)
-    
-    # Get the first available image (update this logic as needed)
-    images = list(client.images.list())
-    if not images:
-        raise Exception("No images available")
-    image = images[0]
+    flavor = get_flavor(flavor_name)
+    image = get_image(image_name)
+    nics = [{"net-id": neutron.networks_index.get_id(network)} for network in networks or ()]
     
-    instance = client.servers.create(name=name, flavor=flavor.id, image=image.id)
+    instance = client.servers.create(name=name, flavor=flavor.id, image=image.id, nics=nics or None)
+    servers_index.add(instance.id, name)
     return instance
 
+def find_servers(names):
+    """Map each of names that exists as a server to its id, from a freshly updated index"""
+    servers_index.refresh()
+    found = {}
+    for name in names:
+        ids = servers_index.ids(name)
+        if ids:
+            found[name] = min(ids)
+    return found
+
+def create_vms(names, flavor_name, image_name=None, concurrency=bulk.BULK_CONCURRENCY):
+    """Create a VM for each of names with one flavor and image lookup; returns bulk.summarize()
+
+    Servers that already exist are skipped, so resubmitting the same names
+    retries only the failures. Names of the form p-1 .. p-N go to Nova as a
+    single min_count/max_count request first; whatever it could not create
+    is created one by one, concurrency at a time.
+    """
+    client = get_nova_client()
+    flavor = get_flavor(flavor_name)
+    image = get_image(image_name)
+    existing = find_servers(names)
+
+    todo = [n for n in names if n not in existing]
+    prefix = bulk.multi_create_prefix(todo) if BULK_MULTI_CREATE and len(todo) == len(names) else None
+    created = {}
+    if prefix:
+        try:
+            client.servers.create(name=prefix, flavor=flavor.id, image=image.id, min_count=1, max_count=len(todo))
+            created = find_servers(todo)
+        except nova_exceptions.ClientException:
+            pass
+
+    def create_one(name):
+        server = client.servers.create(name=name, flavor=flavor.id, image=image.id)
+        servers_index.add(server.id, name)
+        return server.id
+
+    def find(name):
+        return find_servers([name]).get(name)
+
+    items = bulk.run_batch(names, create_one, existing={**existing, **created},
+                           concurrency=concurrency, find=find)
+    for item in items:
+        if item["name"] in created:
+            item["status"] = "created"
+    return bulk.summarize(items)
+
 def resize_vm(vm_name, new_flavor):
     """Resize a VM to a new flavor"""
     client = get_nova_client()
-    server = client.servers.find(name=vm_name)
-    flavor = client.flavors.find(name=new_flavor)
+    server = servers_index.call(vm_name, client.servers.get, nova_exceptions.NotFound)
+    flavor = get_flavor(new_flavor)
     server.resize(flavor.id)
     return server
 
 def delete_vm(vm_name):
     """Delete a VM by name"""
     client = get_nova_client()
-    server = client.servers.find(name=vm_name)
-    server.delete()
-    return {"status": "deleted", "name": vm_name}
+
+    def delete(server_id):
+        client.servers.delete(server_id)
+        return server_id
+
+    server_id = servers_index.call(vm_name, delete, nova_exceptions.NotFound)
+    servers_index.remove(server_id)
+    return {"status": "deleted", "name": vm_name, "id": server_id}
+
+def attach_volume(vm_name, volume_name):
+    """Attach a volume to a VM by name; returns the volume id"""
+    client = get_nova_client()
+    server_id = servers_index.get_id(vm_name)
+    volume_id = cinder.volumes_index.get_id(volume_name)
+    client.volumes.create_server_volume(server_id, volume_id)
+    return volume_id
 
 def get_vm_details(vm_name):
     """Get details of a VM by name"""
     client = get_nova_client()
-    server = client.servers.find(name=vm_name)
-    return server
+    return servers_index.call(vm_name, client.servers.get, nova_exceptions.NotFound)
+
+def get_server_status(server_id):
+    """Return a server's status, or DELETED once it no longer exists"""
+    client = get_nova_client()
+    try:
+        return client.servers.get(server_id).status
+    except nova_exceptions.NotFound:
+        return "DELETED"
+
+# Record the latency of every public function above
+instrument(globals(), "nova")
@@ -0,0 +1,101 @@
+import contextvars
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Most steps of one plan running at once
+PLAN_CONCURRENCY = int(os.getenv('PLAN_CONCURRENCY', '8'))
+
+
+def validate(steps):
+    """Raise ValueError unless steps form a DAG over known step ids"""
+    ids = [step["id"] for step in steps]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Duplicate step ids")
+    deps = {step["id"]: set(step.get("depends_on", ())) for step in steps}
+    for step_id, needs in deps.items():
+        unknown = needs - deps.keys()
+        if unknown:
+            raise ValueError(f"Step {step_id} depends on unknown steps {sorted(unknown)}")
+
+    # Kahn's algorithm: anything left once no step is ready sits on a cycle
+    remaining = {step_id: set(needs) for step_id, needs in deps.items()}
+    ready = [step_id for step_id, needs in remaining.items() if not needs]
+    while ready:
+        done = ready.pop()
+        del remaining[done]
+        for step_id, needs in remaining.items():
+            if done in needs:
+                needs.discard(done)
+                if not needs:
+                    ready.append(step_id)
+    if remaining:
+        raise ValueError(f"Steps {sorted(remaining)} form a dependency cycle")
+
+
+def execute(steps, run_step, concurrency=PLAN_CONCURRENCY, on_change=None):
+    """Run every step whose dependencies succeeded, as many at once as concurrency allows.
+
+    run_step(step) returns the step's message or raises. Steps depending on
+    a failed or skipped step are skipped. on_change(states), if given, is
+    called whenever a step starts or finishes. Returns the per-step states
+    {"id", "operation", "status", "message", "started", "finished"} in step
+    order; started and finished are seconds since the plan began.
+    """
+    validate(steps)
+    began = time.monotonic()
+    states = {
+        step["id"]: {"id": step["id"], "operation": step["operation"], "status": "pending",
+                     "message": None, "started": None, "finished": None}
+        for step in steps
+    }
+
+    def changed():
+        if on_change is not None:
+            on_change([states[step["id"]] for step in steps])
+
+    def settle_skips():
+        # Skip pending steps with a dependency that can no longer succeed
+        skipped = True
+        while skipped:
+            skipped = False
+            for step in steps:
+                state = states[step["id"]]
+                if state["status"] == "pending" and any(
+                    states[d]["status"] in ("failed", "skipped") for d in step.get("depends_on", ())
+                ):
+                    state["status"] = "skipped"
+                    state["message"] = "A step it depends on did not succeed"
+                    skipped = True
+
+    def ready():
+        return [
+            step for step in steps
+            if states[step["id"]]["status"] == "pending"
+            and all(states[d]["status"] == "succeeded" for d in step.get("depends_on", ()))
+        ]
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="plan") as pool:
+        while True:
+            for step in ready():
+                states[step["id"]].update(status="running", started=time.monotonic() - began)
+                # Each step runs in a copy of the caller's context, so it keeps the job's trace and request id
+                running[pool.submit(contextvars.copy_context().run, run_step, step)] = step["id"]
+            changed()
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                state = states[running.pop(future)]
+                state["finished"] = time.monotonic() - began
+                try:
+                    state["message"] = future.result()
+                    state["status"] = "succeeded"
+                except Exception as e:
+                    state["message"] = str(e)
+                    state["status"] = "failed"
+            settle_skips()
+
+    return [states[step["id"]] for step in steps]
+
@@ -0,0 +1,141 @@
+import asyncio
+import collections
+import logging
+import os
+from . import nova, cinder, neutron, aio
+from .auth import get_session
+from app.metrics import instrument
+
+# Page size for marker-based listings; only one page is held in memory at a time
+PAGE_SIZE = int(os.getenv('OS_USAGE_PAGE_SIZE', '500'))
+
+logger = logging.getLogger(__name__)
+
+
+def iter_pages(list_fn, page_size=None, **kwargs):
+    """Yield successive pages from a novaclient/cinderclient list() using limit/marker.
+
+    A short page is not the end: the server may cap limit below page_size
+    (Nova's max_limit, 1000 by default), so listing stops at an empty page,
+    or at a page that does not move past the marker.
+    """
+    page_size = page_size or PAGE_SIZE
+    marker = None
+    while True:
+        page = list_fn(limit=page_size, marker=marker, **kwargs)
+        if not page or page[-1].id == marker:
+            return
+        yield page
+        marker = page[-1].id
+
+
+def count_servers_by_flavor():
+    """Return a Counter of flavor id -> number of servers"""
+    client = nova.get_nova_client()
+    counts = collections.Counter()
+    for page in iter_pages(client.servers.list):
+        counts.update(s.flavor['id'] for s in page)
+    return counts
+
+
+def sum_flavors(counts):
+    """Total vCPUs and RAM for a Counter of flavor id -> server count"""
+    vcpus = 0
+    ram = 0
+    for flavor_id, count in counts.items():
+        flavor = nova.get_flavor(flavor_id)
+        vcpus += flavor.vcpus * count
+        ram += flavor.ram * count
+    return vcpus, ram
+
+
+def volume_totals():
+    """Return (volume count, total GB) across all volumes"""
+    client = cinder.get_cinder_client()
+    count = 0
+    size_gb = 0
+    for page in iter_pages(client.volumes.list):
+        count += len(page)
+        size_gb += sum(v.size for v in page)
+    return count, size_gb
+
+
+def count_neutron(resource):
+    """Count networks, ports or floatingips by streaming Neutron's paginated listing"""
+    client = neutron.get_neutron_client()
+    list_fn = getattr(client, f"list_{resource}")
+    count = 0
+    for page in list_fn(retrieve_all=False, limit=PAGE_SIZE, fields=['id']):
+        count += len(page[resource])
+    return count
+
+
+def nova_quotas():
+    """The project's compute quota limits (-1 is unlimited)"""
+    quotas = nova.get_nova_client().quotas.get(get_session().get_project_id())
+    return {"vcpus": quotas.cores, "ram_mb": quotas.ram, "vms": quotas.instances}
+
+
+def cinder_quotas():
+    """The project's block storage quota limits"""
+    quotas = cinder.get_cinder_client().quotas.get(get_session().get_project_id())
+    return {"volumes_gb": quotas.gigabytes, "volumes": quotas.volumes}
+
+
+def neutron_quotas():
+    """The project's network quota limits"""
+    quotas = neutron.get_neutron_client().show_quota(get_session().get_project_id())["quota"]
+    return {"networks": quotas["network"], "ports": quotas["port"], "floating_ips": quotas["floatingip"]}
+
+
+async def _quotas(service, fn, request):
+    # Reading quotas may be forbidden by policy; usage is still reported without them
+    try:
+        return await aio.call(service, fn, request=request)
+    except aio.ClientDisconnected:
+        raise
+    except Exception as e:
+        logger.warning("Could not read %s quotas: %s", service, e)
+        return {}
+
+
+async def get_usage(request=None):
+    """Collect project usage from Nova, Cinder and Neutron concurrently"""
+    (
+        server_counts,
+        _,
+        (volume_count, volume_gb),
+        network_count,
+        port_count,
+        floating_ip_count,
+        *quotas,
+    ) = await asyncio.gather(
+        aio.call("nova", count_servers_by_flavor, request=request),
+        aio.call("nova", nova.flavor_catalog.refresh, request=request),
+        aio.call("cinder", volume_totals, request=request),
+        aio.call("neutron", count_neutron, "networks", request=request),
+        aio.call("neutron", count_neutron, "ports", request=request),
+        aio.call("neutron", count_neutron, "floatingips", request=request),
+        _quotas("nova", nova_quotas, request),
+        _quotas("cinder", cinder_quotas, request),
+        _quotas("neutron", neutron_quotas, request),
+    )
+
+    # Served from the catalog loaded above, so this is just arithmetic
+    vcpus, ram = await aio.call("nova", sum_flavors, server_counts, request=request)
+
+    return {
+        "vcpus_used": vcpus,
+        "ram_mb_used": ram,
+        "volumes_gb": volume_gb,
+        "vm_count": sum(server_counts.values()),
+        "volume_count": volume_count,
+        "network_count": network_count,
+        "port_count": port_count,
+        "floating_ip_count": floating_ip_count,
+        # Quota limits (-1 is unlimited); a service whose quotas could not be read is left out
+        "quotas": {name: limit for service in quotas for name, limit in service.items()},
+    }
+
+# Record the latency of every public function above
+instrument(globals(), "usage")
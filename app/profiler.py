@@ -0,0 +1,147 @@
+"""On-demand sampling profiler, switched on for the next N requests through /api/admin/profile.
+
+A background thread reads every thread's Python stack with
+sys._current_frames() at a fixed interval and counts identical stacks. The
+result is in collapsed ("folded") stack format, one "frame;frame;... count"
+line per stack, which flamegraph.pl, speedscope and inferno read directly.
+Nothing runs and nothing is counted while no profile is in progress.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+# Seconds between stack samples
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+
+# A profile stops after this many seconds even if fewer requests arrived
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+
+# Innermost frames of threads that are parked waiting for work; their
+# samples are dropped unless the profile asks for idle stacks
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+}
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _frame_label(code, cache={}):
+    label = cache.get(code)
+    if label is None:
+        path = code.co_filename
+        if path.startswith(_ROOT):
+            path = os.path.relpath(path, _ROOT)
+        elif "site-packages" in path:
+            path = path.rsplit("site-packages" + os.sep, 1)[-1]
+        else:
+            path = os.path.basename(path)
+        label = cache[code] = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+    return label
+
+
+def collapse(frame):
+    """Outermost-first frame labels of frame's stack, joined with ';'"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _is_idle(frame):
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+class SamplingProfiler:
+    """Count sampled stacks from start() until requests finished requests (or max_seconds) later"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._remaining = 0
+        self._counts = collections.Counter()
+        self._idle = False
+        self.requests = 0
+        self.interval = PROFILE_INTERVAL
+        self.samples = 0
+        self.started = None
+        self.finished = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, requests, interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS, idle=False):
+        """Begin sampling; raises RuntimeError if a profile is already running"""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A profile is already running")
+            self._stop = threading.Event()
+            self._remaining = requests
+            self._counts = collections.Counter()
+            self._idle = idle
+            self.requests = requests
+            self.interval = interval
+            self.samples = 0
+            self.started = time.time()
+            self.finished = None
+            self._thread = threading.Thread(target=self._run, args=(interval, max_seconds),
+                                            name="profiler", daemon=True)
+            self._thread.start()
+
+    def request_done(self):
+        """Count a finished request; the profile stops after the requested number"""
+        if self._remaining <= 0:
+            return
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._stop.set()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _sample(self, own):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (not self._idle and _is_idle(frame)):
+                continue
+            self._counts[f"{names.get(ident, ident)};{collapse(frame)}"] += 1
+        self.samples += 1
+
+    def _run(self, interval, max_seconds):
+        own = threading.get_ident()
+        deadline = time.monotonic() + max_seconds
+        while not self._stop.wait(interval) and time.monotonic() < deadline:
+            self._sample(own)
+        with self._lock:
+            self._remaining = 0
+            self.finished = time.time()
+
+    def status(self):
+        return {
+            "running": self.running,
+            "requests": self.requests,
+            "remaining": max(self._remaining, 0),
+            "interval": self.interval,
+            "samples": self.samples,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+    def collapsed(self):
+        """The profile in collapsed stack format, most frequent stacks first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self._counts.most_common())
+
+
+sampler = SamplingProfiler()
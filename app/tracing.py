@@ -0,0 +1,399 @@
+"""Request tracing: spans tied to a request id, exported to a file or an OTLP collector.
+
+TracingMiddleware gives every HTTP request an id (the caller's X-Request-ID,
+or a new one) and decides whether to trace it: a W3C traceparent header
+decides for the caller, otherwise TRACE_SAMPLE_RATE does. For a traced
+request, span() opens child spans under the current one. The current span
+is a context variable, so it follows aio.call onto the OpenStack executors
+and jobs onto their runner threads. Untraced requests pay one context
+variable lookup per span().
+
+Spans are queued and written by a background thread, as JSON lines to a
+file or as OTLP/HTTP JSON to a collector (TRACE_EXPORT).
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from app import profiler
+
+# Fraction of requests traced when the caller sent no traceparent
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+
+# Where finished spans go: a file path (JSON lines), or an http(s) URL of
+# an OTLP/HTTP collector such as http://localhost:4318/v1/traces. Tracing
+# is off when empty
+TRACE_EXPORT = os.getenv('TRACE_EXPORT', '')
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'cloud-operations-agent')
+
+# Spans buffered for the exporter; more are dropped rather than slowing requests
+TRACE_QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', '10000'))
+TRACE_BATCH_SIZE = int(os.getenv('TRACE_BATCH_SIZE', '512'))
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+_current = contextvars.ContextVar("trace_span", default=None)
+request_id = contextvars.ContextVar("request_id", default=None)
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes", "start", "end", "error")
+
+    def __init__(self, trace_id, parent_id, name, kind=INTERNAL, attributes=None, start=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start = start or time.time_ns()
+        self.end = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start,
+            "duration_ms": (self.end - self.start) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _SpanScope:
+    def __init__(self, span):
+        self.span = span
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        finish(self.span)
+
+
+class _NoScope:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+_NO_SCOPE = _NoScope()
+
+
+def current():
+    """The span being recorded, or None when the request is not traced"""
+    return _current.get()
+
+
+def span(name, kind=INTERNAL, **attributes):
+    """Context manager recording a child of the current span; does nothing when not tracing"""
+    parent = _current.get()
+    if parent is None:
+        return _NO_SCOPE
+    return _SpanScope(Span(parent.trace_id, parent.span_id, name, kind, attributes))
+
+
+def annotate(**attributes):
+    """Add attributes to the current span, if any"""
+    active = _current.get()
+    if active is not None:
+        active.attributes.update(attributes)
+
+
+def record(name, start, end, kind=INTERNAL, error=None, **attributes):
+    """Record a finished child of the current span that ran from start to end (time.time_ns())"""
+    parent = _current.get()
+    if parent is None:
+        return
+    child = Span(parent.trace_id, parent.span_id, name, kind, attributes, start)
+    child.error = error
+    finish(child, end)
+
+
+def finish(finished, end=None):
+    finished.end = end or time.time_ns()
+    if exporter is not None:
+        exporter.export(finished)
+
+
+def parse_traceparent(header):
+    """(trace id, parent span id, sampled) from a W3C traceparent header, or None if malformed"""
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def _short_url(url):
+    # Drop the query string; names and markers in it would blow up span cardinality
+    return url.split("?", 1)[0]
+
+
+def record_http_response(response, *args, **kwargs):
+    """requests response hook: one CLIENT span per OpenStack API call made while tracing"""
+    if _current.get() is None:
+        return
+    end = time.time_ns()
+    request = response.request
+    record(f"HTTP {request.method}", end - int(response.elapsed.total_seconds() * 1e9), end, CLIENT,
+           error=f"HTTP {response.status_code}" if response.status_code >= 500 else None,
+           **{"http.method": request.method, "http.url": _short_url(request.url),
+              "http.status_code": response.status_code})
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("trace_starts", []).append(time.time_ns())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("trace_starts")
+    if starts:
+        _record_statement(starts.pop(), statement, executemany)
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    starts = conn.info.get("trace_starts") if conn is not None else None
+    if starts:
+        _record_statement(starts.pop(), exception_context.statement or "", False,
+                          error=str(exception_context.original_exception))
+
+
+def _record_statement(start, statement, executemany, error=None):
+    verb = statement.lstrip().split(" ", 1)[0].upper() or "SQL"
+    record(f"db {verb}", start, time.time_ns(), CLIENT, error=error,
+           **{"db.statement": statement[:500], "db.executemany": executemany})
+
+
+def instrument_engine(engine):
+    """Record a span for each statement the engine runs while a request is traced"""
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def to_otlp(spans, service_name=TRACE_SERVICE_NAME):
+    """An OTLP/HTTP JSON ExportTraceServiceRequest body for spans"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", service_name)]},
+        "scopeSpans": [{
+            "scope": {"name": __name__},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": s.kind,
+                "startTimeUnixNano": str(s.start),
+                "endTimeUnixNano": str(s.end),
+                "attributes": [_attribute(k, v) for k, v in s.attributes.items() if v is not None],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 0},
+            } for s in spans],
+        }],
+    }]}
+
+
+class SpanExporter:
+    """Write finished spans from a background thread, in batches.
+
+    target is a file path, appended to as JSON lines, or an OTLP/HTTP
+    collector URL. export() never blocks: when the queue is full the span
+    is dropped and counted.
+    """
+
+    def __init__(self, target, max_queue=TRACE_QUEUE_SIZE, batch_size=TRACE_BATCH_SIZE):
+        self.target = target
+        self._batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._worker = None
+        self.exported = 0
+        self.dropped = 0
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                self._worker.start()
+
+    def export(self, finished):
+        if self._worker is None:
+            self._ensure_worker()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _take_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, spans):
+        if self.target.startswith(("http://", "https://")):
+            request = urllib.request.Request(
+                self.target, data=json.dumps(to_otlp(spans)).encode(),
+                headers={"Content-Type": "application/json"}, method="POST")
+            with urllib.request.urlopen(request, timeout=10) as response:
+                response.read()
+        else:
+            with open(self.target, "a") as f:
+                f.writelines(json.dumps(s.to_dict(), default=str) + "\n" for s in spans)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            spans = [s for s in batch if s is not _STOP]
+            if spans:
+                try:
+                    self._write(spans)
+                    self.exported += len(spans)
+                except Exception as e:
+                    self.dropped += len(spans)
+                    logger.error("Tracing: dropped %d spans: %s", len(spans), e)
+            for _ in batch:
+                self._queue.task_done()
+            if len(spans) < len(batch):
+                return
+
+    def flush(self):
+        """Block until every queued span has been written"""
+        self._queue.join()
+
+    def close(self, timeout=None):
+        """Write everything still queued and stop the writer thread"""
+        with self._lock:
+            worker = self._worker
+        if worker is None or not worker.is_alive():
+            return
+        self._queue.put(_STOP)
+        worker.join(timeout)
+
+
+exporter = SpanExporter(TRACE_EXPORT) if TRACE_EXPORT else None
+
+
+def route_template(scope, cache):
+    """The path template of the route that handled scope (/api/jobs/{job_id}), memoized in cache"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = cache.get(endpoint)
+    if path is None:
+        routes = scope["app"].routes if "app" in scope else ()
+        path = next((r.path for r in routes
+                     if getattr(r, "endpoint", None) is endpoint or getattr(r, "app", None) is endpoint),
+                    getattr(endpoint, "__name__", "unmatched"))
+        cache[endpoint] = path
+    return path
+
+
+class TracingMiddleware:
+    """ASGI middleware giving each request an id and, when sampled, a root SERVER span.
+
+    The id is echoed in the X-Request-ID response header. It also counts
+    finished requests for the on-demand profiler.
+    """
+
+    def __init__(self, app, sample_rate=TRACE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        self._route_paths = {}
+
+    def _root(self, scope, headers):
+        if exporter is None:
+            return None
+        parent = parse_traceparent(headers[b"traceparent"].decode()) if b"traceparent" in headers else None
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = uuid.uuid4().hex, None, random.random() < self.sample_rate
+        if not sampled:
+            return None
+        return Span(trace_id, parent_id, f"{scope['method']} {scope['path']}", SERVER,
+                    {"http.method": scope["method"], "http.target": scope["path"]})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        rid = headers.get(b"x-request-id", b"").decode("latin-1")[:128] or uuid.uuid4().hex
+        root = self._root(scope, headers)
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        rid_token = request_id.set(rid)
+        span_token = _current.set(root) if root is not None else None
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        except Exception as e:
+            if root is not None:
+                root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if span_token is not None:
+                _current.reset(span_token)
+            request_id.reset(rid_token)
+            if root is not None:
+                route = route_template(scope, self._route_paths)
+                if route != "unmatched":
+                    root.name = f"{scope['method']} {route}"
+                root.attributes.update({"request.id": rid, "http.status_code": status})
+                if status >= 500 and root.error is None:
+                    root.error = f"HTTP {status}"
+                finish(root)
+            if not scope["path"].startswith("/api/admin/"):
+                profiler.sampler.request_done()
@@ -0,0 +1,126 @@
+"""Concurrent insert and query throughput of the interaction store.
+
+Starts the app under uvicorn with --workers worker processes on a fresh
+SQLite database, drives /api/chat (one audit row per message) from
+--concurrency clients, and meanwhile runs the indexed history queries from
+--readers threads against the same file. Run with --journal-mode DELETE to
+compare against SQLite's default rollback journal.
+
+    python -m benchmarks.bench_db
+    python -m benchmarks.bench_db --journal-mode DELETE
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+from sqlalchemy import func
+
+from benchmarks.common import summarize, wait_until_up
+
+
+async def write_load(base_url, concurrency, duration):
+    """Post chat messages from concurrency clients for duration seconds"""
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(client, n):
+        i = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.post("/api/chat", json={"message": f"Create an S.4 VM named bench-{n}-{i}"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+            i += 1
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        await asyncio.gather(*(client_loop(client, n) for n in range(concurrency)))
+    return latencies
+
+
+def read_load(session_factory, duration, latencies):
+    """Run the indexed history queries in a loop for duration seconds"""
+    from app.models.models import UserInteraction
+    deadline = time.perf_counter() + duration
+    db = session_factory()
+    try:
+        while time.perf_counter() < deadline:
+            since = datetime.datetime.utcnow() - datetime.timedelta(minutes=5)
+            start = time.perf_counter()
+            db.query(func.count(UserInteraction.id)).filter(
+                UserInteraction.detected_intent == "create_vm", UserInteraction.timestamp >= since
+            ).scalar()
+            db.query(UserInteraction).filter(UserInteraction.timestamp >= since).order_by(
+                UserInteraction.timestamp.desc()
+            ).limit(50).all()
+            latencies.append(time.perf_counter() - start)
+            db.rollback()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--journal-mode", default="WAL")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-db-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        SQLITE_JOURNAL_MODE=args.journal_mode,
+        INTENT_PARSER="rules",
+    )
+    # The engine reads its settings at import, so configure it before importing
+    os.environ.update(env)
+    from app.models.database import SessionLocal
+    from app.models.models import UserInteraction
+
+    subprocess.run([sys.executable, "init_db.py"], env=env, check=True, stdout=subprocess.DEVNULL)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_up(base_url + "/")
+        read_latencies = []
+        readers = [
+            threading.Thread(target=read_load, args=(SessionLocal, args.duration, read_latencies))
+            for _ in range(args.readers)
+        ]
+        for reader in readers:
+            reader.start()
+        write_latencies = asyncio.run(write_load(base_url, args.concurrency, args.duration))
+        for reader in readers:
+            reader.join()
+    finally:
+        # SIGTERM lets each worker drain its audit log queue
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    db = SessionLocal()
+    rows = db.query(func.count(UserInteraction.id)).scalar()
+    db.close()
+
+    print(f"journal_mode={args.journal_mode}, {args.workers} workers, {args.concurrency} writers, {args.readers} readers")
+    print(f"{summarize('POST /api/chat', write_latencies)} {len(write_latencies) / args.duration:8.1f} req/s")
+    print(f"{summarize('history queries', read_latencies)} {len(read_latencies) / args.duration:8.1f} q/s")
+    print(f"rows written: {rows} of {len(write_latencies)} requests")
+
+
+if __name__ == "__main__":
+    main()
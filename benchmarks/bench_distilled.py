@@ -0,0 +1,85 @@
+"""Latency, agreement and footprint of the distilled intent model.
+
+Labels a templated corpus with the rule grammar (standing in for the
+logged user_interactions), trains a model on it into a temporary directory
+(or loads --model-dir), then measures per-message latency of the distilled
+model against the rules, how often their intents and entities agree on a
+fresh corpus, the weights' size on disk and the memory used once loaded.
+
+    python -m benchmarks.bench_distilled
+    python -m benchmarks.bench_distilled --model-dir ./models/intent --count 50000
+"""
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from app.nlp import distill
+from app.nlp.distilled_parser import DistilledModel, latest_version
+from app.nlp.rule_based_parser import RuleBasedIntentParser
+from benchmarks.bench_intent_parser import generate_corpus
+from benchmarks.common import summarize
+
+
+def latencies(extract, corpus):
+    samples = []
+    for message in corpus:
+        start = time.perf_counter()
+        extract(message)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", help="benchmark this trained model instead of training one")
+    parser.add_argument("--train", type=int, default=5000, help="rule-labelled messages to train on")
+    parser.add_argument("--synthetic", type=int, default=10000)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--count", type=int, default=20000, help="messages to time and compare")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rules = RuleBasedIntentParser()
+    model_dir = args.model_dir
+    if model_dir is None:
+        model_dir = tempfile.mkdtemp(prefix="bench-distilled-")
+        rows = []
+        for row_id, message in enumerate(generate_corpus(args.train, args.seed), 1):
+            result = rules.extract_intent(message)
+            rows.append((row_id, message, *distill.clean(result.intent, result.entities())))
+        start = time.perf_counter()
+        distill.train(rows, model_dir, full=True, synthetic=args.synthetic, epochs=args.epochs, seed=args.seed)
+        print(f"trained on {len(rows)} labelled + {args.synthetic} synthetic messages in "
+              f"{time.perf_counter() - start:.1f}s")
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    model = DistilledModel.load(model_dir)
+    corpus = generate_corpus(args.count, args.seed + 1)
+    distilled = latencies(model.predict, corpus)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    baseline = latencies(rules.extract_intent, corpus)
+
+    intents = entities = 0
+    for message in corpus:
+        expected, found = rules.extract_intent(message), model.predict(message)
+        if expected.intent == found.intent:
+            intents += 1
+            entities += {k: str(v).lower() for k, v in expected.entities().items()} == \
+                        {k: str(v).lower() for k, v in found.entities().items()}
+    path = os.path.join(model_dir, latest_version(model_dir))
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    print(f"model {model.meta['version']}: {2 ** model.bits} hashed features, {size / 1e6:.1f} MB on disk, "
+          f"~{(rss_after - rss_before) / 1024:.1f} MB max RSS growth while predicting")
+    print(summarize("rule grammar", baseline))
+    print(summarize("distilled", distilled))
+    print(f"agreement with the rules: intent {intents / len(corpus):.2%}, entities {entities / len(corpus):.2%}")
+    if args.model_dir is None:
+        shutil.rmtree(model_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Event-loop responsiveness benchmark for the OpenStack async facade.
+
+Replaces nova.create_vm with a call that blocks for --slow-seconds, starts
+--slow-calls VM creations through /api/vm/create spread over the probe
+window, and measures the latency of the cheap GET / endpoint while they run. With --inline the slow
+call runs directly on the event loop, reproducing the old behaviour.
+
+    python -m benchmarks.bench_event_loop
+    python -m benchmarks.bench_event_loop --inline
+"""
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+
+from app.main import app
+from app.openstack import aio, nova
+from benchmarks.common import summarize
+
+
+def slow_create_vm(seconds):
+    def create_vm(name, flavor_name):
+        time.sleep(seconds)
+        return SimpleNamespace(id=f"fake-{name}")
+    return create_vm
+
+
+async def probe(client, duration, interval=0.005):
+    """Hit the cheap endpoint on a fixed schedule for duration seconds.
+
+    Latency is measured from each request's scheduled start, so time spent
+    waiting for a blocked event loop is counted instead of hidden.
+    """
+    latencies = []
+    begin = time.perf_counter()
+    scheduled = begin
+    while scheduled < begin + duration:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        response = await client.get("/")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - scheduled)
+        scheduled += interval
+    return latencies
+
+
+async def slow_requests(client, count, spread):
+    """Start count VM creations spread evenly over spread seconds"""
+    async def create(i):
+        await asyncio.sleep(i * spread / count)
+        await client.post("/api/vm/create", json={"name": f"bench-{i}", "flavor": "S.4"})
+    await asyncio.gather(*(create(i) for i in range(count)))
+
+
+async def run(args):
+    nova.create_vm = slow_create_vm(args.slow_seconds)
+    if args.inline:
+        async def inline_call(service, fn, *fn_args, request=None, **kwargs):
+            return fn(*fn_args, **kwargs)
+        aio.call = inline_call
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        idle = await probe(client, args.duration)
+        slow = asyncio.ensure_future(slow_requests(client, args.slow_calls, args.duration))
+        busy = await probe(client, args.duration)
+        await slow
+
+    mode = "inline (blocking)" if args.inline else "executor"
+    print(f"mode: {mode}, {args.slow_calls} concurrent VM creates x {args.slow_seconds}s")
+    print(summarize("GET / idle", idle))
+    print(summarize("GET / during provisioning", busy))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slow-calls", type=int, default=8)
+    parser.add_argument("--slow-seconds", type=float, default=0.5)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--inline", action="store_true", help="run OpenStack calls on the event loop")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
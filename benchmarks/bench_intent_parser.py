@@ -0,0 +1,198 @@
+"""Throughput benchmark for the rule-based intent parser.
+
+Generates a corpus of utterances from templates and measures messages/sec
+for the compiled grammar against the previous if/elif implementation, and
+how often the two agree on the intent. They disagree on purpose where the
+if/elif parser was wrong ("Resize web-1 to flavor S.4" has no "vm", so it
+was unknown); tests/test_nlp.py pins those cases.
+
+    python -m benchmarks.bench_intent_parser
+    python -m benchmarks.bench_intent_parser --count 20000 --seed 7
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from app.nlp.rule_based_parser import RuleBasedIntentParser
+
+TEMPLATES = (
+    "Create an {flavor} VM named {name}",
+    "please create a vm named {name} with flavor {flavor}",
+    "create a new vm",
+    "Resize the VM {name} to {flavor}",
+    "resize {name} vm to {flavor}",
+    "Resize {name} to flavor {flavor}",
+    "Delete the VM {name}",
+    "delete vm {name}",
+    "Create a private network called {name}",
+    "create a network",
+    "Create a {size}GB volume named {name}",
+    "create volume named {name} of {size} gb",
+    "Delete volume {name}",
+    "What's my project usage?",
+    "show me the quota for this project",
+    "Do something completely unrelated",
+    "how is the weather in {name} today",
+)
+
+FLAVORS = ("S.4", "M.8", "s.4", "m.8")
+
+
+def generate_corpus(count, seed):
+    """Return count utterances filled in from TEMPLATES"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        template = rng.choice(TEMPLATES)
+        corpus.append(template.format(
+            name=f"{rng.choice(('web', 'db', 'dev', 'data'))}-{i}",
+            flavor=rng.choice(FLAVORS),
+            size=rng.choice((10, 50, 100, 500)),
+        ))
+    return corpus
+
+
+def legacy_extract_intent(user_message):
+    """The if/elif parser the grammar replaced, kept verbatim as the baseline"""
+    intent = "unknown"
+    entities = {}
+    
+    message = user_message.lower()
+    
+    if "create" in message and "vm" in message:
+        intent = "create_vm"
+        # Extract name and flavor using simple rules
+        if "named" in message:
+            name_parts = message.split("named")
+            if len(name_parts) > 1:
+                entities["name"] = name_parts[1].strip().split()[0]
+        else:
+            entities["name"] = "default-vm"
+            
+        if "s.4" in message:
+            entities["flavor"] = "S.4"
+        elif "m.8" in message:
+            entities["flavor"] = "M.8"
+        else:
+            entities["flavor"] = "default-flavor"
+        
+    elif "resize" in message and "vm" in message:
+        intent = "resize_vm"
+        # Extract VM name
+        if "resize" in message:
+            parts = message.split("resize")
+            if len(parts) > 1:
+                name_parts = parts[1].strip().split()
+                if len(name_parts) > 0:
+                    entities["name"] = name_parts[0]
+        
+        # Extract flavor
+        if "to" in message:
+            flavor_parts = message.split("to")
+            if len(flavor_parts) > 1:
+                flavor = flavor_parts[1].strip().split()[0]
+                entities["flavor"] = flavor
+        
+        if "flavor" not in entities:
+            if "s.4" in message:
+                entities["flavor"] = "S.4"
+            elif "m.8" in message:
+                entities["flavor"] = "M.8"
+            else:
+                entities["flavor"] = "default-flavor"
+        
+    elif "delete" in message and "vm" in message:
+        intent = "delete_vm"
+        if "delete" in message:
+            parts = message.split("delete")
+            if len(parts) > 1:
+                vm_parts = parts[1].strip().split()
+                if len(vm_parts) > 1 and vm_parts[0].lower() == "the" and vm_parts[1].lower() == "vm":
+                    if len(vm_parts) > 2:
+                        entities["name"] = vm_parts[2]
+                elif len(vm_parts) > 0:
+                    entities["name"] = vm_parts[0]
+        
+    elif "create" in message and "network" in message:
+        intent = "create_network"
+        if "called" in message:
+            parts = message.split("called")
+            if len(parts) > 1:
+                entities["name"] = parts[1].strip().split()[0]
+        else:
+            entities["name"] = "default-network"
+        
+    elif "create" in message and "volume" in message:
+        intent = "create_volume"
+        if "named" in message:
+            parts = message.split("named")
+            if len(parts) > 1:
+                entities["name"] = parts[1].strip().split()[0]
+        else:
+            entities["name"] = "default-volume"
+        
+        # Try to extract size
+        size_match = re.search(r'(\d+)\s*gb', message, re.IGNORECASE)
+        if size_match:
+            entities["size"] = int(size_match.group(1))
+        else:
+            entities["size"] = 100  # Default size
+        
+    elif "delete" in message and "volume" in message:
+        intent = "delete_volume"
+        if "delete" in message:
+            parts = message.split("delete")
+            if len(parts) > 1:
+                volume_parts = parts[1].strip().split()
+                if len(volume_parts) > 1 and volume_parts[0].lower() == "volume":
+                    if len(volume_parts) > 1:
+                        entities["name"] = volume_parts[1]
+                elif len(volume_parts) > 0:
+                    entities["name"] = volume_parts[0]
+        
+    elif "usage" in message or "quota" in message or "project usage" in message:
+        intent = "get_usage"
+    
+    return json.dumps({"intent": intent, "entities": entities})
+
+
+def throughput(extract, corpus):
+    """Return (messages/sec, results) for extract over corpus"""
+    start = time.perf_counter()
+    results = [extract(message) for message in corpus]
+    return len(corpus) / (time.perf_counter() - start), results
+
+
+def best_of(rounds, parsers, corpus):
+    """Best messages/sec of each parser over rounds, alternating so both see the same machine noise"""
+    rates = [0.0] * len(parsers)
+    results = [None] * len(parsers)
+    for _ in range(rounds):
+        for i, extract in enumerate(parsers):
+            rate, results[i] = throughput(extract, corpus)
+            rates[i] = max(rates[i], rate)
+    return rates, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rounds", type=int, default=5, help="best of this many alternating runs")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.count, args.seed)
+    (legacy_rate, grammar_rate), (legacy, compiled) = best_of(
+        args.rounds, (legacy_extract_intent, RuleBasedIntentParser().extract_intent), corpus)
+
+    agree = sum(json.loads(a)["intent"] == b.intent for a, b in zip(legacy, compiled))
+    print(f"corpus: {len(corpus)} utterances")
+    print(f"{'legacy if/elif':<28} {legacy_rate:12,.0f} msg/s")
+    print(f"{'compiled grammar':<28} {grammar_rate:12,.0f} msg/s ({grammar_rate / legacy_rate:.2f}x)")
+    print(f"{'intent agreement':<28} {agree / len(corpus):12.2%}")
+
+
+if __name__ == "__main__":
+    main()
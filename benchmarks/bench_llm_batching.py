@@ -0,0 +1,55 @@
+"""CPU throughput of the OpenHermes parser with and without micro-batching.
+
+Loads a small stand-in causal LM on CPU (any local path or hub id works) and
+sends --concurrency messages at a time, --rounds times, through the parser's
+batching queue: once with --batch-size and once with batches of one, which
+is how every message used to be generated.
+
+    python -m benchmarks.bench_llm_batching
+    python -m benchmarks.bench_llm_batching --model ./models/tiny-llama --batch-size 16
+"""
+import argparse
+import time
+from concurrent.futures import wait
+
+from app.nlp.intent_parser import OpenHermesIntentParser
+from benchmarks.bench_intent_parser import generate_corpus
+from benchmarks.common import summarize
+
+
+def run(parser, corpus, concurrency, rounds):
+    """Return (messages/sec, per-message latencies) for concurrent submissions"""
+    latencies = []
+    begin = time.perf_counter()
+    for r in range(rounds):
+        messages = corpus[r * concurrency:(r + 1) * concurrency]
+        start = time.perf_counter()
+        futures = [parser.submit(m) for m in messages]
+        for future in futures:
+            future.add_done_callback(lambda f, start=start: latencies.append(time.perf_counter() - start))
+        wait(futures)
+    return rounds * concurrency / (time.perf_counter() - begin), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sshleifer/tiny-gpt2")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--window", type=float, default=0.02)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.concurrency * args.rounds, seed=0)
+    for label, batch_size, window in (("serial", 1, 0), (f"batched x{args.batch_size}", args.batch_size, args.window)):
+        intent_parser = OpenHermesIntentParser(
+            model_name=args.model, device="cpu", max_new_tokens=args.max_new_tokens,
+            batch_window=window, max_batch_size=batch_size,
+        )
+        rate, latencies = run(intent_parser, corpus, args.concurrency, args.rounds)
+        print(f"{summarize(label, latencies)} {rate:8.1f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""End-to-end load test of the API against the fake OpenStack cloud.
+
+Starts tests.fake_openstack (with --latency, --jitter, --error-rate and
+--build-seconds) and the app under uvicorn with --workers workers pointed
+at it, then runs --concurrency clients for --duration seconds. Each client
+picks scenarios from --mix with its own seeded RNG: project usage, chat
+messages, VMs created through chat and /api/confirm and followed until
+their job finishes, volume creates, VM deletes and history reads.
+
+Prints throughput, errors and p50/p95/p99 per endpoint, plus the time
+from confirmation to a finished job. --json writes the same numbers, for
+comparing runs before and after a change.
+
+    python -m benchmarks.bench_load
+    python -m benchmarks.bench_load --latency 0.05 --error-rate 0.01 --json before.json
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from benchmarks.common import percentile, summarize, wait_until_up
+from tests.fake_openstack import PROJECT_ID
+
+DEFAULT_MIX = "usage=2,chat_usage=2,create_vm=3,create_volume=2,delete_vm=1,history=1"
+
+
+class Stats:
+    """Latencies and error counts per endpoint label"""
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def record(self, label, seconds, ok):
+        self.latencies[label].append(seconds)
+        if not ok:
+            self.errors[label] += 1
+
+    def report(self, duration):
+        rows = {}
+        for label in sorted(self.latencies):
+            ms = [v * 1000 for v in self.latencies[label]]
+            rows[label] = {
+                "count": len(ms),
+                "errors": self.errors[label],
+                "per_second": len(ms) / duration,
+                "p50_ms": percentile(ms, 50),
+                "p95_ms": percentile(ms, 95),
+                "p99_ms": percentile(ms, 99),
+            }
+        return rows
+
+
+async def timed(client, stats, label, method, url, **kwargs):
+    """Send one request, recording its latency under label; returns the response, or None if it failed"""
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        response, ok = None, False
+    stats.record(label, time.perf_counter() - start, ok)
+    return response if ok else None
+
+
+async def usage(client, stats, state):
+    await timed(client, stats, "GET /api/usage", "GET", "/api/usage")
+
+
+async def chat_usage(client, stats, state):
+    await timed(client, stats, "POST /api/chat", "POST", "/api/chat", json={"message": "What's my project usage?"})
+
+
+async def create_vm(client, stats, state):
+    """Create a VM the way the web UI does, then follow its job until it finishes"""
+    name = f"load-{state['client']}-{state['sequence']}"
+    response = await timed(client, stats, "POST /api/chat", "POST", "/api/chat",
+                           json={"message": f"Create an S.4 VM named {name}"})
+    if response is None:
+        return
+    proposal = response.json()
+    started = time.perf_counter()
+    response = await timed(client, stats, "POST /api/confirm", "POST", "/api/confirm", json={
+        "operation": proposal["operation"],
+        "confirmed": True,
+        "parameters": proposal["parameters"],
+        "idempotency_key": uuid.uuid4().hex,
+    })
+    if response is None:
+        stats.record("job create_vm", time.perf_counter() - started, False)
+        return
+    job_id = response.json()["job_id"]
+    while True:
+        await asyncio.sleep(state["poll_interval"])
+        response = await timed(client, stats, "GET /api/jobs/{id}", "GET", f"/api/jobs/{job_id}")
+        if response is not None and response.json()["status"] in ("succeeded", "failed"):
+            succeeded = response.json()["status"] == "succeeded"
+            stats.record("job create_vm", time.perf_counter() - started, succeeded)
+            if succeeded:
+                state["vms"].append(name)
+            return
+
+
+async def create_volume(client, stats, state):
+    name = f"load-vol-{state['client']}-{state['sequence']}"
+    await timed(client, stats, "POST /api/volume/create", "POST", "/api/volume/create", json={"name": name, "size": 1})
+
+
+async def delete_vm(client, stats, state):
+    if not state["vms"]:
+        return await usage(client, stats, state)
+    name = state["vms"].pop(0)
+    await timed(client, stats, "DELETE /api/vm/delete", "DELETE", "/api/vm/delete", params={"name": name})
+
+
+async def history(client, stats, state):
+    await timed(client, stats, "GET /api/history", "GET", "/api/history", params={"limit": 20})
+
+
+SCENARIOS = {
+    "usage": usage,
+    "chat_usage": chat_usage,
+    "create_vm": create_vm,
+    "create_volume": create_volume,
+    "delete_vm": delete_vm,
+    "history": history,
+}
+
+
+def parse_mix(text):
+    """Parse "name=weight,..." into scenario names and weights"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name.strip()!r}, expected one of {sorted(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return list(mix), list(mix.values())
+
+
+async def run_clients(base_url, args):
+    names, weights = parse_mix(args.mix)
+    stats = Stats()
+    deadline = time.perf_counter() + args.duration
+
+    async def client_loop(client, n):
+        rng = random.Random(args.seed * 1000 + n)
+        state = {"client": n, "sequence": 0, "vms": [], "poll_interval": args.poll_interval}
+        while time.perf_counter() < deadline:
+            state["sequence"] += 1
+            await SCENARIOS[rng.choices(names, weights)[0]](client, stats, state)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        await asyncio.gather(*(client_loop(client, n) for n in range(args.concurrency)))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake cloud seconds per API call")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--build-seconds", type=float, default=1.0, help="fake cloud time for resources to settle")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="client seconds between job polls")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--cloud-port", type=int, default=8768)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-load-")
+    cloud = subprocess.Popen(
+        [sys.executable, "-m", "tests.fake_openstack", "--port", str(args.cloud_port),
+         "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+         "--build-seconds", str(args.build_seconds), "--seed", str(args.seed)],
+        stdout=subprocess.DEVNULL,
+    )
+    cloud_url = f"http://127.0.0.1:{args.cloud_port}"
+    env = dict(
+        os.environ,
+        OS_AUTH_URL=f"{cloud_url}/identity/v3",
+        OS_USERNAME="fake",
+        OS_PASSWORD="fake",
+        OS_PROJECT_ID=PROJECT_ID,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        INTENT_PARSER="rules",
+        JOB_POLL_INITIAL="0.05",
+        JOB_POLL_MAX="0.5",
+    )
+    env.pop("OS_AUTH_TOKEN", None)
+    server = None
+    try:
+        wait_until_up(cloud_url + "/")
+        subprocess.run([sys.executable, "init_db.py"], env=env, check=True, stdout=subprocess.DEVNULL)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            env=env,
+        )
+        base_url = f"http://127.0.0.1:{args.port}"
+        wait_until_up(base_url + "/api/ready")
+        stats = asyncio.run(run_clients(base_url, args))
+        cloud_calls = httpx.get(cloud_url + "/").json()
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+        cloud.terminate()
+        cloud.wait(timeout=10)
+
+    # "job ..." rows time whole jobs, not requests
+    total = sum(len(v) for label, v in stats.latencies.items() if not label.startswith("job "))
+    print(f"{args.workers} workers, {args.concurrency} clients, {args.duration:.0f}s, mix {args.mix}")
+    print(f"fake cloud: latency {args.latency}s (+{args.jitter}s), error rate {args.error_rate}, "
+          f"build {args.build_seconds}s; {cloud_calls['requests']} API calls, {cloud_calls['errors']} failed")
+    for label in sorted(stats.latencies):
+        print(f"{summarize(label, stats.latencies[label])} {len(stats.latencies[label]) / args.duration:8.1f} req/s "
+              f"errors={stats.errors[label]}")
+    print(f"total {total / args.duration:.1f} req/s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "endpoints": stats.report(args.duration)}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
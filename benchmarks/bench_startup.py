@@ -0,0 +1,63 @@
+"""Cold-start import cost of the application.
+
+Imports each target in a fresh interpreter --runs times and reports the
+import wall time, peak RSS and whether torch/transformers got loaded. The
+"eager" target adds the OpenHermes parser module, which is what every
+worker used to import at startup.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from benchmarks.common import percentile
+
+TARGETS = {
+    "lazy (app.main)": ["app.main"],
+    "eager (+ intent_parser)": ["app.main", "app.nlp.intent_parser"],
+}
+
+CHILD = """
+import importlib, json, resource, sys, time
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": sorted(m for m in ("torch", "transformers") if m in sys.modules),
+}))
+"""
+
+
+def measure(modules):
+    """Import modules in a fresh interpreter and return its measurements"""
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, *modules],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for label, modules in TARGETS.items():
+        try:
+            runs = [measure(modules) for _ in range(args.runs)]
+        except subprocess.CalledProcessError as e:
+            print(f"{label:<28} failed: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        ms = [r["seconds"] * 1000 for r in runs]
+        rss = max(r["max_rss_mb"] for r in runs)
+        heavy = ", ".join(runs[0]["heavy"]) or "none"
+        print(f"{label:<28} p50={percentile(ms, 50):8.1f}ms max={max(ms):8.1f}ms rss={rss:7.1f}MB heavy={heavy}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Helpers shared by the benchmark scripts"""
+import math
+import time
+
+
+def percentile(values, p):
+    """Return the p-th percentile (0-100) of values using nearest-rank"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(label, latencies_s):
+    """Format count and p50/p95/p99 latencies (in ms) for a list of seconds"""
+    ms = [v * 1000 for v in latencies_s]
+    return (
+        f"{label:<28} n={len(ms):<6} "
+        f"p50={percentile(ms, 50):8.2f}ms p95={percentile(ms, 95):8.2f}ms p99={percentile(ms, 99):8.2f}ms"
+    )
+
+
+def wait_until_up(url, timeout=30):
+    """Poll url until it answers 200"""
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1).raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
@@ -1,8 +1,39 @@
+from sqlalchemy import inspect
+from sqlalchemy.exc import DBAPIError
 from app.models.database import engine
 from app.models.models import Base
 
+def add_missing_columns(bind=engine):
+    """Add columns introduced since the tables were created (create_all skips existing tables)"""
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+def _upgrade(bind):
+    Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+    # create_all skips tables that already exist, so add indexes introduced since
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+def upgrade(bind=engine):
+    """Create the tables, columns and indexes a database from an older version is missing"""
+    try:
+        _upgrade(bind)
+    except DBAPIError:
+        # Another worker starting at the same time changed the schema first; a second pass sees what it did
+        _upgrade(bind)
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    upgrade()
     print("Database initialized successfully!")
 
 if __name__ == "__main__":
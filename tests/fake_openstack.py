@@ -0,0 +1,627 @@
+"""In-process fake of the Keystone, Nova, Cinder, Neutron and Glance APIs.
+
+Serves the subset of each API the app uses, over plain HTTP on localhost,
+with resources that keep their state and move through the same statuses
+as a real cloud (BUILD -> ACTIVE, creating -> available, ...) after
+build_seconds. Every non-Keystone request can be delayed (latency plus up
+to jitter seconds) and fail with a 503 at error_rate, from a seeded RNG so
+runs are reproducible; fail_creates() fails the creates of chosen names.
+
+    with FakeCloud(latency=0.02, build_seconds=0.5) as cloud:
+        os.environ.update(cloud.env())
+        auth.reset()
+        ...
+
+or standalone, printing the environment to point the app at it:
+
+    python -m tests.fake_openstack --port 5005 --latency 0.02 --error-rate 0.01
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+PROJECT_ID = "fake-project"
+
+DEFAULT_FLAVORS = [
+    {"id": "1", "name": "S.2", "vcpus": 1, "ram": 2048, "disk": 20},
+    {"id": "2", "name": "S.4", "vcpus": 2, "ram": 4096, "disk": 40},
+    {"id": "3", "name": "M.8", "vcpus": 4, "ram": 8192, "disk": 80},
+    {"id": "4", "name": "L.16", "vcpus": 8, "ram": 16384, "disk": 160},
+]
+
+DEFAULT_IMAGES = [
+    {"id": "img-ubuntu-2204", "name": "ubuntu-22.04", "os_distro": "ubuntu", "os_version": "22.04",
+     "tags": ["default"], "created_at": "2024-01-01T00:00:00Z"},
+    {"id": "img-fedora-39", "name": "fedora-39", "os_distro": "fedora", "os_version": "39",
+     "tags": [], "created_at": "2024-02-01T00:00:00Z"},
+]
+
+DEFAULT_QUOTAS = {
+    "compute": {"cores": 20, "ram": 51200, "instances": 10},
+    "volume": {"gigabytes": 1000, "volumes": 10},
+    "network": {"network": 100, "port": 500, "floatingip": 50},
+}
+
+# Nova's cap on one page of a listing
+MAX_PAGE = 1000
+
+# Catalog entries: service type -> (path prefix, extra service types)
+_SERVICES = {
+    "compute": ("/compute/v2.1", ()),
+    "volumev3": (f"/volume/v3/{PROJECT_ID}", ("block-storage", "volume")),
+    "network": ("/network", ()),
+    "image": ("/image", ()),
+}
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _timestamp(moment=None):
+    return (moment or _now()).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _parse_time(value):
+    value = value.replace("Z", "+00:00")
+    moment = datetime.datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=datetime.timezone.utc)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _Resource(dict):
+    """A resource body plus the status it reaches, and when, and whether it then disappears"""
+
+    def __init__(self, body, pending=None, at=0.0, gone=False):
+        super().__init__(body)
+        self.pending = pending
+        self.at = at
+        self.gone = gone
+
+    def schedule(self, status, after, gone=False):
+        self.pending, self.at, self.gone = status, time.monotonic() + after, gone
+
+
+class FakeCloud:
+    """Stateful fake OpenStack endpoints on a background HTTP server"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, build_seconds=0.0, seed=0,
+                 flavors=DEFAULT_FLAVORS, images=DEFAULT_IMAGES):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.build_seconds = build_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._server = None
+        self.requests = 0
+        self.errors = 0
+        self.flavors = {f["id"]: dict(f) for f in flavors}
+        self.images = {i["id"]: dict(i, status="active") for i in images}
+        self.quotas = {key: dict(limits) for key, limits in DEFAULT_QUOTAS.items()}
+        self.servers = {}
+        self.volumes = {}
+        self.networks = {}
+        self.subnets = {}
+        self.ports = {}
+        self.routers = {"fake-router": _Resource({"id": "fake-router", "name": "fake-router"})}
+        # Deleted servers, reported by changes-since listings
+        self.deleted_servers = {}
+        # Names of the servers and volumes each create request asked for
+        self.create_requests = []
+        self._failing_creates = (frozenset(), False)
+
+    # -- lifecycle -----------------------------------------------------
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve on a daemon thread; port 0 picks a free one"""
+        cloud = self
+
+        class Handler(_Handler):
+            pass
+        Handler.cloud = cloud
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), name="fake-openstack", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start() if self._server is None else self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """Environment that points app.openstack.auth at this cloud"""
+        return {
+            "OS_AUTH_URL": f"{self.url}/identity/v3",
+            "OS_USERNAME": "fake",
+            "OS_PASSWORD": "fake",
+            "OS_PROJECT_ID": PROJECT_ID,
+            "OS_USER_DOMAIN_NAME": "Default",
+        }
+
+    def fail_creates(self, names, after_create=False):
+        """Fail requests creating a server or volume in names with a 503; after creating it when after_create"""
+        self._failing_creates = (frozenset(names), after_create)
+
+    # -- dispatch ------------------------------------------------------
+
+    def handle(self, method, path, query, body):
+        """Return (status, body or None, headers) for one request"""
+        if path == "/":
+            return 200, {"status": "ok", "requests": self.requests, "errors": self.errors}, {}
+        if path.startswith("/identity/"):
+            return self._identity(method, path[len("/identity"):], body)
+
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            failed = self.error_rate and self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise HTTPError(503, "Injected failure")
+
+        spec = (body or {}).get("server") or (body or {}).get("volume") if method == "POST" else None
+        if isinstance(spec, dict) and "name" in spec:
+            names, after_create = self._failing_creates
+            with self._lock:
+                self.create_requests.append(spec["name"])
+            if spec["name"] in names:
+                if after_create:
+                    self._route(method, path, query, body)
+                raise HTTPError(503, "Injected failure")
+        return self._route(method, path, query, body)
+
+    def _route(self, method, path, query, body):
+        for service, (prefix, _) in _SERVICES.items():
+            if path == prefix or path.startswith(prefix + "/"):
+                handler = getattr(self, f"_{service}")
+                with self._lock:
+                    return handler(method, path[len(prefix):] or "/", query, body or {})
+        raise HTTPError(404, f"No service at {path}")
+
+    # -- keystone ------------------------------------------------------
+
+    def _identity(self, method, path, body):
+        if method == "GET" and path.rstrip("/") == "/v3":
+            return 200, {"version": {"id": "v3.14", "status": "stable", "links": []}}, {}
+        if method != "POST" or path != "/v3/auth/tokens":
+            raise HTTPError(404, f"No identity route {path}")
+        user = {"id": "fake-user", "name": "fake", "domain": {"id": "default", "name": "Default"}}
+        catalog = []
+        for service, (prefix, aliases) in _SERVICES.items():
+            endpoints = [
+                {"id": f"{service}-{interface}", "interface": interface, "region": "RegionOne",
+                 "region_id": "RegionOne", "url": self.url + prefix}
+                for interface in ("public", "internal", "admin")
+            ]
+            for service_type in (service,) + aliases:
+                catalog.append({"id": service_type, "type": service_type, "name": service_type, "endpoints": endpoints})
+        token = {
+            "methods": ["password"],
+            "user": user,
+            "project": {"id": PROJECT_ID, "name": PROJECT_ID, "domain": {"id": "default", "name": "Default"}},
+            "roles": [{"id": "member", "name": "member"}],
+            "issued_at": _timestamp(),
+            "expires_at": _timestamp(_now() + datetime.timedelta(hours=1)),
+            "catalog": catalog,
+        }
+        return 201, {"token": token}, {"X-Subject-Token": uuid.uuid4().hex}
+
+    # -- helpers -------------------------------------------------------
+
+    def _settle(self, store, resource_id):
+        """Apply the resource's scheduled transition if due; None once it is gone"""
+        resource = store.get(resource_id)
+        if resource is None or resource.pending is None or time.monotonic() < resource.at:
+            return resource
+        if resource.gone:
+            del store[resource_id]
+            return None
+        resource["status"] = resource.pending
+        resource["updated"] = resource["updated_at"] = _timestamp()
+        resource.pending = None
+        return resource
+
+    def _get(self, store, resource_id, kind):
+        resource = self._settle(store, resource_id)
+        if resource is None:
+            raise HTTPError(404, f"{kind} {resource_id} could not be found")
+        return resource
+
+    def _all(self, store):
+        return [r for r in (self._settle(store, i) for i in list(store)) if r is not None]
+
+    @staticmethod
+    def _page(items, query, limit=None):
+        """Slice a listing by the marker and limit query parameters"""
+        marker = query.get("marker", [None])[0]
+        if marker is not None:
+            ids = [item["id"] for item in items]
+            items = items[ids.index(marker) + 1:] if marker in ids else []
+        # Like Nova, a larger limit than the cap gets a capped page
+        limit = min(int(query.get("limit", [limit or MAX_PAGE])[0]), MAX_PAGE)
+        return items[:limit], len(items) > limit
+
+    # -- nova ----------------------------------------------------------
+
+    def _compute(self, method, path, query, body):
+        if method == "GET" and path in ("/flavors", "/flavors/detail"):
+            return 200, {"flavors": [dict(f, links=[]) for f in self.flavors.values()]}, {}
+        if method == "GET" and path in ("/servers", "/servers/detail"):
+            return self._list_servers(path.endswith("detail"), query)
+        if method == "GET" and path == f"/os-quota-sets/{PROJECT_ID}":
+            return 200, {"quota_set": dict(self.quotas["compute"], id=PROJECT_ID)}, {}
+        if method == "POST" and path == "/servers":
+            return self._create_servers(body["server"])
+
+        match = re.fullmatch(r"/servers/([^/]+)(/action|/os-volume_attachments)?", path)
+        if not match:
+            raise HTTPError(404, f"No compute route {method} {path}")
+        server = self._get(self.servers, match.group(1), "Instance")
+        if match.group(2) is None and method == "GET":
+            return 200, {"server": server}, {}
+        if match.group(2) is None and method == "DELETE":
+            self._delete_server(server)
+            return 204, None, {}
+        if match.group(2) == "/action" and "resize" in body:
+            flavor = self._flavor(body["resize"]["flavorRef"])
+            server.update(status="RESIZE", flavor={"id": flavor["id"]}, updated=_timestamp())
+            server.schedule("VERIFY_RESIZE", self.build_seconds)
+            return 202, None, {}
+        if match.group(2) == "/os-volume_attachments" and method == "POST":
+            return self._attach(server, body["volumeAttachment"])
+        raise HTTPError(400, f"Unsupported server request {method} {path}")
+
+    def _flavor(self, ref):
+        flavor = self.flavors.get(str(ref)) or next((f for f in self.flavors.values() if f["name"] == ref), None)
+        if flavor is None:
+            raise HTTPError(400, f"Flavor {ref} could not be found")
+        return flavor
+
+    def _list_servers(self, detailed, query):
+        servers = self._all(self.servers)
+        since = query.get("changes-since", [None])[0]
+        if since is not None:
+            since = _parse_time(since)
+            servers = [s for s in servers if _parse_time(s["updated"]) >= since]
+            servers += [s for s in self.deleted_servers.values() if _parse_time(s["updated"]) >= since]
+        if "name" in query:
+            pattern = re.compile(query["name"][0])
+            servers = [s for s in servers if pattern.search(s["name"])]
+        page, _ = self._page(servers, query)
+        if not detailed:
+            page = [{"id": s["id"], "name": s["name"], "links": []} for s in page]
+        return 200, {"servers": page}, {}
+
+    def _create_servers(self, spec):
+        flavor = self._flavor(spec["flavorRef"])
+        if spec.get("imageRef") not in self.images:
+            raise HTTPError(400, f"Image {spec.get('imageRef')} could not be found")
+        networks = [n.get("uuid") for n in spec.get("networks") or () if isinstance(n, dict)]
+        for network_id in networks:
+            self._get(self.networks, network_id, "Network")
+
+        count = int(spec.get("max_count") or 1)
+        names = [spec["name"]] if count == 1 else [f"{spec['name']}-{i}" for i in range(1, count + 1)]
+        created = []
+        for name in names:
+            server = _Resource({
+                "id": uuid.uuid4().hex, "name": name, "status": "BUILD", "tenant_id": PROJECT_ID,
+                "flavor": {"id": flavor["id"]}, "image": {"id": spec["imageRef"]}, "addresses": {},
+                "metadata": spec.get("metadata") or {}, "created": _timestamp(), "updated": _timestamp(),
+                "links": [],
+            })
+            server.schedule("ACTIVE", self.build_seconds)
+            self.servers[server["id"]] = server
+            for network_id in networks:
+                self._add_port(network_id, "compute:nova", server["id"])
+            created.append(server)
+        return 202, {"server": {"id": created[0]["id"], "links": [], "adminPass": "fake"}}, {}
+
+    def _delete_server(self, server):
+        for port in [p for p in self.ports.values() if p["device_id"] == server["id"]]:
+            del self.ports[port["id"]]
+        for volume in self.volumes.values():
+            if any(a["server_id"] == server["id"] for a in volume["attachments"]):
+                volume.update(status="available", attachments=[])
+        del self.servers[server["id"]]
+        self.deleted_servers[server["id"]] = dict(server, status="DELETED", updated=_timestamp())
+
+    def _attach(self, server, spec):
+        volume = self._get(self.volumes, spec["volumeId"], "Volume")
+        if volume["status"] != "available":
+            raise HTTPError(400, f"Volume {volume['id']} status must be available, not {volume['status']}")
+        attachment = {"id": volume["id"], "serverId": server["id"], "volumeId": volume["id"], "device": "/dev/vdb"}
+        volume.update(status="attaching", attachments=[{"server_id": server["id"], "device": "/dev/vdb"}])
+        volume.schedule("in-use", self.build_seconds)
+        return 200, {"volumeAttachment": attachment}, {}
+
+    # -- cinder --------------------------------------------------------
+
+    def _volumev3(self, method, path, query, body):
+        if method == "GET" and path == f"/os-quota-sets/{PROJECT_ID}":
+            return 200, {"quota_set": dict(self.quotas["volume"], id=PROJECT_ID)}, {}
+        if method == "GET" and path in ("/volumes", "/volumes/detail"):
+            volumes = self._all(self.volumes)
+            if "name" in query:
+                volumes = [v for v in volumes if v["name"] == query["name"][0]]
+            page, more = self._page(volumes, query)
+            if not path.endswith("detail"):
+                page = [{"id": v["id"], "name": v["name"], "links": []} for v in page]
+            response = {"volumes": page}
+            if more:
+                response["volumes_links"] = [{"rel": "next", "href": self._next(f"/volume/v3/{PROJECT_ID}{path}", query, page)}]
+            return 200, response, {}
+        if method == "POST" and path == "/volumes":
+            spec = body["volume"]
+            volume = _Resource({
+                "id": uuid.uuid4().hex, "name": spec.get("name"), "size": int(spec["size"]), "status": "creating",
+                "attachments": [], "bootable": "false", "created_at": _timestamp(), "updated_at": _timestamp(),
+                "links": [],
+            })
+            volume.schedule("available", self.build_seconds)
+            self.volumes[volume["id"]] = volume
+            return 202, {"volume": volume}, {}
+
+        match = re.fullmatch(r"/volumes/([^/]+)", path)
+        if not match:
+            raise HTTPError(404, f"No volume route {method} {path}")
+        volume = self._get(self.volumes, match.group(1), "Volume")
+        if method == "GET":
+            return 200, {"volume": volume}, {}
+        if method == "DELETE":
+            if volume["status"] not in ("available", "error"):
+                raise HTTPError(400, f"Volume status must be available or error, not {volume['status']}")
+            volume["status"] = "deleting"
+            volume.schedule("deleted", self.build_seconds, gone=True)
+            return 202, None, {}
+        raise HTTPError(400, f"Unsupported volume request {method} {path}")
+
+    @staticmethod
+    def _next_query(query, page):
+        params = {k: v for k, v in query.items() if k != "marker"}
+        params["marker"] = [page[-1]["id"]]
+        return urlencode(params, doseq=True)
+
+    def _next(self, path, query, page):
+        return f"{self.url}{path}?{self._next_query(query, page)}"
+
+    # -- neutron -------------------------------------------------------
+
+    def _network(self, method, path, query, body):
+        if path.endswith(".json"):
+            path = path[:-len(".json")]
+        if method == "GET" and path == f"/v2.0/quotas/{PROJECT_ID}":
+            return 200, {"quota": dict(self.quotas["network"])}, {}
+        match = re.fullmatch(r"/v2\.0/(networks|subnets|ports|floatingips|routers)(?:/([^/]+))?(?:/([a-z_]+))?", path)
+        if not match:
+            raise HTTPError(404, f"No network route {method} {path}")
+        collection, resource_id, action = match.groups()
+        store = {"networks": self.networks, "subnets": self.subnets, "ports": self.ports,
+                 "floatingips": {}, "routers": self.routers}[collection]
+        singular = collection[:-1]
+
+        if collection == "routers" and action in ("add_router_interface", "remove_router_interface"):
+            return self._router_interface(self._get(store, resource_id, "Router"), action, body)
+        if resource_id is None and method == "GET":
+            return self._list_neutron(collection, store, query)
+        if resource_id is None and method == "POST":
+            return 201, {singular: self._create_neutron(collection, body[singular])}, {}
+        resource = self._get(store, resource_id, singular.capitalize())
+        if method == "GET":
+            return 200, {singular: self._fields(resource, query)}, {}
+        if method == "DELETE":
+            self._delete_neutron(collection, resource)
+            return 204, None, {}
+        raise HTTPError(400, f"Unsupported network request {method} {path}")
+
+    @staticmethod
+    def _fields(resource, query):
+        fields = query.get("fields")
+        return {k: v for k, v in resource.items() if k in fields} if fields else dict(resource)
+
+    def _list_neutron(self, collection, store, query):
+        items = self._all(store)
+        since = query.get("changed_since", [None])[0]
+        if since is not None:
+            since = _parse_time(since)
+            items = [i for i in items if _parse_time(i["updated_at"]) >= since]
+        for key, values in query.items():
+            if key not in ("fields", "limit", "marker", "changed_since", "page_reverse"):
+                items = [i for i in items if str(i.get(key)) in values]
+        page, more = self._page(items, query)
+        response = {collection: [self._fields(i, query) for i in page]}
+        if more:
+            response[f"{collection}_links"] = [{"rel": "next", "href": self._next(f"/network/v2.0/{collection}", query, page)}]
+        return 200, response, {}
+
+    def _create_neutron(self, collection, spec):
+        base = {"id": uuid.uuid4().hex, "tenant_id": PROJECT_ID, "project_id": PROJECT_ID,
+                "created_at": _timestamp(), "updated_at": _timestamp()}
+        if collection == "networks":
+            network = _Resource({**base, "name": spec.get("name", ""), "status": "ACTIVE", "subnets": [],
+                                 "admin_state_up": spec.get("admin_state_up", True)})
+            self.networks[network["id"]] = network
+            return network
+        if collection == "subnets":
+            network = self._get(self.networks, spec["network_id"], "Network")
+            if any(s["cidr"] == spec["cidr"] for s in self.subnets.values()):
+                raise HTTPError(409, f"Subnet {spec['cidr']} overlaps an existing subnet")
+            subnet = _Resource({**base, "name": spec.get("name", ""), "network_id": network["id"],
+                                "cidr": spec["cidr"], "ip_version": spec.get("ip_version", 4),
+                                "dns_nameservers": spec.get("dns_nameservers", [])})
+            self.subnets[subnet["id"]] = subnet
+            network["subnets"].append(subnet["id"])
+            return subnet
+        if collection == "ports":
+            return self._add_port(spec["network_id"], spec.get("device_owner", ""), spec.get("device_id", ""))
+        raise HTTPError(400, f"Cannot create {collection}")
+
+    def _add_port(self, network_id, device_owner, device_id):
+        port = _Resource({"id": uuid.uuid4().hex, "network_id": network_id, "device_owner": device_owner,
+                          "device_id": device_id, "status": "ACTIVE", "tenant_id": PROJECT_ID,
+                          "created_at": _timestamp(), "updated_at": _timestamp()})
+        self.ports[port["id"]] = port
+        return port
+
+    def _delete_neutron(self, collection, resource):
+        if collection == "networks":
+            if any(p["network_id"] == resource["id"] for p in self.ports.values()):
+                raise HTTPError(409, f"Unable to complete operation on network {resource['id']}: ports in use")
+            for subnet_id in resource["subnets"]:
+                self.subnets.pop(subnet_id, None)
+            del self.networks[resource["id"]]
+        elif collection == "subnets":
+            if any(p["network_id"] == resource["network_id"] and p["device_owner"].startswith("network:router")
+                   for p in self.ports.values()):
+                raise HTTPError(409, f"Subnet {resource['id']} still has a router interface")
+            network = self.networks.get(resource["network_id"])
+            if network is not None:
+                network["subnets"].remove(resource["id"])
+            del self.subnets[resource["id"]]
+        elif collection == "ports":
+            del self.ports[resource["id"]]
+        else:
+            raise HTTPError(400, f"Cannot delete {collection}")
+
+    def _router_interface(self, router, action, spec):
+        if action == "add_router_interface":
+            subnet = self._get(self.subnets, spec["subnet_id"], "Subnet")
+            port = self._add_port(subnet["network_id"], "network:router_interface", router["id"])
+            return 200, {"id": router["id"], "subnet_id": subnet["id"], "port_id": port["id"],
+                         "tenant_id": PROJECT_ID}, {}
+        port = self._get(self.ports, spec["port_id"], "Port")
+        del self.ports[port["id"]]
+        return 200, {"id": router["id"], "port_id": port["id"], "tenant_id": PROJECT_ID}, {}
+
+    # -- glance --------------------------------------------------------
+
+    def _image(self, method, path, query, body):
+        if method != "GET" or path != "/v2/images":
+            raise HTTPError(404, f"No image route {method} {path}")
+        images = sorted((i for i in self.images.values() if i["status"] in query.get("status", ["active"])),
+                        key=lambda i: i["id"])
+        page, more = self._page(images, query, limit=25)
+        response = {"images": page}
+        if more:
+            response["next"] = f"/v2/images?{self._next_query(query, page)}"
+        etag = hashlib.sha256(json.dumps(response, sort_keys=True).encode()).hexdigest()
+        return 200, response, {"ETag": etag}
+
+    def add_image(self, **image):
+        """Register an image, as an upload to Glance would"""
+        with self._lock:
+            self.images[image["id"]] = dict(image, status="active")
+
+
+# Error bodies in each service's own format, which the clients parse for the message
+_ERROR_BODIES = {
+    "/compute/": lambda status, message: {{404: "itemNotFound", 400: "badRequest"}.get(status, "computeFault"):
+                                          {"code": status, "message": message}},
+    "/volume/": lambda status, message: {{404: "itemNotFound", 400: "badRequest"}.get(status, "computeFault"):
+                                         {"code": status, "message": message}},
+    "/network/": lambda status, message: {"NeutronError": {"type": "NotFound" if status == 404 else "Conflict",
+                                                           "message": message, "detail": ""}},
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    cloud = None
+    protocol_version = "HTTP/1.1"
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else None
+            status, payload, headers = self.cloud.handle(method, url.path, parse_qs(url.query), body)
+            if (status == 200 and url.path.startswith("/image/") and "ETag" in headers
+                    and self.headers.get("If-None-Match") == headers["ETag"]):
+                status, payload = 304, None
+        except HTTPError as e:
+            status, headers = e.status, {}
+            fmt = next((f for prefix, f in _ERROR_BODIES.items() if url.path.startswith(prefix)), None)
+            payload = fmt(e.status, str(e)) if fmt else {"error": {"code": e.status, "message": str(e)}}
+        except (KeyError, ValueError, TypeError) as e:
+            status, headers, payload = 400, {}, {"badRequest": {"code": 400, "message": f"Malformed request: {e}"}}
+
+        data = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API calls failing with 503")
+    parser.add_argument("--build-seconds", type=float, default=0.0, help="time for resources to settle")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cloud = FakeCloud(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                      build_seconds=args.build_seconds, seed=args.seed).start(args.host, args.port)
+    for name, value in cloud.env().items():
+        print(f"export {name}={value}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        cloud.stop()
+
+
+if __name__ == "__main__":
+    main()
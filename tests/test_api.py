@@ -1,9 +1,46 @@
+import time
 import pytest
 from fastapi.testclient import TestClient
+import init_db
 from app.main import app
+from app.models import database
+from app.models.audit import audit_log
+from app.openstack import auth, jobs
+from tests.fake_openstack import FakeCloud
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True, scope="module")
+def database_file(tmp_path_factory):
+    """Run the app against an upgraded SQLite file of its own instead of cloud_operations.db"""
+    engine = database.make_engine(f"sqlite:///{tmp_path_factory.mktemp('api') / 'api.db'}")
+    init_db.upgrade(engine)
+    database.SessionLocal.configure(bind=engine)
+    yield engine
+    audit_log.flush()
+    database.SessionLocal.configure(bind=database.engine)
+    engine.dispose()
+
+@pytest.fixture(autouse=True, scope="module")
+def fake_cloud():
+    """Point the OpenStack clients at a local fake cloud instead of a real one"""
+    with FakeCloud() as cloud, pytest.MonkeyPatch.context() as mp:
+        for name, value in cloud.env().items():
+            mp.setenv(name, value)
+        mp.delenv("OS_AUTH_TOKEN", raising=False)
+        auth.reset()
+        yield cloud
+    auth.reset()
+
+def wait_for_job(job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/jobs/{job_id}").json()
+        if job["status"] in jobs.TERMINAL_STATUSES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError("job did not finish")
+
 def test_create_vm_happy_path():
     """Test the happy path for VM creation"""
     # Step 1: Send initial request
@@ -20,7 +57,8 @@ def test_create_vm_happy_path():
         "parameters": {"name": "dev-box", "flavor": "S.4"}
     })
     assert response.status_code == 200
-    assert response.json()["status"] == "success"
+    assert response.json()["status"] == "accepted"
+    assert wait_for_job(response.json()["job_id"])["status"] == "succeeded"
 
 def test_create_vm_cancelled():
     """Test cancellation of VM creation"""
@@ -50,3 +88,34 @@ def test_invalid_request():
     assert response.status_code == 200
     data = response.json()
     assert "I'm sorry" in data["message"]
+
+@pytest.fixture
+def bulk(fake_cloud, monkeypatch):
+    """Fresh name indexes and no waiting between bulk retries"""
+    import functools
+    from app.openstack import bulk, cinder, nova
+    monkeypatch.setattr(bulk, "run_batch", functools.partial(bulk.run_batch, backoff=0.01))
+    nova.servers_index.refresh(full=True)
+    cinder.volumes_index.refresh(full=True)
+    yield fake_cloud
+    fake_cloud.fail_creates(())
+
+def test_bulk_vms_resubmit_failed_names(bulk):
+    """A failed multi-create falls back to one by one; the failed names can be posted back and are all that is created"""
+    bulk.fail_creates({"ci", "ci-2"})
+    response = client.post("/api/vm/bulk", json={"name": "ci-{n}", "count": 3, "flavor": "S.4"})
+    assert response.status_code == 200
+    assert (response.json()["created"], response.json()["failed"]) == (2, ["ci-2"])
+
+    bulk.fail_creates(())
+    response = client.post("/api/vm/bulk", json={"names": response.json()["failed"], "flavor": "S.4"})
+    assert (response.json()["created"], response.json()["failed"]) == (1, [])
+    assert sorted(s["name"] for s in bulk.servers.values() if s["name"].startswith("ci-")) == ["ci-1", "ci-2", "ci-3"]
+
+def test_bulk_volumes_skip_existing(bulk):
+    """Volumes that already exist are reported, not created again; bad counts are rejected"""
+    response = client.post("/api/volume/bulk", json={"name": "scratch-{n}", "count": 2, "size": 5})
+    assert response.json()["created"] == 2
+    response = client.post("/api/volume/bulk", json={"name": "scratch-{n}", "count": 3, "size": 5})
+    assert (response.json()["created"], response.json()["existing"]) == (1, 2)
+    assert client.post("/api/volume/bulk", json={"name": "x", "count": 0, "size": 5}).status_code == 400
@@ -0,0 +1,88 @@
+import asyncio
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.audit import AuditLog
+from app.models.models import Base, UserInteraction
+
+def make_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'audit.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+def test_records_are_written_in_batches(tmp_path):
+    """Queued records reach the database once flushed"""
+    Session = make_session_factory(tmp_path)
+    log = AuditLog(session_factory=Session, batch_size=10)
+
+    async def write_all():
+        for i in range(25):
+            await log.write({"user_message": f"msg {i}", "detected_intent": "get_usage", "entities": {}})
+    asyncio.run(write_all())
+    log.flush()
+
+    db = Session()
+    assert db.query(UserInteraction).count() == 25
+    db.close()
+    assert log.written == 25
+
+def test_close_drains_the_queue(tmp_path):
+    """close() writes everything still queued before stopping"""
+    Session = make_session_factory(tmp_path)
+    log = AuditLog(session_factory=Session, max_queue=2, batch_size=1)
+
+    async def write_all():
+        for i in range(5):
+            await log.write({"user_message": f"msg {i}", "detected_intent": "unknown", "entities": {}})
+    asyncio.run(write_all())
+    log.close()
+
+    db = Session()
+    assert db.query(UserInteraction).count() == 5
+    db.close()
+
+def test_failed_batch_is_retried_once(tmp_path, caplog):
+    """A batch whose commit fails is written on the retry; one that fails twice is dropped and logged"""
+    Session = make_session_factory(tmp_path)
+    failures = []
+
+    def locked():
+        raise RuntimeError("database is locked")
+
+    def flaky_session():
+        db = Session()
+        if failures:
+            failures.pop()
+            db.commit = locked
+        return db
+
+    log = AuditLog(session_factory=flaky_session, retry_seconds=0)
+    record = {"user_message": "show usage", "detected_intent": "get_usage", "entities": {}}
+    failures.append(1)
+    log._flush([dict(record)])
+    assert (log.written, log.failed) == (1, 0)
+
+    failures.extend([1, 1])
+    log._flush([dict(record)])
+    assert (log.written, log.failed) == (1, 1)
+    assert "dropped 1 records: database is locked" in caplog.text
+
+    db = Session()
+    assert db.query(UserInteraction).count() == 1
+    db.close()
+
+def test_missing_columns_are_added_to_old_databases(tmp_path):
+    """A user_interactions table from before latency_ms gets the column, so records with it can be written"""
+    from sqlalchemy import inspect
+    import init_db
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE user_interactions (id INTEGER PRIMARY KEY, timestamp DATETIME, "
+                             "user_message VARCHAR, detected_intent VARCHAR, entities JSON, system_response VARCHAR, "
+                             "operation_executed VARCHAR, operation_result JSON)")
+    init_db.add_missing_columns(bind=engine)
+    assert "latency_ms" in {c["name"] for c in inspect(engine).get_columns("user_interactions")}
+
+    log = AuditLog(session_factory=sessionmaker(bind=engine))
+    asyncio.run(log.write({"user_message": "show usage", "detected_intent": "get_usage", "entities": {}}, started=0))
+    log.flush()
+    assert log.written == 1
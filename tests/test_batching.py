@@ -0,0 +1,91 @@
+import pytest
+import threading
+from app.nlp.batching import MicroBatcher
+
+def test_concurrent_items_share_a_batch():
+    """Items submitted within the window are processed together, in order"""
+    batches = []
+    release = threading.Event()
+    def process(items):
+        batches.append(list(items))
+        release.wait(1)
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(process, window=0.2, max_batch_size=3)
+    futures = [batcher.submit(i) for i in range(4)]
+    release.set()
+    assert [f.result(timeout=2) for f in futures] == [0, 2, 4, 6]
+    assert batches == [[0, 1, 2], [3]]
+
+def test_batch_errors_reach_every_future():
+    """An exception from the batch function fails each item's future"""
+    def process(items):
+        raise RuntimeError("model crashed")
+
+    batcher = MicroBatcher(process, window=0)
+    with pytest.raises(RuntimeError, match="model crashed"):
+        batcher.submit("create a vm").result(timeout=2)
+
+def test_items_without_a_result_fail():
+    """Items past the end of a short result list fail instead of waiting forever"""
+    batcher = MicroBatcher(lambda items: [item.upper() for item in items[:1]], window=0.2, max_batch_size=2)
+    first, second = batcher.submit("a"), batcher.submit("b")
+    assert first.result(timeout=2) == "A"
+    with pytest.raises(RuntimeError, match="1 results for 2 items"):
+        second.result(timeout=2)
+
+class StubEncoding:
+    def __init__(self, input_ids, attention_mask):
+        self.input_ids = input_ids
+        self.attention_mask = attention_mask
+
+    def to(self, device):
+        return self
+
+class StubTokenizer:
+    """One token per character, left-padded with 0"""
+    pad_token_id = 0
+
+    def __call__(self, texts, add_special_tokens=False, padding=True, return_tensors="pt"):
+        import torch
+        width = max(len(text) for text in texts)
+        ids = [[0] * (width - len(text)) + [ord(c) for c in text] for text in texts]
+        return StubEncoding(torch.tensor(ids), (torch.tensor(ids) != 0).long())
+
+    def decode(self, row, skip_special_tokens=True):
+        return "".join(chr(token) for token in row.tolist() if token)
+
+class StubModel:
+    """Answers get_usage for every row"""
+    device = "cpu"
+
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, input_ids, attention_mask, **kwargs):
+        import torch
+        self.calls.append((input_ids, attention_mask))
+        answer = torch.tensor([ord(c) for c in '{"intent": "get_usage", "entities": {}}'])
+        return torch.cat([input_ids, answer.expand(input_ids.shape[0], -1)], dim=1)
+
+def test_generate_batch_returns_one_row_per_message():
+    """_generate_batch prefixes the cached prompt, masks the padding and decodes only the new tokens"""
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from app.nlp.intent_parser import OpenHermesIntentParser
+
+    parser = OpenHermesIntentParser.__new__(OpenHermesIntentParser)
+    parser.tokenizer, parser.model = StubTokenizer(), StubModel()
+    parser.max_new_tokens, parser.prompt_suffix = 64, "?"
+    parser.prefix_ids = torch.tensor([[1, 2, 3]])
+    parser.prefix_cache = ((torch.zeros(1, 2, 3, 4), torch.zeros(1, 2, 3, 4)),)
+    parser.brace_delta = torch.zeros(128, dtype=torch.long)
+
+    rows = parser._generate_batch(["show usage", "hi"])
+    assert rows == ['{"intent": "get_usage", "entities": {}}'] * 2
+    input_ids, attention_mask = parser.model.calls[0]
+    assert input_ids.shape == (2, 3 + len("show usage?"))
+    assert attention_mask[1].tolist() == [1] * 3 + [0] * 8 + [1] * 3
+
+    parser.batcher = MicroBatcher(parser._generate_batch, window=0)
+    assert parser.extract_intent("show usage").intent == "get_usage"
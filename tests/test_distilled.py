@@ -0,0 +1,69 @@
+import json
+import os
+import pytest
+from app.nlp import distill
+from app.nlp.distilled_parser import DistilledIntentParser, DistilledModel, latest_version, tokenize, versions
+
+LOGGED = [
+    (1, "Create an S.4 VM named dev-box", "create_vm", {"name": "dev-box", "flavor": "S.4"}),
+    (2, "delete volume data1", "delete_volume", {"name": "data1"}),
+    (3, "show my usage", "get_usage", {}),
+    (4, "what is the weather like", "unknown", {}),
+]
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("intent"))
+    distill.train(LOGGED, path, synthetic=3000, epochs=4, bits=14)
+    return path
+
+
+def test_tokenize_keeps_names_and_flavors():
+    """Dots and dashes inside words survive tokenizing; trailing punctuation does not"""
+    assert tokenize("Create an S.4 VM named ci-{n}.") == ["Create", "an", "S.4", "VM", "named", "ci-{n}"]
+
+
+def test_predicts_intent_and_entities(model_dir):
+    """The distilled model returns a typed result with the schema's coercions"""
+    parser = DistilledIntentParser(model_dir)
+    result = parser.extract_intent("create a vm named web-7 with flavor m.8")
+    assert (result.intent, result.name, result.flavor) == ("create_vm", "web-7", "M.8")
+    assert 0 < result.confidence <= 1
+    assert parser.submit("create 3 volumes of 20GB").result().intent == "bulk_create_volume"
+    assert parser.extract_intent("tell me a joke about penguins").intent == "unknown"
+
+
+def test_incremental_training_adds_a_version(model_dir):
+    """A second run warm-starts from LATEST, trains only on newer rows and moves LATEST on"""
+    first = latest_version(model_dir)
+    meta = distill.train([(5, "delete vm old-box", "delete_vm", {"name": "old-box"})], model_dir,
+                         synthetic=500, epochs=1, bits=12)
+    assert meta["incremental"] and meta["bits"] == 14
+    assert meta["last_interaction_id"] == 5
+    assert versions(model_dir) == [first, meta["version"]] and latest_version(model_dir) == meta["version"]
+    with open(os.path.join(model_dir, first, "meta.json")) as f:
+        assert json.load(f)["last_interaction_id"] == 4
+    assert DistilledModel.load(model_dir, first).meta["version"] == first
+
+
+def test_schema_change_reads_every_row_again(tmp_path, monkeypatch):
+    """Rows are read from the last trained id only while the latest version can be warm-started"""
+    assert distill.resume_after(str(tmp_path)) == 0
+    distill.train(LOGGED, str(tmp_path), synthetic=100, epochs=1, bits=10)
+    assert distill.resume_after(str(tmp_path)) == 4
+    monkeypatch.setattr(distill, "INTENTS", distill.INTENTS + ["reboot_vm"])
+    assert distill.resume_after(str(tmp_path)) == 0
+
+
+def test_old_versions_are_pruned(tmp_path):
+    """Only the newest keep versions remain after training"""
+    for _ in range(3):
+        distill.train(LOGGED, str(tmp_path), full=True, synthetic=100, epochs=1, bits=10, keep=2)
+    assert versions(str(tmp_path)) == ["v0002", "v0003"]
+
+
+def test_missing_model(tmp_path):
+    """Loading without a trained model says how to train one"""
+    with pytest.raises(FileNotFoundError, match="app.nlp.distill"):
+        DistilledModel.load(str(tmp_path))
@@ -0,0 +1,49 @@
+import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models import history
+from app.models.models import Base, UserInteraction
+
+def make_db(tmp_path, latencies):
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    start = datetime.datetime(2026, 1, 1)
+    for i, latency in enumerate(latencies):
+        db.add(UserInteraction(
+            timestamp=start + datetime.timedelta(minutes=i),
+            user_message=f"msg {i}",
+            detected_intent="create_vm" if i % 2 else "get_usage",
+            entities={},
+            system_response="ok",
+            latency_ms=latency
+        ))
+    db.commit()
+    return db
+
+def test_keyset_pages_cover_every_row_once(tmp_path):
+    """Following next_cursor visits each row exactly once, newest first"""
+    db = make_db(tmp_path, [1.0] * 25)
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor = history.history_page(db, 10, cursor)
+        seen.extend(row.id for row in rows)
+        if cursor is None:
+            break
+    assert seen == list(range(25, 0, -1))
+
+def test_filters_and_streaming(tmp_path):
+    """Streaming applies the same filters as paging"""
+    db = make_db(tmp_path, [1.0] * 10)
+    rows = list(history.iter_history(db, intent="create_vm", since=datetime.datetime(2026, 1, 1, 0, 4)))
+    assert [row.user_message for row in rows] == ["msg 9", "msg 7", "msg 5"]
+
+def test_intent_stats_percentiles(tmp_path):
+    """Percentiles use nearest rank within each intent"""
+    db = make_db(tmp_path, [float(i) for i in range(1, 201)])
+    stats = {row["intent"]: row for row in history.intent_stats(db)}
+    usage = stats["get_usage"]  # latencies 1, 3, ..., 199
+    assert usage["count"] == 100
+    assert usage["p50_ms"] == 99.0
+    assert usage["p99_ms"] == 197.0
@@ -0,0 +1,41 @@
+from app.nlp.intent import IntentResult
+from app.nlp.intent_cache import IntentCache, normalize
+
+def test_normalize_folds_case_whitespace_and_punctuation():
+    """Equivalent phrasings normalize to the same key; names and flavors survive"""
+    assert normalize("  Create an S.4 VM named dev-box!  ") == "create an s.4 vm named dev-box"
+    assert normalize("What's my project usage?") == normalize("what s my   project usage")
+
+def test_key_keeps_what_the_parser_keeps():
+    """Messages the grammar reads differently never share a key"""
+    from app.nlp.grammar import parse
+    assert parse("Create an S.4 VM named web.")[1]["name"] == "web."
+    assert normalize("Create an S.4 VM named web.") != normalize("create an s.4 vm named web")
+
+def test_lru_evicts_least_recently_used_within_budget():
+    """The LRU stays within its byte budget and counts hits and misses"""
+    cache = IntentCache(ttl=60, max_bytes=300, path="")
+    first = IntentResult("delete_vm", name="x" * 20)
+    cache.put("rules", "a", first)
+    cache.put("rules", "b", IntentResult("delete_vm", name="y" * 20))
+    assert cache.get("rules", "A!") is first
+    cache.put("rules", "c", IntentResult("delete_vm", name="z" * 20))
+    assert cache.get("rules", "b") is None
+    assert cache.get("rules", "a") is not None
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["bytes"] <= 300
+
+def test_entries_expire():
+    """Entries older than the TTL are misses"""
+    cache = IntentCache(ttl=0, path="")
+    cache.put("rules", "usage", IntentResult("get_usage"))
+    assert cache.get("rules", "usage") is None
+
+def test_shared_store_serves_other_workers(tmp_path):
+    """A second cache on the same file sees entries written by the first"""
+    path = str(tmp_path / "intent_cache.db")
+    result = IntentResult("delete_vm", name="web", confidence=1.0)
+    IntentCache(ttl=60, path=path).put("rules", "delete vm web", result)
+    other = IntentCache(ttl=60, path=path)
+    assert other.get("rules", "Delete VM web!") == result
+    assert other.stats()["shared_hits"] == 1
@@ -0,0 +1,169 @@
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.models import Base
+from app.openstack import jobs
+
+def make_runner(tmp_path, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return jobs.JobRunner(session_factory=sessionmaker(bind=engine), workers=2, poll_initial=0.01, poll_max=0.04, **kwargs)
+
+def fake_operation(statuses, polls):
+    def poll(resource_id):
+        polls.append(time.monotonic())
+        return statuses.pop(0) if len(statuses) > 1 else statuses[0]
+    return jobs.Operation(lambda p: ("res-1", {"id": "res-1"}), poll, {"ACTIVE"}, {"ERROR"},
+                          "{name} starting", "{name} ready")
+
+def wait_for(runner, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = runner.get(job_id)
+        if job["status"] in jobs.TERMINAL_STATUSES:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+def test_job_polls_until_active(tmp_path, monkeypatch):
+    """A job succeeds once the resource reaches a done status, backing off between polls"""
+    polls = []
+    monkeypatch.setitem(jobs.OPERATIONS, "fake", fake_operation(["BUILD", "BUILD", "BUILD", "ACTIVE"], polls))
+    runner = make_runner(tmp_path)
+    delays = []
+    wait = runner._stopping.wait
+    runner._stopping.wait = lambda timeout: delays.append(timeout) or wait(timeout)
+
+    job = runner.submit("fake", {"name": "vm-1"})
+    assert job["status"] == "queued"
+    assert job["message"] == "vm-1 starting"
+
+    job = wait_for(runner, job["id"])
+    assert job["status"] == "succeeded"
+    assert job["resource_id"] == "res-1"
+    assert job["resource_status"] == "ACTIVE"
+    assert job["message"] == "vm-1 ready"
+    assert len(polls) == 4
+    assert delays == [0.01, 0.02, 0.04, 0.04]
+    runner.shutdown()
+
+def test_job_fails_on_error_status(tmp_path, monkeypatch):
+    """A resource that goes to ERROR fails the job"""
+    monkeypatch.setitem(jobs.OPERATIONS, "fake", fake_operation(["BUILD", "ERROR"], []))
+    runner = make_runner(tmp_path)
+
+    job = wait_for(runner, runner.submit("fake", {"name": "vm-1"})["id"])
+    assert job["status"] == "failed"
+    assert job["resource_status"] == "ERROR"
+    runner.shutdown()
+
+def test_job_times_out(tmp_path, monkeypatch):
+    """A resource that never settles fails the job after the timeout"""
+    monkeypatch.setitem(jobs.OPERATIONS, "fake", fake_operation(["BUILD"], []))
+    runner = make_runner(tmp_path, timeout=0.1)
+
+    job = wait_for(runner, runner.submit("fake", {"name": "vm-1"})["id"])
+    assert job["status"] == "failed"
+    assert "Timed out" in job["message"]
+    runner.shutdown()
+
+def test_same_idempotency_key_returns_first_job(tmp_path, monkeypatch):
+    """A repeated confirmation with the same key starts nothing new"""
+    starts = []
+    monkeypatch.setitem(jobs.OPERATIONS, "fake", jobs.Operation(
+        lambda p: starts.append(p) or ("res-1", {}), None, None, None, "{name} starting", "{name} ready"))
+    runner = make_runner(tmp_path)
+
+    first = runner.submit("fake", {"name": "vm-1"}, "key-1")
+    again = runner.submit("fake", {"name": "vm-1"}, "key-1")
+    assert again["id"] == first["id"] and again["duplicate"]
+    wait_for(runner, first["id"])
+    assert len(starts) == 1
+    with pytest.raises(jobs.IdempotencyConflict):
+        runner.submit("fake", {"name": "vm-2"}, "key-1")
+    runner.shutdown()
+
+def test_concurrent_identical_requests_share_one_job(tmp_path, monkeypatch):
+    """Identical keyless requests racing each other are merged onto one job"""
+    monkeypatch.setitem(jobs.OPERATIONS, "fake", fake_operation(["ACTIVE"], []))
+    runner = make_runner(tmp_path)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: runner.submit("fake", {"name": "vm-1"}), range(8)))
+    assert len({job["id"] for job in results}) == 1
+    assert sum(1 for job in results if not job.get("duplicate")) == 1
+    runner.shutdown()
+
+def test_derived_key_expires_after_window(tmp_path, monkeypatch):
+    """Once the job has finished and the window has passed, the same request runs again"""
+    monkeypatch.setitem(jobs.OPERATIONS, "fake", fake_operation(["ACTIVE"], []))
+    runner = make_runner(tmp_path, derived_window=0)
+
+    first = wait_for(runner, runner.submit("fake", {"name": "vm-1"})["id"])
+    second = runner.submit("fake", {"name": "vm-1"})
+    assert second["id"] != first["id"] and not second.get("duplicate")
+    assert runner.get(first["id"])["idempotency_key"] is None
+    runner.shutdown()
+
+def test_shutdown_fails_jobs_that_never_started(tmp_path, monkeypatch):
+    """Jobs still queued at shutdown are cancelled and marked failed instead of staying queued"""
+    import threading
+    release = threading.Event()
+    monkeypatch.setitem(jobs.OPERATIONS, "fake", jobs.Operation(
+        lambda p: release.wait(5) and ("res-1", {}), None, None, None, "{name} starting", "{name} ready"))
+    runner = make_runner(tmp_path)
+    started = [runner.submit("fake", {"name": f"vm-{i}"}) for i in range(3)]
+
+    runner.shutdown()
+    release.set()
+    queued = wait_for(runner, started[2]["id"])
+    assert queued["status"] == "failed"
+    assert queued["message"] == "Server shut down before the job started"
+    assert wait_for(runner, started[0]["id"])["status"] == "succeeded"
+
+def test_recover_fails_orphaned_jobs(tmp_path, monkeypatch):
+    """Queued or running jobs nobody heartbeats fail; this runner's own jobs are kept fresh"""
+    import datetime
+    import threading
+    from app.models.models import ProvisioningJob
+    release = threading.Event()
+    monkeypatch.setitem(jobs.OPERATIONS, "fake", jobs.Operation(
+        lambda p: release.wait(5) and ("res-1", {}), None, None, None, "{name} starting", "{name} ready"))
+    runner = make_runner(tmp_path, stale_after=60)
+    own = runner.submit("fake", {"name": "vm-1"}, "key-own")
+
+    long_ago = datetime.datetime.utcnow() - datetime.timedelta(minutes=5)
+    db = runner._session_factory()
+    db.add(ProvisioningJob(id="orphan", operation="fake", parameters={"name": "vm-2"}, status="running",
+                           idempotency_key="key-orphan", created_at=long_ago, updated_at=long_ago))
+    db.query(ProvisioningJob).filter(ProvisioningJob.id == own["id"]).update({"updated_at": long_ago})
+    db.commit()
+    db.close()
+
+    runner._touch()
+    assert runner.recover() == 1
+    orphan = runner.get("orphan")
+    assert orphan["status"] == "failed" and "stopped before it finished" in orphan["message"]
+    assert runner.get(own["id"])["status"] in ("queued", "running")
+    release.set()
+    assert wait_for(runner, own["id"])["status"] == "succeeded"
+    runner.shutdown()
+
+def test_upgrade_creates_tables_missing_from_old_databases(tmp_path):
+    """A database from before provisioning_jobs gets the table (and its columns) without touching the rest"""
+    from sqlalchemy import inspect
+    import init_db
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE user_interactions (id INTEGER PRIMARY KEY, user_message VARCHAR)")
+        conn.exec_driver_sql("INSERT INTO user_interactions (user_message) VALUES ('hello')")
+    init_db.upgrade(bind=engine)
+    init_db.upgrade(bind=engine)
+
+    inspector = inspect(engine)
+    assert "idempotency_key" in {c["name"] for c in inspector.get_columns("provisioning_jobs")}
+    assert "latency_ms" in {c["name"] for c in inspector.get_columns("user_interactions")}
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT user_message FROM user_interactions").scalar() == "hello"
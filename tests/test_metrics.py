@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import pytest
+from app import metrics
+
+def test_histogram_renders_cumulative_buckets():
+    """Buckets are cumulative, with sum and count, in Prometheus text format"""
+    registry = []
+    histogram = metrics.Histogram("op_seconds", "Op latency", ("op",), buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.5, 0.5, 2.0):
+        histogram.labels("create").observe(value)
+    text = metrics.render(registry)
+    assert '# TYPE op_seconds histogram' in text
+    assert 'op_seconds_bucket{op="create",le="0.1"} 1' in text
+    assert 'op_seconds_bucket{op="create",le="1.0"} 3' in text
+    assert 'op_seconds_bucket{op="create",le="+Inf"} 4' in text
+    assert 'op_seconds_sum{op="create"} 3.05' in text
+    assert 'op_seconds_count{op="create"} 4' in text
+
+def test_counters_sum_updates_from_many_threads():
+    """Per-thread cells add up exactly, without a lock on the update path"""
+    registry = []
+    counter = metrics.Counter("hits_total", "Hits", registry=registry)
+    def hit():
+        for _ in range(10000):
+            counter.labels().inc()
+    threads = [threading.Thread(target=hit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert "hits_total 80000" in metrics.render(registry)
+    with pytest.raises(ValueError):
+        counter.labels("unexpected")
+
+def test_cells_of_exited_threads_are_folded():
+    """Threads of short-lived pools leave their counts in the totals but no cells behind"""
+    from concurrent.futures import ThreadPoolExecutor
+    registry = []
+    histogram = metrics.Histogram("op_seconds", "Op latency", buckets=(1.0,), registry=registry)
+    for _ in range(20):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda _: histogram.labels().observe(0.5), range(8)))
+    histogram.labels().observe(2.0)
+    assert len(histogram.labels()._cells._cells) == 1
+    text = metrics.render(registry)
+    assert 'op_seconds_bucket{le="1.0"} 160' in text and "op_seconds_count 161" in text
+
+def test_instrument_times_sync_and_async_functions():
+    """Wrapped functions record ok and error outcomes and leave nothing in flight"""
+    def get_thing(name):
+        if name == "missing":
+            raise KeyError(name)
+        return name
+    async def make_thing(name):
+        return name
+    namespace = {"__name__": __name__, "get_thing": get_thing, "make_thing": make_thing}
+    get_thing.__module__ = make_thing.__module__ = __name__
+    metrics.instrument(namespace, "fake")
+
+    assert namespace["get_thing"]("a") == "a"
+    with pytest.raises(KeyError):
+        namespace["get_thing"]("missing")
+    assert asyncio.run(namespace["make_thing"]("b")) == "b"
+    text = metrics.render()
+    assert 'openstack_call_duration_seconds_count{service="fake",call="get_thing",outcome="ok"} 1' in text
+    assert 'openstack_call_duration_seconds_count{service="fake",call="get_thing",outcome="error"} 1' in text
+    assert 'openstack_call_duration_seconds_count{service="fake",call="make_thing",outcome="ok"} 1' in text
+    assert 'openstack_calls_in_flight{service="fake"} 0' in text
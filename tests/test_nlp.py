@@ -0,0 +1,189 @@
+import pytest
+from concurrent.futures import Future
+from app.nlp.grammar import parse
+from app.nlp import planner
+from app.nlp.rule_based_parser import RuleBasedIntentParser
+from app.nlp.intent import IntentResult, from_llm_output
+
+def test_create_vm_entities():
+    """Name and flavor are extracted and the flavor is normalised"""
+    assert parse("Create an S.4 VM named dev-box") == ("create_vm", {"name": "dev-box", "flavor": "S.4"})
+
+def test_image_entity():
+    """An image can be named after "using", "running" or "image"; it is optional"""
+    assert parse("Create an S.4 VM named dev-box using ubuntu-22.04") == (
+        "create_vm", {"name": "dev-box", "flavor": "S.4", "image": "ubuntu-22.04"})
+    assert parse("create a vm named x from image fedora with flavor m.8")[1]["image"] == "fedora"
+
+def test_defaults_when_entities_missing():
+    """Missing entities fall back to the rule's defaults"""
+    assert parse("create a volume") == ("create_volume", {"name": "default-volume", "size": 100})
+    assert parse("create a network") == ("create_network", {"name": "default-network"})
+
+def test_object_after_verb():
+    """The object of resize/delete skips articles and resource nouns"""
+    assert parse("resize the vm web-1 to m.8") == ("resize_vm", {"name": "web-1", "flavor": "M.8"})
+    assert parse("Delete volume data1") == ("delete_volume", {"name": "data1"})
+    assert parse("delete my-vm") == ("delete_vm", {"name": "my-vm"})
+
+def test_resize_without_vm_keyword():
+    """Resize needs no "vm" keyword and skips "flavor" before the target"""
+    assert parse("Resize dev-box to flavor M.8") == ("resize_vm", {"name": "dev-box", "flavor": "M.8"})
+    assert parse("resize web to flavor large") == ("resize_vm", {"name": "web", "flavor": "large"})
+
+def test_bulk_create():
+    """A count before a plural noun selects the bulk intents and keeps the {n} name pattern"""
+    assert parse("create 40 S.4 VMs named ci-{n}") == ("bulk_create_vm", {"name": "ci-{n}", "flavor": "S.4", "count": 40})
+    assert parse("create 3 volumes of 20GB") == ("bulk_create_volume", {"name": "volume-{n}", "size": 20, "count": 3})
+
+def test_departures_from_the_if_elif_parser():
+    """Words are matched whole, so names no longer change the intent or leak into other entities"""
+    assert parse("create a volume named backup-vm")[0] == "create_volume"
+    assert parse("create a network called vm-net") == ("create_network", {"name": "vm-net"})
+    assert parse("resize the vm photos-store to m.8")[1] == {"name": "photos-store", "flavor": "M.8"}
+    assert parse("create 10 XL.32 VMs named prod-db-{n}")[1]["count"] == 10
+    assert parse("create s.4 vms named ubuntu-22.04")[0] == "create_vm"
+
+def test_usage_synonyms_and_unknown():
+    """Quota is a synonym for usage; unrelated text is unknown"""
+    assert parse("What's my project usage?")[0] == "get_usage"
+    assert parse("show my quota")[0] == "get_usage"
+    assert parse("Do something completely unrelated") == ("unknown", {})
+
+def test_rule_based_parser_returns_intent_result():
+    """The rule-based parser returns the grammar's match as a typed IntentResult"""
+    result = RuleBasedIntentParser().extract_intent("create a 50GB volume named data")
+    assert result == IntentResult("create_volume", name="data", size=50, confidence=1.0)
+    assert result.entities() == {"name": "data", "size": 50}
+    assert RuleBasedIntentParser().extract_intent("create a vm").missing == ("flavor",)
+
+def test_llm_output_is_read_against_the_schema():
+    """The first intent object is decoded, coerced to typed fields, and trailing text is ignored"""
+    text = 'Sure! {"intent": "create_volume", "entities": {"name": "data", "size": "50GB", "color": "red"}} {"intent'
+    assert from_llm_output(text) == IntentResult("create_volume", name="data", size=50, confidence=1.0)
+    result = from_llm_output('{"intent": "create_vm", "entities": {"name": "web", "flavor": "m.8"}}')
+    assert (result.flavor, result.missing) == ("M.8", ())
+    assert from_llm_output('{"intent": "launch_rocket", "entities": {}}').intent == "unknown"
+    assert from_llm_output('{"intent": "create_vm", "entities": {"name"') is None
+    assert from_llm_output("no json here") is None
+
+def test_backends_load_lazily():
+    """The configured backend loads on first use and reports readiness"""
+    import asyncio
+    from app.nlp import backends
+    parser = asyncio.run(backends.get_parser("rules"))
+    assert isinstance(parser, RuleBasedIntentParser)
+    assert backends.status("rules")["ready"]
+    with pytest.raises(ValueError, match="Unknown intent parser"):
+        backends.load("gpt")
+
+@pytest.fixture
+def backends(monkeypatch):
+    """app.nlp.backends with its own loads and intent cache, so test backends never outlive the test"""
+    from app.nlp import backends
+    from app.nlp.intent_cache import IntentCache
+    monkeypatch.setattr(backends, "_loads", {})
+    monkeypatch.setattr(backends, "_failures", {})
+    monkeypatch.setattr(backends, "intent_cache", IntentCache(path=None))
+    return backends
+
+class FlakyParser:
+    builds = 0
+
+    def __init__(self):
+        FlakyParser.builds += 1
+        if FlakyParser.builds == 1:
+            raise OSError("model download failed")
+
+def test_failed_backend_load_is_retried(monkeypatch, backends):
+    """A failed load reports its error until the backoff passes, then the next load() tries again"""
+    monkeypatch.setitem(backends.BACKENDS, "flaky", "tests.test_nlp:FlakyParser")
+    monkeypatch.setattr(backends, "LOAD_RETRY_SECONDS", 60)
+    monkeypatch.setattr(FlakyParser, "builds", 0)
+
+    with pytest.raises(OSError):
+        backends.load("flaky").result(timeout=2)
+    assert backends.status("flaky")["error"] == "model download failed"
+    assert backends.load("flaky").exception() is not None
+
+    monkeypatch.setattr(backends, "_failures", {"flaky": (1, 0)})
+    assert isinstance(backends.load("flaky").result(timeout=2), FlakyParser)
+    assert backends.status("flaky")["ready"] and "flaky" not in backends._failures
+
+class StubParser:
+    calls = []
+    results = {
+        "resolved": IntentResult("create_vm", name="web", flavor="S.4", confidence=1.0),
+        "missing flavor": IntentResult("create_vm", name="web", flavor="default-flavor", missing=("flavor",)),
+        "fallback": IntentResult("get_usage", confidence=1.0, fallback=True),
+    }
+
+    def extract_intent(self, user_message):
+        StubParser.calls.append(user_message)
+        return StubParser.results[user_message]
+
+def test_only_resolved_intents_are_cached(monkeypatch, backends, tmp_path):
+    """Results with missing entities or from a fallback are parsed again; the shared file is read off the loop"""
+    import asyncio
+    import threading
+    from app.nlp.intent_cache import IntentCache
+    monkeypatch.setitem(backends.BACKENDS, "stub", "tests.test_nlp:StubParser")
+    monkeypatch.setattr(StubParser, "calls", [])
+    cache = IntentCache(path=str(tmp_path / "intents.db"))
+    monkeypatch.setattr(backends, "intent_cache", cache)
+    threads = []
+    shared_get = cache._shared.get
+    monkeypatch.setattr(cache._shared, "get", lambda *args: threads.append(threading.current_thread()) or shared_get(*args))
+
+    async def parse_all():
+        return [await backends.extract_intent(message, "stub") for message in list(StubParser.results) * 2]
+
+    results = asyncio.run(parse_all())
+    assert results == list(StubParser.results.values()) * 2
+    assert StubParser.calls == ["resolved", "missing flavor", "fallback", "missing flavor", "fallback"]
+    assert threads and threading.main_thread() not in threads
+
+class FakeLLMParser:
+    def submit(self, user_message):
+        future = Future()
+        future.set_result(IntentResult("create_vm", name="x", flavor="M.8", confidence=1.0))
+        return future
+
+def test_cascade_escalates_only_when_rules_are_unsure(monkeypatch, backends):
+    """Confident rule matches stay on the rules tier; missing flavors go to the LLM"""
+    from app.nlp.cascade import CascadingIntentParser
+    monkeypatch.setitem(backends.BACKENDS, "fake-llm", "tests.test_nlp:FakeLLMParser")
+    parser = CascadingIntentParser(llm_backend="fake-llm")
+    backends.load("fake-llm").result(timeout=2)
+
+    assert parser.extract_intent("Create an S.4 VM named a").flavor == "S.4"
+    assert parser.extract_intent("create a vm named x").flavor == "M.8"
+    tiers = parser.stats()["tiers"]
+    assert tiers["rules"]["hits"] == 1 and tiers["llm"]["hits"] == 1
+
+def test_planner_builds_dependency_graph():
+    """Independent creates run first; the VM waits for its network and the attach for both"""
+    steps = planner.plan("create network foo, a 50GB volume bar and a VM baz with flavor s.4 attached to both")
+    assert [(s["operation"], s["depends_on"]) for s in steps] == [
+        ("create_network", []), ("create_volume", []), ("create_vm", ["s1"]), ("attach_volume", ["s3", "s2"])]
+    assert steps[2]["parameters"]["networks"] == ["foo"]
+    assert steps[3]["parameters"] == {"server": "baz", "volume": "bar"}
+
+def test_summary_orders_dependencies_numerically():
+    """Step 10 is listed after step 2"""
+    steps = [{"id": "s11", "operation": "create_network", "parameters": {"name": "n"}, "depends_on": ["s10", "s2"]}]
+    assert planner.summarize(steps) == "1. create network 'n' (after step 2, 10)"
+
+def test_planner_ignores_single_requests():
+    """A single operation is left to the intent parser"""
+    assert planner.plan("create a vm web with flavor s.4") is None
+    assert planner.plan("create 3 volumes of 20GB and a network n") is None
+
+def test_planner_only_continues_verbs_into_noun_clauses():
+    """A clause opening with another verb is not read as the previous clause's operation"""
+    assert planner.plan("create vm web, attach volume data to it") is None
+    assert planner.plan("create a 10gb volume logs and attach it to vm web") is None
+    assert planner.plan("delete vm old and show my quota") is None
+    steps = planner.plan("delete vm old, the volume logs and vm two")
+    assert [s["operation"] for s in steps] == ["delete_vm", "delete_volume", "delete_vm"]
+
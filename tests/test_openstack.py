@@ -0,0 +1,443 @@
+import pytest
+from types import SimpleNamespace
+from app.openstack.flavors import FlavorCatalog
+
+def make_flavor(id, name, vcpus=1, ram=1024):
+    return SimpleNamespace(id=id, name=name, vcpus=vcpus, ram=ram)
+
+def test_flavor_catalog_loads_once():
+    """Lookups by id and name are served from a single listing"""
+    calls = []
+    def loader():
+        calls.append(1)
+        return [make_flavor("1", "S.4", 4, 8192), make_flavor("2", "M.8", 8, 16384)]
+
+    catalog = FlavorCatalog(loader)
+    assert catalog.get("1").vcpus == 4
+    assert catalog.get("M.8").ram == 16384
+    assert catalog.get("S.4").id == "1"
+    assert len(calls) == 1
+
+def test_flavor_catalog_unknown_flavor():
+    """Unknown flavors raise after one reload attempt"""
+    catalog = FlavorCatalog(lambda: [make_flavor("1", "S.4")])
+    with pytest.raises(Exception, match="Flavor L.16 not found"):
+        catalog.get("L.16")
+
+def test_flavor_catalog_expires():
+    """An expired catalog is reloaded on the next lookup"""
+    flavors = [make_flavor("1", "S.4")]
+    catalog = FlavorCatalog(lambda: list(flavors), ttl=0)
+    catalog.get("S.4")
+    flavors.append(make_flavor("2", "M.8"))
+    assert catalog.get("M.8").id == "2"
+
+def test_expand_names():
+    """{n} is replaced by each index and appended when the pattern lacks it"""
+    from app.openstack.bulk import expand_names, multi_create_prefix
+    assert expand_names("ci-{n}", 3) == ["ci-1", "ci-2", "ci-3"]
+    assert expand_names("data", 2) == ["data-1", "data-2"]
+    assert multi_create_prefix(["ci-1", "ci-2", "ci-3"]) == "ci"
+    assert multi_create_prefix(["ci-2", "ci-3"]) is None
+    with pytest.raises(ValueError):
+        expand_names("ci-{n}", 0)
+
+def test_run_batch_retries_and_skips_existing():
+    """Existing names are not recreated, transient failures are retried and the rest reported"""
+    from app.openstack.bulk import run_batch, summarize
+    attempts = {}
+    def create_one(name):
+        attempts[name] = attempts.get(name, 0) + 1
+        if name == "vm-3" or (name == "vm-2" and attempts[name] == 1):
+            raise Exception("quota exceeded")
+        return f"id-{name}"
+
+    result = summarize(run_batch(["vm-1", "vm-2", "vm-3", "vm-4"], create_one,
+                                 existing={"vm-4": "id-old"}, retries=1, backoff=0))
+    assert [item["status"] for item in result["items"]] == ["created", "created", "failed", "exists"]
+    assert result["items"][1]["id"] == "id-vm-2"
+    assert result["failed"] == ["vm-3"]
+    assert (result["created"], result["existing"], result["failed_count"]) == (2, 1, 1)
+    assert attempts == {"vm-1": 1, "vm-2": 2, "vm-3": 2}
+
+def test_name_index_applies_changes_since():
+    """After one full listing, refreshes apply only changed and deleted resources"""
+    from app.openstack.inventory import NameIndex
+    servers = {"1": "web", "2": "db"}
+    calls = []
+    def list_all():
+        calls.append("full")
+        return list(servers.items())
+    def list_changed(since):
+        calls.append("changes")
+        return [("3", "cache", False), ("2", "db", True)]
+
+    index = NameIndex("server", list_all, list_changed, ttl=60)
+    assert index.get_id("web") == "1"
+    assert index.get_id("db") == "2"
+    assert calls == ["full"]
+
+    index.refresh()
+    assert calls == ["full", "changes"]
+    assert index.get_id("cache") == "3"
+    with pytest.raises(Exception, match="No server named db"):
+        index.get_id("db")
+
+def test_name_index_tracks_own_mutations_and_stale_ids():
+    """Creates and deletes update the index; an id that vanished is resolved again"""
+    from app.openstack.inventory import NameIndex
+    listing = [("1", "web")]
+    index = NameIndex("server", lambda: list(listing), ttl=60)
+    assert index.get_id("web") == "1"
+    index.add("2", "api")
+    assert index.get_id("api") == "2"
+    index.add("4", "api")
+    with pytest.raises(Exception, match="Multiple servers named api"):
+        index.get_id("api")
+    index.remove("4")
+    assert index.get_id("api") == "2"
+
+    class NotFound(Exception):
+        pass
+    def get(server_id):
+        if server_id == "1":
+            raise NotFound()
+        return server_id
+    # web was deleted and recreated elsewhere as id 5
+    listing[:] = [("5", "web")]
+    assert index.call("web", get, NotFound) == "5"
+
+def test_name_index_loads_once_for_concurrent_lookups():
+    """Lookups that wait for a cold index share the one reload already running"""
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from app.openstack.inventory import NameIndex
+    calls = []
+    def list_all():
+        calls.append(threading.current_thread())
+        time.sleep(0.05)
+        return [("1", "web")]
+
+    index = NameIndex("server", list_all, ttl=60)
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        assert list(pool.map(lambda _: index.get_id("web"), range(10))) == ["1"] * 10
+    assert len(calls) == 1
+
+def make_image(id, name, os_distro="", os_version="", tags=(), created_at="2026-01-01T00:00:00Z"):
+    from app.openstack.images import from_glance
+    return from_glance({"id": id, "name": name, "os_distro": os_distro, "os_version": os_version,
+                        "tags": list(tags), "created_at": created_at})
+
+def test_image_catalog_policy_and_lookups():
+    """The policy picks the newest matching image; lookups go by id, name, OS or tag"""
+    from app.openstack.images import ImageCatalog
+    images = [
+        make_image("a", "cirros", "cirros"),
+        make_image("b", "Ubuntu-22.04", "ubuntu", "22.04", created_at="2025-01-01T00:00:00Z"),
+        make_image("c", "ubuntu-24.04", "ubuntu", "24.04", created_at="2026-01-01T00:00:00Z"),
+        make_image("d", "golden", tags=["gpu"]),
+    ]
+    catalog = ImageCatalog(lambda etag: (images, "v1"), policy="tag:default,os:ubuntu")
+    assert catalog.default().id == "c"
+    assert catalog.get("a").name == "cirros"
+    assert catalog.get("ubuntu-22.04").id == "b"
+    assert catalog.get("ubuntu").id == "c"
+    assert catalog.get("gpu").id == "d"
+    with pytest.raises(Exception, match="Image windows not found"):
+        catalog.get("windows")
+
+def test_image_catalog_conditional_refresh():
+    """An expired catalog revalidates with its ETag and keeps its images on 304"""
+    from app.openstack.images import ImageCatalog
+    etags = []
+    def fetch(etag):
+        etags.append(etag)
+        return ([make_image("a", "cirros")], "v1") if etag is None else (None, etag)
+
+    catalog = ImageCatalog(fetch, ttl=0)
+    catalog.refresh()
+    catalog.refresh()
+    assert etags == [None, "v1"]
+    assert catalog.default().id == "a"
+
+def test_cidr_allocator_skips_used_prefixes():
+    """Allocation returns the lowest free block, skipping seeded, smaller and larger subnets"""
+    from app.openstack.cidr import CidrAllocator
+    allocator = CidrAllocator("10.0.0.0/22", 24)
+    allocator.reset(["10.0.0.0/24", "10.0.1.128/25", "192.168.1.0/24"])
+    assert allocator.allocate() == "10.0.2.0/24"
+    allocator.mark_used("10.0.3.0/24")
+    with pytest.raises(Exception, match="No free /24"):
+        allocator.allocate()
+
+    allocator.release("10.0.1.128/25")
+    assert allocator.free_count == 1
+    assert allocator.allocate() == "10.0.1.0/24"
+
+def test_cidr_allocator_releases_only_the_subnet_deleted():
+    """A block two smaller subnets share stays used until both are released"""
+    from app.openstack.cidr import CidrAllocator
+    allocator = CidrAllocator("10.0.0.0/23", 24)
+    allocator.reset(["10.0.0.0/25", "10.0.0.128/25", "10.0.1.0/24"])
+    allocator.release("10.0.0.0/25")
+    assert allocator.free_count == 0
+    allocator.release("10.0.0.128/25")
+    assert allocator.allocate() == "10.0.0.0/24"
+
+def test_cidr_allocator_keeps_pending_across_reseed():
+    """A reseed from a listing that predates our allocation does not hand it out again"""
+    from app.openstack.cidr import CidrAllocator
+    allocator = CidrAllocator("10.0.0.0/16", 24)
+    first = allocator.allocate()
+    allocator.reset([])
+    assert allocator.allocate() != first
+    allocator.confirm(first)
+    allocator.reset([])
+    assert allocator.allocate() == first
+
+def test_plan_runs_independent_steps_concurrently():
+    """Wall-clock time follows the critical path, and each step starts after its dependencies"""
+    import time
+    from app.openstack import plans
+    steps = [
+        {"id": "a", "operation": "x", "depends_on": []},
+        {"id": "b", "operation": "x", "depends_on": []},
+        {"id": "c", "operation": "x", "depends_on": ["a", "b"]},
+    ]
+    began = time.monotonic()
+    states = plans.execute(steps, lambda step: time.sleep(0.2) or step["id"])
+    assert time.monotonic() - began < 0.55
+    assert [s["status"] for s in states] == ["succeeded"] * 3
+    assert states[2]["started"] >= max(states[0]["finished"], states[1]["finished"])
+
+def test_plan_steps_keep_the_callers_context():
+    """Steps see the request id of the job that runs the plan"""
+    from app import tracing
+    from app.openstack import plans
+    steps = [{"id": "a", "operation": "x", "depends_on": []}, {"id": "b", "operation": "x", "depends_on": ["a"]}]
+    token = tracing.request_id.set("req-42")
+    try:
+        states = plans.execute(steps, lambda step: tracing.request_id.get())
+    finally:
+        tracing.request_id.reset(token)
+    assert [s["message"] for s in states] == ["req-42", "req-42"]
+
+def test_plan_skips_dependents_of_failed_steps():
+    """A failure skips everything downstream but not independent steps"""
+    from app.openstack import plans
+    def run(step):
+        if step["id"] == "a":
+            raise Exception("boom")
+        return "ok"
+    steps = [
+        {"id": "a", "operation": "x", "depends_on": []},
+        {"id": "b", "operation": "x", "depends_on": ["a"]},
+        {"id": "c", "operation": "x", "depends_on": ["b"]},
+        {"id": "d", "operation": "x", "depends_on": []},
+    ]
+    states = plans.execute(steps, run)
+    assert [s["status"] for s in states] == ["failed", "skipped", "skipped", "succeeded"]
+    assert states[0]["message"] == "boom"
+
+def test_plan_rejects_cycles_and_unknown_steps():
+    """Plans must be DAGs over their own step ids"""
+    from app.openstack import plans
+    with pytest.raises(ValueError, match="cycle"):
+        plans.validate([{"id": "a", "depends_on": ["b"]}, {"id": "b", "depends_on": ["a"]}])
+    with pytest.raises(ValueError, match="unknown"):
+        plans.validate([{"id": "a", "depends_on": ["z"]}])
+
+
+def call_fake(url, method="GET", body=None):
+    import json
+    import urllib.error
+    import urllib.request
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"null")
+
+def test_fake_cloud_keeps_resource_state():
+    """Servers build, show up in listings and changes-since reports their deletion"""
+    import time
+    from tests.fake_openstack import FakeCloud
+    with FakeCloud(build_seconds=0.05) as cloud:
+        status, body = call_fake(cloud.url + "/identity/v3/auth/tokens", "POST", {"auth": {}})
+        assert status == 201 and {"compute", "volumev3", "network", "image"} <= {
+            entry["type"] for entry in body["token"]["catalog"]}
+
+        compute = cloud.url + "/compute/v2.1"
+        status, body = call_fake(compute + "/servers", "POST", {"server": {
+            "name": "ci", "flavorRef": "2", "imageRef": "img-ubuntu-2204", "min_count": 1, "max_count": 2}})
+        assert status == 202
+        server_id = body["server"]["id"]
+        assert [s["name"] for s in call_fake(compute + "/servers")[1]["servers"]] == ["ci-1", "ci-2"]
+        assert call_fake(f"{compute}/servers/{server_id}")[1]["server"]["status"] == "BUILD"
+        time.sleep(0.06)
+        assert call_fake(f"{compute}/servers/{server_id}")[1]["server"]["status"] == "ACTIVE"
+
+        assert call_fake(f"{compute}/servers/{server_id}", "DELETE")[0] == 204
+        assert call_fake(f"{compute}/servers/{server_id}")[0] == 404
+        changed = call_fake(compute + "/servers/detail?changes-since=2000-01-01T00:00:00Z")[1]["servers"]
+        assert {s["id"]: s["status"] for s in changed}[server_id] == "DELETED"
+
+def test_fake_cloud_injects_errors_reproducibly():
+    """The same seed fails the same requests"""
+    from tests.fake_openstack import FakeCloud
+    runs = []
+    for _ in range(2):
+        with FakeCloud(error_rate=0.5, seed=7) as cloud:
+            runs.append([call_fake(cloud.url + "/compute/v2.1/flavors/detail")[0] for _ in range(20)])
+    assert runs[0] == runs[1]
+    assert set(runs[0]) == {200, 503}
+
+def test_token_refresh_uses_session_api():
+    """The refresher renews through the session only when the token is about to expire"""
+    import datetime
+    from keystoneauth1 import access, session
+    from keystoneauth1.identity import v3
+    from app.openstack.auth import TOKEN_REFRESH_MARGIN, _refresh_token
+
+    class Plugin(v3.Token):
+        fetches = 0
+        lifetime = datetime.timedelta(hours=1)
+        def get_auth_ref(self, session, **kwargs):
+            self.fetches += 1
+            expires = datetime.datetime.now(datetime.timezone.utc) + self.lifetime
+            body = {"token": {"expires_at": expires.strftime("%Y-%m-%dT%H:%M:%S.000000Z"), "methods": ["token"]}}
+            return access.create(body=body, auth_token=f"token-{self.fetches}")
+
+    plugin = Plugin("http://keystone.test/v3", "initial")
+    sess = session.Session(auth=plugin)
+    assert _refresh_token(sess) and sess.get_token() == "token-1"
+    assert not _refresh_token(sess) and plugin.fetches == 1
+    plugin.lifetime = datetime.timedelta(seconds=TOKEN_REFRESH_MARGIN / 2)
+    plugin.auth_ref = plugin.get_auth_ref(sess)
+    assert _refresh_token(sess) and sess.get_token() == "token-3"
+
+@pytest.fixture
+def fake_cloud(monkeypatch):
+    """Point the real OpenStack clients at a local fake cloud"""
+    from app.openstack import auth, nova
+    from tests.fake_openstack import FakeCloud
+    with FakeCloud() as cloud:
+        for name, value in cloud.env().items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.delenv("OS_AUTH_TOKEN", raising=False)
+        auth.reset()
+        yield cloud
+    nova.flavor_catalog.invalidate()
+    auth.reset()
+
+def test_flavor_catalog_through_novaclient(fake_cloud):
+    """The shared catalog's loader is a valid novaclient call"""
+    from app.openstack import nova
+    nova.flavor_catalog.refresh(force=True)
+    assert nova.get_flavor("S.4").vcpus == 2
+
+def test_iter_pages_past_a_server_side_cap():
+    """Pages shorter than the requested size do not end the listing; an empty one does"""
+    from app.openstack.usage import iter_pages
+    items = [SimpleNamespace(id=str(i)) for i in range(7)]
+    calls = []
+    def list_fn(limit, marker):
+        calls.append(marker)
+        start = 0 if marker is None else int(marker) + 1
+        return items[start:start + min(limit, 3)]
+    assert [len(page) for page in iter_pages(list_fn, page_size=5)] == [3, 3, 1]
+    assert calls == [None, "2", "5", "6"]
+
+def test_iter_pages_stops_when_the_marker_is_ignored():
+    """A server that ignores the marker is read once, not forever"""
+    from app.openstack.usage import iter_pages
+    page = [SimpleNamespace(id="a"), SimpleNamespace(id="b")]
+    assert list(iter_pages(lambda limit, marker: page, page_size=2)) == [page]
+
+def test_usage_reports_quotas(fake_cloud):
+    """Usage counts listings across pages and adds each service's quota limits"""
+    import asyncio
+    from app.openstack import usage
+    from app.openstack.nova import get_nova_client
+    fake_cloud.quotas["compute"]["cores"] = 32
+    for name in ("a", "b", "c"):
+        get_nova_client().servers.create(name, "img-ubuntu-2204", "2")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(usage, "PAGE_SIZE", 2)
+        result = asyncio.run(usage.get_usage())
+    assert (result["vm_count"], result["vcpus_used"]) == (3, 6)
+    assert result["quotas"] == {"vcpus": 32, "ram_mb": 51200, "vms": 10, "volumes_gb": 1000, "volumes": 10,
+                                "networks": 100, "ports": 500, "floating_ips": 50}
+
+def test_create_network_rolls_back_when_the_router_interface_fails(fake_cloud, monkeypatch):
+    """A router interface that cannot be added deletes the network and subnet and frees the CIDR"""
+    import asyncio
+    from app.openstack import networks
+    monkeypatch.setattr(networks, "ROUTER_ID", "missing-router")
+    free = networks.allocator.free_count
+    with pytest.raises(Exception):
+        asyncio.run(networks.create_network("doomed"))
+    assert fake_cloud.networks == {} and fake_cloud.subnets == {}
+    assert networks.allocator.free_count == free
+
+def test_create_network_rolls_back_when_seed_or_allocation_fails(fake_cloud, monkeypatch):
+    """A network whose allocator seed or CIDR allocation fails is deleted again"""
+    import asyncio
+    from app.openstack import networks
+    def fail(*args, **kwargs):
+        raise RuntimeError("no subnets for you")
+    for target in ("seed_allocator", "allocator.allocate"):
+        with pytest.MonkeyPatch.context() as mp:
+            if target == "seed_allocator":
+                mp.setattr(networks, "seed_allocator", fail)
+            else:
+                mp.setattr(networks.allocator, "allocate", fail)
+            with pytest.raises(RuntimeError, match="no subnets"):
+                asyncio.run(networks.create_network("doomed"))
+        assert fake_cloud.networks == {}
+
+@pytest.fixture
+def bulk_cloud(fake_cloud, monkeypatch):
+    """The fake cloud with fresh name indexes and no waiting between bulk retries"""
+    import functools
+    from app.openstack import bulk, cinder, nova
+    monkeypatch.setattr(bulk, "run_batch", functools.partial(bulk.run_batch, backoff=0.01))
+    nova.servers_index.refresh(full=True)
+    cinder.volumes_index.refresh(full=True)
+    return fake_cloud
+
+def test_create_vms_uses_one_multi_create_request(bulk_cloud):
+    """Names p-1 .. p-N are created by a single Nova request"""
+    from app.openstack import nova
+    result = nova.create_vms(["web-1", "web-2", "web-3"], "S.4")
+    assert (result["created"], result["failed"]) == (3, [])
+    assert bulk_cloud.create_requests == ["web"]
+    assert sorted(s["name"] for s in bulk_cloud.servers.values()) == ["web-1", "web-2", "web-3"]
+
+def test_create_vms_resubmits_only_failures(bulk_cloud):
+    """A partly failed batch lists its failures; resubmitting the same names creates only those"""
+    from app.openstack import nova
+    bulk_cloud.fail_creates({"db"})
+    result = nova.create_vms(["api", "db", "cache"], "S.4")
+    assert (result["created"], result["failed_count"], result["failed"]) == (2, 1, ["db"])
+    assert [item["status"] for item in result["items"]] == ["created", "failed", "created"]
+
+    bulk_cloud.fail_creates(())
+    bulk_cloud.create_requests.clear()
+    result = nova.create_vms(["api", "db", "cache"], "S.4")
+    assert (result["created"], result["existing"], result["failed"]) == (1, 2, [])
+    assert bulk_cloud.create_requests == ["db"]
+    assert sorted(s["name"] for s in bulk_cloud.servers.values()) == ["api", "cache", "db"]
+
+def test_create_volumes_finds_a_create_that_failed_late(bulk_cloud):
+    """A volume created by an attempt that then failed is found before the retry, not created twice"""
+    from app.openstack import cinder
+    bulk_cloud.fail_creates({"logs"}, after_create=True)
+    result = cinder.create_volumes(["data", "logs"], 10)
+    assert (result["created"], result["failed"]) == (2, [])
+    assert bulk_cloud.create_requests.count("logs") == 1
+    logs = [v["id"] for v in bulk_cloud.volumes.values() if v["name"] == "logs"]
+    assert logs == [result["items"][1]["id"]]
@@ -0,0 +1,69 @@
+import datetime
+import os
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.models import Base, UserInteraction
+from app.models.retention import Retention, read_archive
+
+NOW = datetime.datetime(2026, 3, 10, 12, 0)
+
+def make_session_factory(tmp_path, days_ago):
+    engine = create_engine(f"sqlite:///{tmp_path / 'retention.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    for i, days in enumerate(days_ago):
+        db.add(UserInteraction(
+            timestamp=NOW - datetime.timedelta(days=days),
+            user_message=f"msg {i}",
+            detected_intent="get_usage",
+            entities={},
+            system_response="ok"
+        ))
+    db.commit()
+    db.close()
+    return Session
+
+def test_old_days_move_to_archives(tmp_path):
+    """Days older than the hot window are archived and removed from the table"""
+    Session = make_session_factory(tmp_path, [40, 40, 35, 1, 0])
+    archive_dir = tmp_path / "archive"
+    retention = Retention(session_factory=Session, archive_dir=str(archive_dir), hot_days=30)
+
+    assert retention.run_once(now=NOW) == 3
+    db = Session()
+    assert [r.user_message for r in db.query(UserInteraction).order_by(UserInteraction.id)] == ["msg 3", "msg 4"]
+    db.close()
+
+    archives = sorted(name for name in os.listdir(archive_dir) if name.endswith(".jsonl.gz"))
+    assert len(archives) == 2
+    rows = list(read_archive(archive_dir / archives[0]))
+    assert [r["user_message"] for r in rows] == ["msg 0", "msg 1"]
+
+def test_rows_without_a_timestamp_do_not_stop_archiving(tmp_path):
+    """A NULL timestamp is not taken as the oldest day"""
+    Session = make_session_factory(tmp_path, [40, 1, 1])
+    db = Session()
+    db.query(UserInteraction).filter(UserInteraction.user_message == "msg 2").update({"timestamp": None})
+    db.commit()
+    db.close()
+    retention = Retention(session_factory=Session, archive_dir=str(tmp_path / "archive"), hot_days=30)
+    assert retention.run_once(now=NOW) == 1
+
+def test_archives_pruned_by_age(tmp_path):
+    """Archives older than archive_days are deleted"""
+    Session = make_session_factory(tmp_path, [400, 40])
+    archive_dir = tmp_path / "archive"
+    retention = Retention(session_factory=Session, archive_dir=str(archive_dir), hot_days=30, archive_days=365)
+
+    retention.run_once(now=NOW)
+    archives = [name for name in os.listdir(archive_dir) if name.endswith(".jsonl.gz")]
+    assert len(archives) == 1 and archives[0].startswith("user_interactions-2026-01-29")
+
+def test_runs_without_fcntl(tmp_path, monkeypatch):
+    """Where fcntl is missing (Windows) a pass runs without the lock"""
+    from app.models import retention as retention_module
+    monkeypatch.setattr(retention_module, "fcntl", None)
+    Session = make_session_factory(tmp_path, [40, 0])
+    retention = Retention(session_factory=Session, archive_dir=str(tmp_path / "archive"), hot_days=30)
+    assert retention.run_once(now=NOW) == 1
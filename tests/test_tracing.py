@@ -0,0 +1,116 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from app import tracing, profiler
+
+def run_request(app, headers=()):
+    """Send one POST /api/chat through TracingMiddleware; returns the response start message"""
+    messages = []
+    async def receive():
+        return {"type": "http.request", "body": b""}
+    async def send(message):
+        messages.append(message)
+    scope = {"type": "http", "method": "POST", "path": "/api/chat", "headers": list(headers)}
+    asyncio.run(tracing.TracingMiddleware(app, sample_rate=1.0)(scope, receive, send))
+    return messages[0]
+
+async def respond(send, status=200):
+    await send({"type": "http.response.start", "status": status, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+def test_spans_nest_and_follow_threads(tmp_path, monkeypatch):
+    """Child spans share the root's trace id, including spans recorded on a copied context in another thread"""
+    exporter = tracing.SpanExporter(str(tmp_path / "spans.jsonl"))
+    monkeypatch.setattr(tracing, "exporter", exporter)
+
+    async def app(scope, receive, send):
+        with tracing.span("intent.parse", parser="rules"):
+            tracing.annotate(cache="miss")
+        def in_thread():
+            with tracing.span("nova.create_vm"):
+                tracing.record("HTTP POST", time.time_ns() - 1000, time.time_ns(), tracing.CLIENT)
+        with ThreadPoolExecutor(1) as pool:
+            pool.submit(contextvars.copy_context().run, in_thread).result()
+        await respond(send)
+
+    start = run_request(app, [(b"x-request-id", b"req-1")])
+    assert (b"x-request-id", b"req-1") in start["headers"]
+    exporter.flush()
+    spans = {s["name"]: s for s in map(json.loads, (tmp_path / "spans.jsonl").read_text().splitlines())}
+    root = spans["POST /api/chat"]
+    assert root["attributes"]["request.id"] == "req-1"
+    assert root["attributes"]["http.status_code"] == 200
+    assert spans["intent.parse"]["attributes"] == {"parser": "rules", "cache": "miss"}
+    assert spans["intent.parse"]["parent_id"] == root["span_id"]
+    assert spans["HTTP POST"]["parent_id"] == spans["nova.create_vm"]["span_id"]
+    assert {s["trace_id"] for s in spans.values()} == {root["trace_id"]}
+    exporter.close()
+
+def test_traceparent_decides_sampling(tmp_path, monkeypatch):
+    """An unsampled traceparent turns tracing off; a sampled one continues the caller's trace"""
+    exporter = tracing.SpanExporter(str(tmp_path / "spans.jsonl"))
+    monkeypatch.setattr(tracing, "exporter", exporter)
+    seen = []
+    async def app(scope, receive, send):
+        seen.append(tracing.current())
+        await respond(send)
+
+    run_request(app, [(b"traceparent", b"00-" + b"a" * 32 + b"-" + b"b" * 16 + b"-00")])
+    run_request(app, [(b"traceparent", b"00-" + b"a" * 32 + b"-" + b"b" * 16 + b"-01")])
+    assert seen[0] is None
+    assert seen[1].trace_id == "a" * 32 and seen[1].parent_id == "b" * 16
+    assert tracing.parse_traceparent("garbage") is None
+    exporter.close()
+
+def test_no_exporter_means_no_spans(monkeypatch):
+    """Without TRACE_EXPORT nothing is recorded, but requests still get an id"""
+    monkeypatch.setattr(tracing, "exporter", None)
+    seen = []
+    async def app(scope, receive, send):
+        seen.append((tracing.current(), tracing.request_id.get()))
+        with tracing.span("ignored") as span:
+            assert span is None
+        await respond(send)
+
+    start = run_request(app)
+    assert seen[0][0] is None and seen[0][1]
+    assert dict(start["headers"])[b"x-request-id"] == seen[0][1].encode()
+
+def test_otlp_body():
+    """Spans convert to an OTLP/HTTP JSON request with typed attributes and error status"""
+    span = tracing.Span("a" * 32, None, "db SELECT", tracing.CLIENT, {"rows": 3, "db.statement": "SELECT 1"})
+    span.end, span.error = span.start + 10, "boom"
+    body = tracing.to_otlp([span], service_name="test")
+    exported = body["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert body["resourceSpans"][0]["resource"]["attributes"][0]["value"] == {"stringValue": "test"}
+    assert exported["traceId"] == "a" * 32 and exported["parentSpanId"] == ""
+    assert {"key": "rows", "value": {"intValue": "3"}} in exported["attributes"]
+    assert exported["status"] == {"code": 2, "message": "boom"}
+
+def test_profiler_collects_collapsed_stacks_for_n_requests():
+    """The profile stops after N finished requests and reports busy stacks in folded format"""
+    stop = threading.Event()
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+    worker = threading.Thread(target=busy_loop, name="busy")
+    worker.start()
+    sampler = profiler.SamplingProfiler()
+    sampler.start(requests=2, interval=0.001)
+    time.sleep(0.05)
+    sampler.request_done()
+    assert sampler.running
+    sampler.request_done()
+    sampler._thread.join(timeout=5)
+    stop.set()
+    worker.join()
+
+    status = sampler.status()
+    assert not status["running"] and status["remaining"] == 0 and status["samples"] > 0
+    lines = sampler.collapsed().splitlines()
+    assert any(line.startswith("busy;") and "busy_loop (tests/test_tracing.py:" in line for line in lines)
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) >= 1